@@ -0,0 +1,342 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+  keyboard_*.pyの全てのキーボードをシミュレートしたハードウェアで動かして計測する
+
+  python -m benchmarks.run                     計測して表示
+  python -m benchmarks.run --save              計測結果をベースラインとして保存
+  python -m benchmarks.run --compare           ベースラインと比べて、閾値を超えて悪化した項目を報告
+  python -m benchmarks.run --switch-table      スキャナにSwitchTableを使わせて計測
+"""
+import argparse
+import glob
+import importlib
+import inspect
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from contextlib import redirect_stdout
+from time import perf_counter_ns
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from board import SCL, SDA  # noqa: E402
+from makbe.key_event import KeyPressed, KeyReleased  # noqa: E402
+from makbe_host.harness import SimulatedKeyboard, _NullWriter  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "baseline.json")
+
+# 値が大きいほど良い項目の接尾辞（それ以外は小さいほど良い）
+HIGHER_IS_BETTER = ("_per_sec",)
+
+# 計測誤差として無視する差（項目名に含まれる文字列: 差の絶対値）
+NOISE_FLOOR = (("_us", 0.5), ("_bytes", 64))
+
+
+def find_keyboards(pattern: str = "keyboard_*.py") -> list:
+    """
+    :return: (モジュール名, キーボードクラス) のリスト
+    """
+    result = []
+    for path in sorted(glob.glob(os.path.join(ROOT, pattern))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            module = importlib.import_module(name)
+        except Exception as e:
+            result.append((name, e))
+            continue
+        classes = [
+            obj for key, obj in vars(module).items()
+            if inspect.isclass(obj) and obj.__module__ == name and key not in ("KC", "Layer", "Switches")
+        ]
+        result.append((name, classes[0] if classes else LookupError("no keyboard class")))
+    return result
+
+
+def build(cls) -> SimulatedKeyboard:
+    """キーボードのコンストラクタの必須引数にはSCL、SDAを順に渡す
+    """
+    required = [
+        p for p in inspect.signature(cls).parameters.values()
+        if p.default is inspect.Parameter.empty and p.kind == p.POSITIONAL_OR_KEYWORD
+    ]
+    return SimulatedKeyboard(cls, *(SCL, SDA)[:len(required)])
+
+
+def wired_switches(sim: SimulatedKeyboard) -> list:
+    """
+    :return: 配線されているSwitchesの属性名のリスト
+    """
+    names = []
+    for name, switch in vars(sim.keyboard.sw).items():
+        if id(switch) in sim.locations:
+            names.append(name)
+    return names
+
+
+def run_cycles(sim: SimulatedKeyboard, cycles: int, stages: dict, script=None):
+    """サイクルを回して、ステージごとの時間を積算する
+    :param script: サイクル番号を受け取って、スイッチを操作する関数
+    """
+    scanner = sim.scanner
+    clock = sim.clock
+    sender_update = getattr(sim.keyboard, "update", None)
+    sender = getattr(sim.keyboard, "sender", None)
+    for i in range(cycles):
+        if script is not None:
+            script(i)
+        clock.advance_ms(1)
+        t0 = perf_counter_ns()
+        scanner.scan()
+        t1 = perf_counter_ns()
+        scanner.process_events()
+        t2 = perf_counter_ns()
+        if sender_update is not None and sender is not None:
+            sender.update()
+        t3 = perf_counter_ns()
+        stages["scan"] += t1 - t0
+        stages["process"] += t2 - t1
+        stages["sender"] += t3 - t2
+
+
+def typing_script(sim: SimulatedKeyboard, names: list, hold: int = 8, gap: int = 8):
+    """全てのスイッチを順にタップするスクリプト
+    """
+    period = hold + gap
+
+    def script(i: int):
+        k = i // period
+        if k >= len(names):
+            return
+        phase = i % period
+        if phase == 0:
+            sim.press(names[k])
+        elif phase == hold:
+            sim.release(names[k])
+
+    return script, len(names) * period
+
+
+def bench_cycles(sim: SimulatedKeyboard, cycles: int, script=None) -> dict:
+    stages = {"scan": 0, "process": 0, "sender": 0}
+    before = len(sim.output)
+    start = perf_counter_ns()
+    run_cycles(sim, cycles, stages, script)
+    elapsed = perf_counter_ns() - start
+    result = {
+        "cycles_per_sec": cycles * 1e9 / elapsed,
+        "scan_us": stages["scan"] / cycles / 1000,
+        "process_us": stages["process"] / cycles / 1000,
+        "sender_us": stages["sender"] / cycles / 1000,
+    }
+    reports = len(sim.output) - before
+    if reports > 0:
+        result["reports_per_sec"] = reports * 1e9 / elapsed
+    return result
+
+
+def bench_allocations(sim: SimulatedKeyboard, cycles: int, script=None) -> dict:
+    """tracemallocで1サイクルあたりの確保量を計る
+    """
+    clock = sim.clock
+    scanner = sim.scanner
+    total = 0
+    worst = 0
+    tracemalloc.start()
+    try:
+        for i in range(cycles):
+            if script is not None:
+                script(i)
+            clock.advance_ms(1)
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            scanner.update()
+            _, peak = tracemalloc.get_traced_memory()
+            used = peak - current
+            total += used
+            worst = max(worst, used)
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_bytes_per_cycle": total / cycles,
+        "alloc_bytes_worst_cycle": worst,
+    }
+
+
+def bench_processor(sim: SimulatedKeyboard, names: list, rounds: int) -> dict:
+    """プロセッサにイベントを直接渡して、put()にかかる時間を計る
+    """
+    processor = sim.scanner.processor
+    switches = [sim.switch(name) for name in names]
+    events = []
+    for switch in switches:
+        events.append(KeyPressed(switch))
+        events.append(KeyReleased(switch))
+    now = sim.clock.now_ms
+    elapsed = 0
+    count = 0
+    for _ in range(rounds):
+        for event in events:
+            now += 1
+            t0 = perf_counter_ns()
+            processor.put(event, now)
+            elapsed += perf_counter_ns() - t0
+            processor.tick(now)
+            count += 1
+    return {
+        "put_us": elapsed / count / 1000,
+        "put_events_per_sec": count * 1e9 / elapsed,
+    }
+
+
+def best_of(results: list) -> dict:
+    """繰り返し計測した結果から、項目ごとに最も良い値を選ぶ
+    """
+    merged = dict(results[0])
+    for result in results[1:]:
+        for key, value in result.items():
+            if key.endswith(HIGHER_IS_BETTER):
+                merged[key] = max(merged[key], value)
+            else:
+                merged[key] = min(merged[key], value)
+    return merged
+
+
+def bench_keyboard(cls, cycles: int, repeat: int = 3, switch_table: bool = False) -> dict:
+    sim = build(cls)
+    if switch_table:
+        sim.scanner.build_switch_table()
+    names = wired_switches(sim)
+    result = {"switches": len(names)}
+    with redirect_stdout(_NullWriter()):
+        runs = [bench_cycles(sim, cycles) for _ in range(repeat)]
+        for key, value in best_of(runs).items():
+            result["idle_" + key] = value
+        runs = []
+        for _ in range(repeat):
+            script, length = typing_script(sim, names)
+            runs.append(bench_cycles(sim, length, script))
+        for key, value in best_of(runs).items():
+            result["typing_" + key] = value
+        for key, value in bench_allocations(sim, min(cycles, 500)).items():
+            result["idle_" + key] = value
+        script, length = typing_script(sim, names)
+        for key, value in bench_allocations(sim, length, script).items():
+            result["typing_" + key] = value
+        runs = [bench_processor(sim, names, max(1, cycles // 1000)) for _ in range(repeat)]
+        result.update(best_of(runs))
+    return result
+
+
+def run(cycles: int, only=None, repeat: int = 3, switch_table: bool = False) -> dict:
+    results = {}
+    for name, cls in find_keyboards():
+        if only and name not in only:
+            continue
+        if isinstance(cls, Exception):
+            results[name] = {"error": "%s: %s" % (type(cls).__name__, cls)}
+            continue
+        try:
+            results[name] = bench_keyboard(cls, cycles, repeat, switch_table)
+        except Exception as e:
+            results[name] = {"error": "%s: %s" % (type(e).__name__, e)}
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cycles": cycles,
+        "switch_table": switch_table,
+        "keyboards": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    :return: 閾値を超えて悪化した (キーボード, 項目, ベースライン, 今回) のリスト
+    """
+    regressions = []
+    for name, metrics in current["keyboards"].items():
+        base = baseline.get("keyboards", {}).get(name)
+        if base is None or "error" in metrics or "error" in base:
+            continue
+        for key, value in metrics.items():
+            old = base.get(key)
+            if not isinstance(old, (int, float)) or old == 0 or key == "switches":
+                continue
+            if any(tag in key and abs(value - old) < floor for tag, floor in NOISE_FLOOR):
+                continue
+            if key.endswith(HIGHER_IS_BETTER):
+                worse = value < old * (1.0 - threshold)
+            else:
+                worse = value > old * (1.0 + threshold)
+            if worse:
+                regressions.append((name, key, old, value))
+    return regressions
+
+
+def print_results(results: dict):
+    for name, metrics in results["keyboards"].items():
+        print(name)
+        if "error" in metrics:
+            print("  error: %s" % metrics["error"])
+            continue
+        for key, value in metrics.items():
+            print("  %-32s %12.2f" % (key, value))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="makbe benchmarks")
+    parser.add_argument("--cycles", type=int, default=5000, help="idle cycles per keyboard")
+    parser.add_argument("--repeat", type=int, default=3, help="repeat each measurement and keep the best")
+    parser.add_argument("--only", nargs="*", help="keyboard module names to run")
+    parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, help="save results as a baseline")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, help="compare with a baseline")
+    parser.add_argument("--threshold", type=float, default=0.20, help="regression threshold (0.20 = 20%%)")
+    parser.add_argument("--switch-table", action="store_true", help="run the scanners on a SwitchTable")
+    args = parser.parse_args(argv)
+
+    results = run(args.cycles, args.only, args.repeat, args.switch_table)
+    print_results(results)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("saved: %s" % args.save)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, key, old, new in regressions:
+            print("REGRESSION %s %s: %.2f -> %.2f" % (name, key, old, new))
+        if regressions:
+            return 1
+        print("no regressions over %.0f%%" % (args.threshold * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,6 +25,20 @@
 """
 D2 = 0
 D3 = 0
+D4 = 0
+D5 = 0
+D6 = 0
+D7 = 0
+D8 = 0
+D9 = 0
+D20 = 0
+D21 = 0
+D22 = 0
+D23 = 0
+D26 = 0
+D27 = 0
+D28 = 0
+D29 = 0
 GP4 = 0
 GP5 = 0
 SCL = 0
@@ -33,3 +33,21 @@ class I2C:
 
     def try_lock(self) -> bool:
         return True
+
+
+class UART:
+
+    def __init__(self, tx, rx, baudrate: int = 9600, timeout: float = 1, receiver_buffer_size: int = 64):
+        self.tx = tx
+        self.rx = rx
+        self.baudrate = baudrate
+        self.in_waiting = 0
+
+    def read(self, nbytes=None):
+        return None
+
+    def readinto(self, buf):
+        return None
+
+    def write(self, buf) -> int:
+        return len(buf)
@@ -20,6 +20,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from makbe.boot import start_boot_timer, boot_mark, finish_boot_timer
+start_boot_timer()
+
 import board
 
 #from keyboard_column7ansi import Column7ansi
@@ -28,14 +31,17 @@ import board
 #from keyboard_column17ansi import Column17ansi
 from keyboard_helix_pico_right import HelixPicoRight
 from time import sleep
+boot_mark("import")
 
 sleep(0.5)
+boot_mark("startup wait")
 print("start!")
 
 # キーボードを生成する
 # keyboard = Column7ansi()
 keyboard = HelixPicoRight()
 # keyboard = Column17ansi()
+boot_mark("keyboard")
 print("started")
 
 
@@ -43,6 +49,11 @@ print("started")
 # ex)
 #   keyboard.sw.esc.append_action(k(KeyCode.GRAVE))
 
+# 最初のスキャンまでの時間を表示する
+keyboard.scanner.update()
+boot_mark("first scan")
+finish_boot_timer()
+
 # 無限ループでスキャンする
 # メインループ
 while True:
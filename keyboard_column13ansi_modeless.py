@@ -183,4 +183,4 @@ class Column13ansi:
         proc = LayeredProcessor(Sender(kbd))
 
         # スキャナの生成
-        self.scanner = I2CScanner(self.expanders, i2c, proc)
+        self.scanner = I2CScanner(self.expanders, i2c, proc, direct=True)
@@ -23,10 +23,11 @@
 from board import SCL, SDA
 from busio import I2C
 from makbe.ble_sender import BleSender
+from makbe.ble_profiles import BleProfiles
 
 from makbe.i2c_scanner import I2CScanner
 from makbe.key_switch import KeySwitch
-from makbe import kc, TCA9555, mc, mt, KeyCode, lt, trans
+from makbe import kc, TCA9555, mc, mt, KeyCode, lt, trans, bt, bt_clear
 from makbe.layered_processor import LayeredProcessor
 
 
@@ -205,29 +206,31 @@ class Switches:
             trans(),
             trans()
         ])
+        # FUNCSレイヤのZ、X、Cで接続先のホストを切り替える
         self.kb_z = KeySwitch([
             kc(KC.KB_Z),
             mc(KC.L_GUI, KC.KB_Z),
             trans(),
-            trans()
+            bt(0)
         ])
         self.kb_x = KeySwitch([
             kc(KC.KB_X),
             mc(KC.L_GUI, KC.KB_X),
             trans(),
-            trans()
+            bt(1)
         ])
         self.kb_c = KeySwitch([
             kc(KC.KB_C),
             mc(KC.L_GUI, KC.KB_C),
             trans(),
-            trans()
+            bt(2)
         ])
+        # FUNCSレイヤのVで、選択中のホストとのペアリングをやり直す
         self.kb_v = KeySwitch([
             kc(KC.KB_V),
             mc(KC.L_GUI, KC.KB_V),
             trans(),
-            trans()
+            bt_clear()
         ])
         self.kb_b = KeySwitch([
             kc(KC.KB_B),
@@ -450,10 +453,15 @@ class Column13ansiWideBLE:
             pass
 
         # プロセッサの生成
+        # pairing_modeでは選択中のプロファイルだけペアリングをやり直し、clear_bondsでは全てのボンディングを消す
+        profiles = BleProfiles(3)
+        if pairing_mode:
+            profiles.forget(profiles.selected)
         sender = BleSender(
             name="Makbe Column13 Wide",
-            clear_bonds=clear_bonds or pairing_mode,
+            clear_bonds=clear_bonds,
             wait_for_connection=wait_for_connection,
+            profiles=profiles,
         )
         proc = LayeredProcessor(sender)
         self.sender = sender
@@ -462,9 +470,13 @@ class Column13ansiWideBLE:
         self.scanner = I2CScanner(self.expanders, i2c, proc)
 
     def start_pairing(self, clear_bonds: bool = False):
+        """
+        :param clear_bonds: Trueなら、選択中のプロファイルだけペアリングをやり直す
+        """
         if clear_bonds:
-            self.sender.clear_bonds()
-        self.sender.start_advertising()
+            self.sender.forget_profile()
+        else:
+            self.sender.start_advertising()
 
     def update(self):
         self.scanner.update()
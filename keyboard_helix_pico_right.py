@@ -26,7 +26,7 @@ from board import D29, D28, D27, D26, D22, D20, D23, D4, D5, D6, D7
 from adafruit_hid.keyboard import Keyboard
 
 from makbe.key_switch import KeySwitch, nop_switch
-from makbe import kc, TCA9555, mc, mt, KeyCode, lt, trans
+from makbe import kc, mc, mt, KeyCode, lt, trans
 from makbe.layered_processor import LayeredProcessor
 from makbe.matrix_scanner import MatrixScanner
 from makbe.sender import Sender
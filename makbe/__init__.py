@@ -19,9 +19,74 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from .actions import *
-from .io_expander import *
-from .expanders import *
-from .key_code import *
-from .key_switch import *
-from .i2c_scanner import *
+# 使われる名前と、それを定義しているサブモジュール
+# サブモジュールは名前が最初に参照されたときに読み込むので、
+# 例えばGPIOの行列配線だけのキーボードは、I2C関係のコードを読み込まない
+_LAZY = {
+    # actions
+    "Action": "actions",
+    "NoOpAction": "actions",
+    "TransAction": "actions",
+    "SingleKeyCode": "actions",
+    "MultipleKeyCodes": "actions",
+    "LayerAction": "actions",
+    "HoldTapAction": "actions",
+    "NOP": "actions",
+    "TRANS": "actions",
+    "kc": "actions",
+    "mc": "actions",
+    "mc_tuple": "actions",
+    "la": "actions",
+    "ht": "actions",
+    "lt": "actions",
+    "mt": "actions",
+    "trans": "actions",
+    "nop": "actions",
+    "cached_actions": "actions",
+    "SenderAction": "actions",
+    "cmd": "actions",
+    "bt": "actions",
+    "bt_clear": "actions",
+    "out": "actions",
+    "out_all": "actions",
+    "out_auto": "actions",
+    # key_code
+    "KeyCode": "key_code",
+    # key_event
+    "KeyEvent": "key_event",
+    "KeyPressed": "key_event",
+    "KeyReleased": "key_event",
+    # key_switch
+    "Debouncer": "key_switch",
+    "KeySwitch": "key_switch",
+    "NopSwitch": "key_switch",
+    "EMPTY_SWITCH": "key_switch",
+    "nop_switch": "key_switch",
+    # スキャナとプロセッサ
+    "Scanner": "scanner",
+    "Processor": "processor",
+    "EventQueue": "event_queue",
+    "ticks_diff": "clock",
+    "STAGE_READ": "latency",
+    # I/Oエクスパンダ
+    "IoExpander": "io_expander",
+    "I2CScanner": "i2c_scanner",
+    "TCA9554": "expanders.tca9554",
+    "TCA9555": "expanders.tca9555",
+    "PCA9536": "expanders.pca9536",
+    "PeerMcu": "expanders.peer_mcu",
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module 'makbe' has no attribute '%s'" % name)
+    value = getattr(__import__("makbe." + module, None, None, [name]), name)
+    # 2回目からは通常の属性として参照される
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY.keys()))
@@ -23,13 +23,19 @@
 class Action:
     """ キーアクションの基底クラス
     実際のアクションはこのクラスを継承したクラスです。
+    kc()などのヘルパー関数が返すアクションは、同じ内容なら同じインスタンスが共有されるので、
+    生成後に属性を書き換えてはいけません。
     """
 
+    __slots__ = ()
+
 
 class NoOpAction(Action):
     """ なにもしないアクション
     """
 
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -38,6 +44,8 @@ class TransAction(Action):
     """ デフォルトレイヤのアクションを踏襲する
     """
 
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -46,6 +54,8 @@ class SingleKeyCode(Action):
     """ 1つ分のキーコードを割り当てられたアクション
     """
 
+    __slots__ = ("key_code",)
+
     def __init__(self, key_code: int):
         """
         :param key_code: 割り当てるキーコード
@@ -57,17 +67,21 @@ class MultipleKeyCodes(Action):
     """ 複数のキーコードを割り当てられたアクション
     """
 
+    __slots__ = ("key_codes",)
+
     def __init__(self, key_codes: [int]):
         """
-        :param key_codes: 割り当てるキーコードのリスト
+        :param key_codes: 割り当てるキーコードのリスト（タプルとして保持する）
         """
-        self.key_codes = key_codes
+        self.key_codes = tuple(key_codes)
 
 
 class LayerAction(Action):
     """ レイヤを切り替えるアクション
     """
 
+    __slots__ = ("layer",)
+
     def __init__(self, layer: int):
         """
         :param layer: 割り当てるレイヤ番号
@@ -79,6 +93,8 @@ class HoldTapAction(Action):
     """ 特定時間押しっぱなしにした場合（hold）とそれ以前に話したとき(tap)、それぞれにアクションを割り当てるアクション
     """
 
+    __slots__ = ("hold", "tap", "timeout")
+
     def __init__(self, hold: Action, tap: Action, timeout: int = 200):
         """
         :param hold: 押しっぱなしの場合のアクション
@@ -90,12 +106,57 @@ class HoldTapAction(Action):
         self.timeout = timeout
 
 
+class SenderAction(Action):
+    """ センダーにコマンドを送るアクション（BLEのホストの切り替え等）
+    押したときにSender.command()を呼び、キーコードは送らない
+    """
+
+    __slots__ = ("command", "arg")
+
+    def __init__(self, command: str, arg: int = 0):
+        """
+        :param command: コマンド名
+        :param arg: コマンドの引数
+        """
+        self.command = command
+        self.arg = arg
+
+
+# 共有されるアクション
+NOP = NoOpAction()
+TRANS = TransAction()
+
+# ヘルパー関数が生成したアクションのキャッシュ（種類ごとに、内容をキーにする）
+_single_key_codes = {}
+_multiple_key_codes = {}
+_layer_actions = {}
+_hold_tap_actions = {}
+_sender_actions = {}
+
+
 def kc(key_code: int) -> Action:
     """
     :param key_code: キーコード
     :return: 割り当てられたキーコードのSingleKeyCodeアクションを返す
     """
-    return SingleKeyCode(key_code)
+    action = _single_key_codes.get(key_code)
+    if action is None:
+        action = SingleKeyCode(key_code)
+        _single_key_codes[key_code] = action
+    return action
+
+
+def mc_tuple(key_codes: tuple) -> Action:
+    """
+    複数のキーを同時に押すアクション（キーマップ表の読み込み等で、キーコードのタプルから作るときに使う）
+    :param key_codes: キーコードのタプル（先頭からモディファイア）
+    :return: 割り当てられたキーコードのMultipleKeyCodesアクションを返す
+    """
+    action = _multiple_key_codes.get(key_codes)
+    if action is None:
+        action = MultipleKeyCodes(key_codes)
+        _multiple_key_codes[key_codes] = action
+    return action
 
 
 def mc(modifier: int, key_code) -> Action:
@@ -106,10 +167,10 @@ def mc(modifier: int, key_code) -> Action:
     :return: 割り当てられたキーコードのSingleKeyCodeアクションを返す
     """
     if isinstance(key_code, SingleKeyCode):
-        return MultipleKeyCodes([modifier, key_code.key_code])
+        return mc_tuple((modifier, key_code.key_code))
     if isinstance(key_code, MultipleKeyCodes):
-        return MultipleKeyCodes([modifier] + key_code.key_codes)
-    return MultipleKeyCodes([modifier, key_code])
+        return mc_tuple((modifier,) + key_code.key_codes)
+    return mc_tuple((modifier, key_code))
 
 
 def la(layer: int) -> Action:
@@ -117,7 +178,26 @@ def la(layer: int) -> Action:
     :param layer: レイヤ番号
     :return: 割り当てられたレイヤ番号のLayerアクションを返す
     """
-    return LayerAction(layer)
+    action = _layer_actions.get(layer)
+    if action is None:
+        action = LayerAction(layer)
+        _layer_actions[layer] = action
+    return action
+
+
+def ht(hold: Action, tap: Action, timeout: int = 200) -> Action:
+    """
+    :param hold: 押しっぱなしの場合のアクション
+    :param tap: すぐに離したときのアクション
+    :param timeout: holdかtapかを判別する時間（m秒単位）
+    :return: HoldTapアクションを返す
+    """
+    key = (hold, tap, timeout)
+    action = _hold_tap_actions.get(key)
+    if action is None:
+        action = HoldTapAction(hold, tap, timeout)
+        _hold_tap_actions[key] = action
+    return action
 
 
 def lt(layer: int, key_code) -> Action:
@@ -128,9 +208,9 @@ def lt(layer: int, key_code) -> Action:
     :return: holdでレイヤ切り替え、tapでキーコードのHoldTapアクションを返す
     """
     if isinstance(key_code, Action):
-        return HoldTapAction(la(layer), key_code)
+        return ht(la(layer), key_code)
     else:
-        return HoldTapAction(la(layer), SingleKeyCode(key_code))
+        return ht(la(layer), kc(key_code))
 
 
 def mt(modifier: int, key_code: int) -> Action:
@@ -140,8 +220,74 @@ def mt(modifier: int, key_code: int) -> Action:
     :param key_code: キーコード
     :return: holdでモディファイア、tapでキーコードのHoldTapアクションを返す
     """
-    return HoldTapAction(SingleKeyCode(modifier), SingleKeyCode(key_code))
+    return ht(kc(modifier), kc(key_code))
+
+
+def cmd(command: str, arg: int = 0) -> Action:
+    """
+    :param command: コマンド名
+    :param arg: コマンドの引数
+    :return: センダーにコマンドを送るSenderActionを返す
+    """
+    key = (command, arg)
+    action = _sender_actions.get(key)
+    if action is None:
+        action = SenderAction(command, arg)
+        _sender_actions[key] = action
+    return action
+
+
+def bt(slot: int) -> Action:
+    """
+    :param slot: BLEのプロファイル番号（0からBleProfilesのスロット数未満）
+    :return: BLEの接続先をslot番のホストに切り替えるアクションを返す
+    """
+    from .ble_profiles import MAX_SLOTS
+    if not 0 <= slot < MAX_SLOTS:
+        raise ValueError("BLE profile slot must be 0 to %d" % (MAX_SLOTS - 1))
+    return cmd("bt", slot)
+
+
+def bt_clear() -> Action:
+    """
+    :return: 選択中のBLEプロファイルのペアリングをやり直すアクションを返す
+    """
+    return cmd("bt_clear")
+
+
+def out(index: int) -> Action:
+    """
+    :param index: OutputRouterの出力先の番号
+    :return: 出力先をindex番に切り替えるアクションを返す
+    """
+    return cmd("out", index)
+
+
+def out_all() -> Action:
+    """
+    :return: OutputRouterの全ての出力先に送るアクションを返す
+    """
+    return cmd("out_all")
+
+
+def out_auto() -> Action:
+    """
+    :return: OutputRouterの出力先をUSBの給電の有無で選ぶアクションを返す
+    """
+    return cmd("out_auto")
 
 
 def trans() -> Action:
-    return TransAction()
+    return TRANS
+
+
+def nop() -> Action:
+    return NOP
+
+
+def cached_actions() -> int:
+    """
+    :return: キャッシュされているアクションの数
+    """
+    return (len(_single_key_codes) + len(_multiple_key_codes) + len(_layer_actions) + len(_hold_tap_actions)
+            + len(_sender_actions))
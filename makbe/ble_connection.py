@@ -0,0 +1,169 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .clock import MonotonicClock, ticks_diff
+
+try:
+    from typing import Optional
+except ImportError:
+    # CircuitPythonランタイムでは型ヒントをスキップ
+    pass
+
+
+# 接続管理の状態
+STATE_ADVERTISING = 0     # 遅い間隔で広告している
+STATE_CONNECTED = 1       # 接続している
+STATE_RECONNECTING = 2    # 切断直後や起動直後で、速い間隔で広告している
+STATE_IDLE = 3            # 広告を止めて、キーが押されるのを待っている
+
+STATE_NAMES = ("advertising", "connected", "reconnecting", "idle")
+
+
+class BleConnectionManager:
+    """BLEの接続状態を管理する状態機械
+    update()はブロックしないので、Runtimeのタスク等から低い一定の頻度で呼ぶ
+    切断直後と起動直後はfast_interval_msで広告し、fast_period_msが過ぎたらslow_interval_msに落とす
+    idle_timeout_msの間接続されなければ広告を止め、wake()が呼ばれるまで何もしない
+
+    Attributes
+    ----------
+    state:
+        現在の状態（STATE_*）
+    connected:
+        直前のupdate()で接続していればTrue
+    """
+
+    def __init__(self, ble, advertisement, scan_response=None, fast_interval_ms: int = 20,
+                 fast_period_ms: int = 30000, slow_interval_ms: int = 150, idle_timeout_ms: int = 300000,
+                 check_ms: int = 100, clock=None):
+        """
+        :param ble: adafruit_ble.BLERadio
+        :param advertisement: 広告
+        :param scan_response: スキャン応答
+        :param fast_interval_ms: 再接続を待つ間の広告間隔（ms単位）
+        :param fast_period_ms: 速い間隔で広告する時間（ms単位）
+        :param slow_interval_ms: その後の広告間隔（ms単位）
+        :param idle_timeout_ms: 接続されないまま広告を止めるまでの時間（ms単位、0なら止めない）
+        :param check_ms: update()で接続状態を調べる間隔（ms単位）
+        :param clock: 時計（省略時はMonotonicClock）
+        """
+        self.ble = ble
+        self.advertisement = advertisement
+        self.scan_response = scan_response
+        self.fast_interval_ms = fast_interval_ms
+        self.fast_period_ms = fast_period_ms
+        self.slow_interval_ms = slow_interval_ms
+        self.idle_timeout_ms = idle_timeout_ms
+        self.check_ms = check_ms
+        self.clock = clock if clock is not None else MonotonicClock()
+
+        now = self.clock.read_ms()
+        self.state = STATE_IDLE
+        self.connected = False
+        self.since = now
+        self.last_check = now
+        self.connections = 0
+        self.reconnect_ms = 0
+        self.enter(STATE_CONNECTED if ble.connected else STATE_RECONNECTING, now)
+
+    def enter(self, state: int, now: int):
+        """状態を移して、広告を開始または停止する
+        :param state: 新しい状態
+        :param now: 現在時刻（ms単位）
+        """
+        if state == STATE_RECONNECTING:
+            self._advertise(self.fast_interval_ms)
+        elif state == STATE_ADVERTISING:
+            self._advertise(self.slow_interval_ms)
+        else:
+            self._stop_advertising()
+        if state == STATE_CONNECTED:
+            self.connections += 1
+            if self.state != STATE_CONNECTED:
+                self.reconnect_ms = ticks_diff(now, self.since)
+        self.connected = state == STATE_CONNECTED
+        self.state = state
+        self.since = now
+        print("BLE " + STATE_NAMES[state])
+
+    def _advertise(self, interval_ms: int):
+        ble = self.ble
+        if getattr(ble, "advertising", False):
+            ble.stop_advertising()
+        ble.start_advertising(self.advertisement, self.scan_response, interval=interval_ms / 1000)
+
+    def _stop_advertising(self):
+        if getattr(self.ble, "advertising", False):
+            self.ble.stop_advertising()
+
+    def update(self, now: Optional[int] = None) -> bool:
+        """前回からcheck_ms以上経っていれば、接続状態を調べて状態を進める
+        :param now: 現在時刻（ms単位、省略時は時計から読む）
+        :return: 状態が変わったらTrue
+        """
+        if now is None:
+            now = self.clock.read_ms()
+        if ticks_diff(now, self.last_check) < self.check_ms:
+            return False
+        self.last_check = now
+
+        state = self.state
+        if state == STATE_IDLE:
+            return False
+        connected = self.ble.connected
+        if state == STATE_CONNECTED:
+            if not connected:
+                self.enter(STATE_RECONNECTING, now)
+                return True
+            return False
+        if connected:
+            self.enter(STATE_CONNECTED, now)
+            return True
+        elapsed = ticks_diff(now, self.since)
+        if state == STATE_RECONNECTING and elapsed >= self.fast_period_ms:
+            self.enter(STATE_ADVERTISING, now)
+            return True
+        if state == STATE_ADVERTISING and 0 < self.idle_timeout_ms <= elapsed:
+            self.enter(STATE_IDLE, now)
+            return True
+        return False
+
+    def wake(self):
+        """広告を止めていれば、速い間隔での広告を再開する（キーが押されたとき等に呼ぶ）"""
+        if self.state == STATE_IDLE:
+            self.enter(STATE_RECONNECTING, self.clock.read_ms())
+
+    def restart(self, force: bool = False):
+        """接続していなければ、速い間隔での広告をやり直す（ペアリングの開始等）
+        :param force: Trueなら、接続していても広告をやり直す（接続を切った直後等）
+        """
+        if force or not self.ble.connected:
+            self.enter(STATE_RECONNECTING, self.clock.read_ms())
+
+    def stats(self) -> dict:
+        """
+        :return: 状態、接続回数、直前の再接続にかかった時間
+        """
+        return {
+            "state": STATE_NAMES[self.state],
+            "connections": self.connections,
+            "reconnect_ms": self.reconnect_ms,
+        }
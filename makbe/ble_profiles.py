@@ -0,0 +1,103 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# nvmに保存する形式（offsetから）
+#   0  b"MP"
+#   2  選択中のスロット（u8）
+#   3  スロット数（u8）
+#   4  スロットごとの世代（u8 × スロット数）
+MAGIC = b"MP"
+HEADER_SIZE = 4
+# スロット数の上限（アドレスの1バイト目にスロット番号を混ぜるので、8台までにしておく）
+MAX_SLOTS = 8
+
+
+class BleProfiles:
+    """BLEで接続するホストのプロファイル（スロット）を管理する
+    スロットごとに別のランダムスタティックアドレスを名乗るので、ホストから見ると別のキーボードになり、
+    ボンディング情報もスロットごとに別になる
+    ペアリングをやり直すときは、そのスロットの世代を進めてアドレスを変える（他のスロットのボンディングは消さない）
+    選択中のスロットと世代はmicrocontroller.nvmに保存する
+    """
+
+    def __init__(self, slots: int = 3, storage=None, offset: int = 0):
+        """
+        :param slots: スロットの数（最大MAX_SLOTS）
+        :param storage: 保存先（省略時はmicrocontroller.nvm、無ければメモリ上のbytearray）
+        :param offset: 保存先の中の位置
+        """
+        if not 1 <= slots <= MAX_SLOTS:
+            raise ValueError("BLE profile slots must be 1 to %d" % MAX_SLOTS)
+        if storage is None:
+            try:
+                import microcontroller
+                storage = microcontroller.nvm
+            except (ImportError, AttributeError):
+                storage = bytearray(offset + HEADER_SIZE + slots)
+        self.storage = storage
+        self.offset = offset
+        self.slots = slots
+        at = offset
+        if (storage[at:at + 2] != MAGIC or storage[at + 3] != slots or storage[at + 2] >= slots):
+            storage[at:at + HEADER_SIZE + slots] = MAGIC + bytes((0, slots)) + bytes(slots)
+        self.selected = storage[at + 2]
+
+    def generation(self, slot: int) -> int:
+        """
+        :param slot: スロット番号
+        :return: スロットの世代（ペアリングをやり直した回数）
+        """
+        return self.storage[self.offset + HEADER_SIZE + slot]
+
+    def select(self, slot: int) -> bool:
+        """
+        :param slot: 選択するスロット番号
+        :return: 選択が変わったらTrue（範囲外のスロットは無視してFalse）
+        """
+        if not 0 <= slot < self.slots:
+            # キーマップから呼ばれるので、例外にせずに無視する
+            print("Warning: no such BLE profile slot: %d" % slot)
+            return False
+        if slot == self.selected:
+            return False
+        self.selected = slot
+        self.storage[self.offset + 2] = slot
+        return True
+
+    def forget(self, slot: int):
+        """スロットの世代を進め、次からは別のアドレスを名乗る
+        :param slot: スロット番号
+        """
+        at = self.offset + HEADER_SIZE + slot
+        self.storage[at] = (self.storage[at] + 1) & 0xFF
+
+    def address(self, base: bytes, slot: int) -> bytes:
+        """
+        :param base: アダプタ本来のアドレス（6バイト、リトルエンディアン）
+        :param slot: スロット番号
+        :return: スロットが名乗るランダムスタティックアドレス（6バイト、リトルエンディアン）
+        """
+        mixed = bytearray(base)
+        mixed[0] ^= slot + 1
+        mixed[1] ^= self.generation(slot)
+        # ランダムスタティックアドレスは最上位の2ビットが1
+        mixed[5] |= 0xC0
+        return bytes(mixed)
@@ -19,17 +19,24 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from makbe.sender import Sender
 import adafruit_ble
 from adafruit_ble.advertising import Advertisement
 from adafruit_ble.advertising.standard import ProvideServicesAdvertisement
 from adafruit_ble.services.standard.device_info import DeviceInfoService
 from adafruit_ble.services.standard.hid import HIDService
-from adafruit_hid.keyboard import Keyboard
 
+from .ble_connection import BleConnectionManager, STATE_IDLE
+from .hid_report import keyboard_devices
+from .report_sender import ReportSender
 
-class BleSender(Sender):
-    """Bluetooth LE HIDでキーコードを送出するクラス"""
+
+class BleSender(ReportSender):
+    """Bluetooth LE HIDでキーコードを送出するクラス
+    レポートはReportSenderのキューに積み、接続間隔（interval_ms）ごとに最大batch個をまとめて通知する
+    未接続の間に押されたキーもキューに残し、接続したら送る（積んでからstale_msより経ったものは捨てる）
+    接続状態はBleConnectionManagerが管理し、press()/release()では無線の状態を問い合わせない
+    profilesを指定すると、bt(slot)のアクションで接続先のホストを切り替えられる
+    """
 
     KEYBOARD_APPEARANCE = 961
 
@@ -38,9 +45,42 @@ class BleSender(Sender):
         name: str = "Makbe Keyboard",
         wait_for_connection: bool = False,
         clear_bonds: bool = False,
+        interval_ms: int = 15,
+        depth: int = 32,
+        batch: int = 4,
+        stale_ms: int = 2000,
+        clock=None,
+        fast_interval_ms: int = 20,
+        fast_period_ms: int = 30000,
+        slow_interval_ms: int = 150,
+        idle_timeout_ms: int = 300000,
+        check_ms: int = 100,
+        profiles=None,
     ):
+        """
+        :param name: 広告するデバイス名
+        :param wait_for_connection: Trueなら接続されるまで待つ
+        :param clear_bonds: Trueならボンディング情報を消去する
+        :param interval_ms: 通知の間隔（ms単位、接続間隔に合わせる）
+        :param depth: 送信キューの長さ
+        :param batch: 1回の間隔で送るレポートの最大数
+        :param stale_ms: 未接続の間に積んだレポートを、接続後に送ってよい最大の経過時間（ms単位）
+        :param clock: 時計（省略時はMonotonicClock）
+        :param fast_interval_ms: 切断直後と起動直後の広告間隔（ms単位）
+        :param fast_period_ms: 速い間隔で広告する時間（ms単位）
+        :param slow_interval_ms: その後の広告間隔（ms単位）
+        :param idle_timeout_ms: 接続されないまま広告を止めるまでの時間（ms単位、0なら止めない）
+        :param check_ms: 接続状態を調べる間隔（ms単位）
+        :param profiles: ホストのプロファイル（BleProfiles、省略時は1台のホストだけ）
+        """
+        self.profiles = profiles
         if clear_bonds:
             self.clear_bonds()
+        if profiles is not None:
+            import _bleio
+
+            self.base_address = _bleio.adapter.address.address_bytes
+            self.apply_profile()
 
         self.hid = HIDService()
         self.device_info = DeviceInfoService(
@@ -55,18 +95,63 @@ class BleSender(Sender):
 
         self.ble = adafruit_ble.BLERadio()
         self.ble.name = name
-        self.connected = False
+        self.stale_ms = stale_ms
 
-        super().__init__(Keyboard(self.hid.devices))
-        self.start_advertising()
+        super().__init__(keyboard_devices(self.hid.devices)[0], None, interval_ms, depth, clock, batch=batch)
+        self.connection = BleConnectionManager(
+            self.ble, self.advertisement, self.scan_response,
+            fast_interval_ms, fast_period_ms, slow_interval_ms, idle_timeout_ms, check_ms, self.clock)
 
         if wait_for_connection:
             self.wait_for_connection()
 
     def start_advertising(self):
-        if not self.ble.connected and not getattr(self.ble, "advertising", False):
-            print("BLE advertising")
-            self.ble.start_advertising(self.advertisement, self.scan_response)
+        """接続していなければ、速い間隔での広告をやり直す"""
+        self.connection.restart()
+
+    def apply_profile(self):
+        """選択中のプロファイルのアドレスを名乗る"""
+        import _bleio
+
+        address = self.profiles.address(self.base_address, self.profiles.selected)
+        _bleio.adapter.address = _bleio.Address(address, _bleio.Address.RANDOM_STATIC)
+
+    def switch_profile(self, slot: int):
+        """接続先をslot番のホストに切り替える
+        選択中のスロットなら、接続していなければ広告をやり直すだけ（無いスロットは無視する）
+        :param slot: スロット番号
+        """
+        profiles = self.profiles
+        if profiles is not None and profiles.select(slot):
+            print("BLE profile %d" % slot)
+            self._reconnect()
+        elif profiles is None or slot == profiles.selected:
+            self.connection.restart()
+
+    def forget_profile(self):
+        """選択中のスロットのアドレスを変えて、新しいホストとペアリングできるようにする
+        他のスロットのボンディング情報は消さない
+        """
+        if self.profiles is None:
+            self.clear_bonds()
+            self.connection.restart()
+            return
+        self.profiles.forget(self.profiles.selected)
+        self._reconnect()
+
+    def _reconnect(self):
+        # 前のホストへの送信待ちは捨てる（切断されたホストはキーを離したものとして扱う）
+        self.discard()
+        for connection in self.ble.connections:
+            connection.disconnect()
+        self.apply_profile()
+        self.connection.restart(True)
+
+    def command(self, command: str, arg: int = 0):
+        if command == "bt":
+            self.switch_profile(arg)
+        elif command == "bt_clear":
+            self.forget_profile()
 
     def clear_bonds(self):
         import _bleio
@@ -74,27 +159,20 @@ class BleSender(Sender):
         _bleio.adapter.erase_bonding()
 
     def wait_for_connection(self):
-        while not self.ble.connected:
-            pass
+        """接続されるまで待つ（起動時だけ使う）"""
+        while not self.connection.connected:
+            self.connection.update()
+            self.clock.sleep(self.connection.check_ms / 1000)
 
-    def update(self):
-        connected = self.ble.connected
-        if connected != self.connected:
-            self.connected = connected
-            if connected:
-                print("BLE connected")
-            else:
-                print("BLE disconnected")
-        self.start_advertising()
-
-    def press(self, key_code: int):
-        if not self.ble.connected:
-            self.start_advertising()
-            return
-        super().press(key_code)
+    def ready(self) -> bool:
+        return self.connection.connected
 
-    def release(self, key_code: int):
-        if not self.ble.connected:
-            self.start_advertising()
-            return
-        super().release(key_code)
+    def wake(self):
+        if self.connection.state == STATE_IDLE:
+            self.connection.wake()
+
+    def update(self):
+        if self.connection.update() and self.connection.connected:
+            # 再接続までに溜まったレポートのうち、古いものは送らない
+            self.drop_stale(self.stale_ms)
+        self.flush()
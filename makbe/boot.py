@@ -0,0 +1,98 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .clock import MonotonicClock, ticks_diff
+
+
+class BootTimer:
+    """起動処理の段階ごとの時間を計る
+    code.pyの先頭でstart_boot_timer()を呼び、各段階の終わりでboot_mark()を呼ぶ
+    MonotonicClockは電源投入からの時刻なので、最初の段階には電源投入からstart_boot_timer()までの時間が入る
+    """
+
+    def __init__(self, clock=None):
+        """
+        :param clock: 時計（省略時はMonotonicClock）
+        """
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.started_us = self.clock.read_us()
+        self.last_us = self.started_us
+        self.stages = [("power on", self.started_us)]
+
+    def mark(self, name: str):
+        """段階の終わりを記録する
+        :param name: 段階の名前
+        """
+        now = self.clock.read_us()
+        self.stages.append((name, ticks_diff(now, self.last_us)))
+        self.last_us = now
+
+    def elapsed_us(self) -> int:
+        """
+        :return: 計測を始めてからの時間（µs単位）
+        """
+        return ticks_diff(self.last_us, self.started_us)
+
+    def report(self) -> list:
+        """
+        :return: 段階ごとの (名前, 時間(µs)) のリスト
+        """
+        return list(self.stages)
+
+    def print_report(self):
+        for name, us in self.stages:
+            print("%-20s %8.1f ms" % (name, us / 1000))
+        print("%-20s %8.1f ms" % ("total", self.elapsed_us() / 1000))
+
+
+# 計測中のBootTimer（計測していなければNone）
+_timer = None
+
+
+def start_boot_timer(clock=None) -> BootTimer:
+    """起動時間の計測を始める
+    :param clock: 時計（省略時はMonotonicClock）
+    :return: 生成したBootTimer
+    """
+    global _timer
+    _timer = BootTimer(clock)
+    return _timer
+
+
+def boot_mark(name: str):
+    """計測中なら段階の終わりを記録する（計測していなければ何もしない）
+    :param name: 段階の名前
+    """
+    if _timer is not None:
+        _timer.mark(name)
+
+
+def finish_boot_timer(show: bool = True) -> BootTimer:
+    """起動時間の計測を終える
+    :param show: Trueならレポートを表示する
+    :return: 計測していたBootTimer（計測していなければNone）
+    """
+    global _timer
+    timer = _timer
+    _timer = None
+    if timer is not None and show:
+        timer.print_report()
+    return timer
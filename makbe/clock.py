@@ -0,0 +1,168 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from time import monotonic_ns, sleep
+
+
+# タイムスタンプは一定の周期で一周する値として扱う
+# CircuitPythonのsupervisor.ticks_ms()と同じく2^29周期にしておくと、
+# 小さいintの範囲に収まるので、ヒープ確保が起きない
+TICKS_PERIOD = 1 << 29
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    """
+    :param ticks: タイムスタンプ
+    :param delta: 加算する時間
+    :return: 一周を考慮して加算したタイムスタンプ
+    """
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(end: int, start: int) -> int:
+    """一周を考慮したタイムスタンプの差
+    :param end: 後のタイムスタンプ
+    :param start: 前のタイムスタンプ
+    :return: end - start（符号付き）
+    """
+    diff = (end - start) & TICKS_MAX
+    return ((diff + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def ticks_less(a: int, b: int) -> bool:
+    """
+    :return: aがbより前のタイムスタンプならTrue
+    """
+    return ticks_diff(b, a) > 0
+
+
+class Clock:
+    """スキャナやプロセッサが使う時計の基底クラス
+    update()で1サイクルに1回だけ時刻を読み取り、
+    そのサイクル中はnow_ms/now_usを参照する
+
+    Attributes
+    ----------
+    now_ms:
+        直前のupdate()で読み取った時刻（ms単位、TICKS_PERIODで一周する）
+    now_us:
+        直前のupdate()で読み取った時刻（µs単位、TICKS_PERIODで一周する）
+    realtime:
+        実時間で進む時計ならTrue
+    """
+
+    realtime = True
+
+    def __init__(self):
+        self.now_ms = 0
+        self.now_us = 0
+
+    def read_us(self) -> int:
+        """時刻をその場で読み取る（キャッシュは更新しない）
+        :return: 現在時刻（µs単位、TICKS_PERIODで一周する）
+        """
+        return 0
+
+    def read_ms(self) -> int:
+        """時刻をその場で読み取る（キャッシュは更新しない）
+        :return: 現在時刻（ms単位、TICKS_PERIODで一周する）
+        """
+        return 0
+
+    def update(self) -> int:
+        """時刻を読み取って、now_ms/now_usを更新する
+        :return: 現在時刻（ms単位）
+        """
+        return self.now_ms
+
+    def sleep(self, seconds: float):
+        """指定時間待つ
+        :param seconds: 待ち時間（秒単位）
+        """
+        pass
+
+
+class MonotonicClock(Clock):
+    """time.monotonic_ns()を使う実機用の時計
+    """
+
+    def read_us(self) -> int:
+        return (monotonic_ns() // 1000) & TICKS_MAX
+
+    def read_ms(self) -> int:
+        return (monotonic_ns() // 1000000) & TICKS_MAX
+
+    def update(self) -> int:
+        us = monotonic_ns() // 1000
+        self.now_us = us & TICKS_MAX
+        self.now_ms = (us // 1000) & TICKS_MAX
+        return self.now_ms
+
+    def sleep(self, seconds: float):
+        sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """ホスト上のテストやベンチマーク用の仮想時計
+    実際には待たずに時刻だけを進めるので、実時間よりはるかに速くシミュレーションできる
+    """
+
+    realtime = False
+
+    def __init__(self, start_us: int = 0, step_us: int = 0):
+        """
+        :param start_us: 開始時刻（µs単位）
+        :param step_us: update()のたびに自動で進める時間（µs単位）
+        """
+        super().__init__()
+        self.time_us = start_us
+        self.step_us = step_us
+        self.now_us = start_us & TICKS_MAX
+        self.now_ms = (start_us // 1000) & TICKS_MAX
+
+    def read_us(self) -> int:
+        return self.time_us & TICKS_MAX
+
+    def read_ms(self) -> int:
+        return (self.time_us // 1000) & TICKS_MAX
+
+    def update(self) -> int:
+        self.time_us += self.step_us
+        self.now_us = self.time_us & TICKS_MAX
+        self.now_ms = (self.time_us // 1000) & TICKS_MAX
+        return self.now_ms
+
+    def advance_us(self, us: int):
+        """時刻を進める（キャッシュは次のupdate()で更新される）
+        :param us: 進める時間（µs単位）
+        """
+        self.time_us += us
+
+    def advance_ms(self, ms: int):
+        """時刻を進める（キャッシュは次のupdate()で更新される）
+        :param ms: 進める時間（ms単位）
+        """
+        self.time_us += ms * 1000
+
+    def sleep(self, seconds: float):
+        self.time_us += int(seconds * 1000000)
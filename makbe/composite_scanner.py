@@ -0,0 +1,174 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .clock import ticks_add, ticks_diff
+from .event_queue import EventQueue
+from .scanner import Scanner
+
+try:
+    from typing import Optional
+except ImportError:
+    # CircuitPythonランタイムでは型ヒントをスキップ
+    pass
+
+
+class ScanSource:
+    """CompositeScannerが読む入力元と、その読み取り頻度と時間の予算
+    """
+
+    __slots__ = ("source", "name", "interval_ms", "budget_us", "due", "polls", "last_us", "max_us",
+                 "overruns", "deferred", "skipped")
+
+    def __init__(self, source, name: str, interval_ms: int, budget_us: int, due: int):
+        """
+        :param source: poll(now)とsinkを持つ入力元（I2CScanner、MatrixScanner、SplitReceiver等）
+        :param name: 表示用の名前
+        :param interval_ms: 読み取り間隔（ms単位、0なら毎サイクル）
+        :param budget_us: 1回の読み取りにかけてよい時間（µs単位、0なら計らない）
+        :param due: 次に読む時刻（ms単位）
+        """
+        self.source = source
+        self.name = name
+        self.interval_ms = interval_ms
+        self.budget_us = budget_us
+        self.due = due
+        self.polls = 0
+        self.last_us = 0
+        self.max_us = 0
+        self.overruns = 0
+        self.deferred = 0
+        self.skipped = False
+
+
+class CompositeScanner(Scanner):
+    """複数の入力元（GPIOの行列、I/Oエクスパンダ、分割キーボードのリンク等）を1つのスキャナとして動かす
+    時刻は1サイクルに1回だけ読み、全ての入力元のイベントを1つのキュー（sink）に追加順に集め、
+    process_events()も1回だけ行う
+    interval_msを指定した遅い入力元は、その間隔でだけ読む。cycle_budget_usを指定すると、
+    毎サイクル読む入力元の後で、残りの時間に収まる遅い入力元だけを読み、収まらないものは次のサイクルに回す
+    （続けて2回は回さないので、遅い入力元も読まれなくなることはない）
+    """
+
+    def __init__(self, processor, clock=None, direct: bool = False, cycle_budget_us: int = 0,
+                 event_queue=None):
+        """
+        :param processor: キーイベントを処理するオブジェクト
+        :param clock: 時計（省略時はMonotonicClock）
+        :param direct: Trueならキューを通さず、スキャン中に確定したイベントを直接プロセッサに渡す
+        :param cycle_budget_us: 1サイクルで入力元を読むのにかけてよい時間（µs単位、0なら制限しない）
+        :param event_queue: スキャナとプロセッサ間でイベントを受け渡すキュー（省略時は新しく作る）
+        """
+        self.entries = []
+        super().__init__(event_queue if event_queue is not None else EventQueue(), processor, clock, direct)
+        self.cycle_budget_us = cycle_budget_us
+
+    def add(self, source, interval_ms: int = 0, budget_us: int = 0, name: Optional[str] = None) -> ScanSource:
+        """入力元を加える
+        入力元のイベントはこのスキャナのsinkに入り、時計もこのスキャナのものを使うようになる
+        :param source: poll(now)とsinkを持つ入力元
+        :param interval_ms: 読み取り間隔（ms単位、0なら毎サイクル）
+        :param budget_us: 1回の読み取りにかけてよい時間（µs単位、超えた回数をoverrunsに数える）
+        :param name: 表示用の名前（省略時はクラス名）
+        :return: 加えた入力元のScanSource
+        """
+        entry = ScanSource(source, name if name is not None else type(source).__name__,
+                           interval_ms, budget_us, self.clock.now_ms)
+        source.sink = self.sink
+        if hasattr(source, "clock"):
+            source.clock = self.clock
+        if self.monitor is not None and hasattr(source, "monitor"):
+            source.monitor = self.monitor
+        self.entries.append(entry)
+        # 毎サイクル読む入力元を先に読む
+        self.entries.sort(key=lambda e: 0 if e.interval_ms == 0 else 1)
+        return entry
+
+    def set_direct(self, direct: bool):
+        super().set_direct(direct)
+        for entry in self.entries:
+            entry.source.sink = self.sink
+
+    def use_switch_table(self, table):
+        """状態表を、状態表を使える入力元にも使わせる
+        :param table: 全ての入力元のスイッチを登録したSwitchTable
+        """
+        self.switch_table = table
+        for entry in self.entries:
+            if hasattr(entry.source, "use_switch_table"):
+                entry.source.use_switch_table(table)
+
+    def switches(self) -> list:
+        result = []
+        seen = set()
+        for entry in self.entries:
+            for switch in entry.source.switches():
+                if id(switch) not in seen:
+                    seen.add(id(switch))
+                    result.append(switch)
+        return result
+
+    def poll(self, now: int):
+        """
+        読む時刻になった入力元を順に読む
+        :param now: 現在時刻（ms単位）
+        """
+        clock = self.clock
+        cycle_budget = self.cycle_budget_us
+        spent = 0
+        for entry in self.entries:
+            interval = entry.interval_ms
+            if interval:
+                if ticks_diff(now, entry.due) < 0:
+                    continue
+                if (cycle_budget and spent and not entry.skipped
+                        and spent + entry.last_us > cycle_budget):
+                    entry.skipped = True
+                    entry.deferred += 1
+                    continue
+                entry.skipped = False
+                entry.due = ticks_add(now, interval)
+            started = clock.read_us()
+            entry.source.poll(now)
+            took = ticks_diff(clock.read_us(), started)
+            spent += took
+            entry.polls += 1
+            entry.last_us = took
+            if took > entry.max_us:
+                entry.max_us = took
+            if entry.budget_us and took > entry.budget_us:
+                entry.overruns += 1
+
+    def attach_monitor(self, monitor):
+        super().attach_monitor(monitor)
+        for entry in self.entries:
+            if hasattr(entry.source, "monitor"):
+                entry.source.monitor = monitor
+
+    def report(self) -> list:
+        """
+        :return: 各入力元の (名前, 読んだ回数, 最大時間(µs), 予算超過の回数, 後回しにした回数) のリスト
+        """
+        return [(e.name, e.polls, e.max_us, e.overruns, e.deferred) for e in self.entries]
+
+    def print_report(self):
+        for name, polls, max_us, overruns, deferred in self.report():
+            print("  %-16s polls %6d  max %6d us  over budget %d  deferred %d" % (
+                name, polls, max_us, overruns, deferred))
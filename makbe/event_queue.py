@@ -20,18 +20,25 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from makbe import KeyEvent
+from .key_event import KeyEvent
+from .latency import STAGE_ENQUEUE
 
 
 class EventQueue:
     """スキャナとプロセッサ間でイベントを受け渡すためのキュー
+    固定長のリングバッファなので、イベントの追加と取り出しでメモリを確保しない
     """
 
+    monitor = None
+
     def __init__(self, max_size: int = 32):
         """
         :param max_size: キューの最大サイズ
         """
-        self.queue = []
+        self.events = [None] * max_size
+        self.timestamps = [0] * max_size
+        self.head = 0
+        self.count = 0
         self.max_size = max_size
 
     def enqueue(self, event: KeyEvent, timestamp: int):
@@ -39,30 +46,84 @@ class EventQueue:
         :param event: キーイベント
         :param timestamp: タイムスタンプ
         """
-        if len(self.queue) < self.max_size:
-            self.queue.append((event, timestamp))
-        else:
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_ENQUEUE)
+        if self.count == self.max_size:
             # キューがいっぱいの場合は古いイベントを削除
             print("Warning: Event queue full, dropping oldest event")
-            self.queue.pop(0)
-            self.queue.append((event, timestamp))
+            self.head = (self.head + 1) % self.max_size
+            self.count -= 1
+        tail = (self.head + self.count) % self.max_size
+        self.events[tail] = event
+        self.timestamps[tail] = timestamp
+        self.count += 1
 
     def dequeue(self):
         """キューからイベントを取り出す
         :return: (event, timestamp) のタプル、またはキューが空の場合はNone
         """
-        if len(self.queue) > 0:
-            return self.queue.pop(0)
-        return None
+        if self.count == 0:
+            return None
+        head = self.head
+        event = self.events[head]
+        self.events[head] = None
+        self.head = (head + 1) % self.max_size
+        self.count -= 1
+        return event, self.timestamps[head]
+
+    def drain(self, put):
+        """キューのイベントを古い順に全て取り出して渡す
+        dequeue()と違い、タプルを作らない
+        :param put: (event, timestamp) を受け取る関数（Processor.put等）
+        """
+        events = self.events
+        timestamps = self.timestamps
+        while self.count > 0:
+            head = self.head
+            event = events[head]
+            events[head] = None
+            self.head = (head + 1) % self.max_size
+            self.count -= 1
+            put(event, timestamps[head])
 
     def is_empty(self) -> bool:
         """キューが空かどうか
         :return: 空の場合True
         """
-        return len(self.queue) == 0
+        return self.count == 0
 
     def size(self) -> int:
         """キューに入っているイベント数
         :return: イベント数
         """
-        return len(self.queue)
\ No newline at end of file
+        return self.count
+
+
+class EventBatch:
+    """直接モードのスキャナが、1回のスキャンで確定したイベントを集めるもの
+    EventQueueと同じenqueue()を持つが、時刻はスキャンで共通なので保存しない
+    スキャンの最後にProcessor.put_many()でまとめて渡す
+    """
+
+    monitor = None
+
+    def __init__(self):
+        self.events = []
+
+    def enqueue(self, event: KeyEvent, timestamp: int):
+        """イベントを追加
+        :param event: キーイベント
+        :param timestamp: タイムスタンプ（スキャンの時刻と同じなので使わない）
+        """
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_ENQUEUE)
+        self.events.append(event)
+
+    def flush(self, processor, now: int):
+        """集めたイベントをプロセッサに渡して空にする
+        :param processor: イベントを処理するプロセッサ
+        :param now: スキャンの時刻（ms単位）
+        """
+        if self.events:
+            processor.put_many(self.events, now)
+            self.events.clear()
@@ -19,7 +19,8 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from makbe import IoExpander, nop_switch, KeySwitch
+from ..io_expander import IoExpander
+from ..key_switch import KeySwitch, nop_switch
 
 
 #0x41
@@ -32,6 +33,8 @@ class PCA9536(IoExpander):
         :param dev_address: デバイスアドレスの下位3ビット分
         """
         self.dev_address = 0x41
+        self.command = bytes([0x00])
+        self.buffer = bytearray(1)
         self.switches = []
         for i in range(4):
             self.switches.append(nop_switch())
@@ -60,6 +63,15 @@ class PCA9536(IoExpander):
                 result.append(True)
         return result
 
+    def read_bits(self, i2c) -> int:
+        """I/Oエクスパンダを読み込んで、その状態をビット列で返す
+        :param i2c: I2Cマスタ
+        :return: ピンiがONならビットiが1の整数
+        """
+        buffer = self.buffer
+        i2c.writeto_then_readfrom(self.dev_address, self.command, buffer)
+        return ~buffer[0] & 0x0F
+
     def assign(self, pin: int, switch: KeySwitch):
         """ピンにキースイッチを割り当てる
         :param pin: ピン番号（0オリジン）
@@ -0,0 +1,130 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from ..io_expander import IoExpander
+from ..key_switch import KeySwitch, nop_switch
+from ..split_link import crc8
+
+
+# 相手のマイコン（I2Cターゲット、makbe.peer_target）のレジスタ
+REG_STATE = 0x00    # 押されているキーのビット列（下位バイトから）と、そのCRC-8
+REG_INFO = 0x01     # INFO_MAGIC、バージョン、キーの数
+INFO_MAGIC = 0x4D
+VERSION = 1
+MAX_PINS = 64
+DEFAULT_ADDRESS = 0x42
+
+
+def state_size(pins: int) -> int:
+    """
+    :param pins: キーの数
+    :return: REG_STATEの応答のバイト数（ビット列とCRC-8）
+    """
+    return (pins + 7) // 8 + 1
+
+
+def pack_state(bits: int, buffer: bytearray):
+    """REG_STATEの応答を作る
+    :param bits: キーiが押されていればビットiが1の整数
+    :param buffer: state_size()バイトのバッファ
+    """
+    last = len(buffer) - 1
+    for i in range(last):
+        buffer[i] = (bits >> (8 * i)) & 0xFF
+    buffer[last] = crc8(buffer, 0, last)
+
+
+class PeerMcu(IoExpander):
+    """I2Cターゲットとして動く別のマイコンを、最大64ピンのI/Oエクスパンダとして扱う
+    分割キーボードのもう片側を、1回のwriteto_then_readfrom()で丸ごと読める
+    相手側ではmakbe.peer_targetのPeerTargetを動かす
+    """
+
+    def __init__(self, pins: int, dev_address: int = DEFAULT_ADDRESS):
+        """
+        :param pins: 相手側のキーの数（最大64）
+        :param dev_address: 相手側のI2Cアドレス（7ビット）
+        """
+        if not 0 < pins <= MAX_PINS:
+            raise ValueError("peer MCU supports 1 to %d keys" % MAX_PINS)
+        self.dev_address = dev_address
+        self.pins = pins
+        self.command = bytes([REG_STATE])
+        self.buffer = bytearray(state_size(pins))
+        self.crc_errors = 0
+        self.switches = []
+        for i in range(pins):
+            self.switches.append(nop_switch())
+
+    def init_device(self, i2c) -> bool:
+        """相手側がPeerTargetで、キーの数が合っているかを確かめる
+        :param i2c: I2Cマスタ
+        :return: 確かめられたらTrue
+        """
+        info = bytearray(3)
+        i2c.writeto_then_readfrom(self.dev_address, bytes([REG_INFO]), info)
+        if info[0] != INFO_MAGIC or info[1] != VERSION:
+            print("no peer MCU at 0x%02x" % self.dev_address)
+            return False
+        if info[2] != self.pins:
+            print("peer MCU at 0x%02x has %d keys, expected %d" % (self.dev_address, info[2], self.pins))
+            return False
+        return True
+
+    def read_device(self, i2c) -> [bool]:
+        """I/Oエクスパンダを読み込んで、その状態を返す
+        :param i2c: I2Cマスタ
+        :return: 各ピンの状態（ONでTrue）のリスト、CRCが合わなければNone
+        """
+        bits = self.read_bits(i2c)
+        if bits is None:
+            return None
+        return [bits & (1 << i) != 0 for i in range(self.pins)]
+
+    def read_bits(self, i2c):
+        """相手側の全てのキーの状態を、1回の読み出しで得る
+        :param i2c: I2Cマスタ
+        :return: ピンiがONならビットiが1の整数、CRCが合わなければNone
+        """
+        buffer = self.buffer
+        i2c.writeto_then_readfrom(self.dev_address, self.command, buffer)
+        last = len(buffer) - 1
+        if crc8(buffer, 0, last) != buffer[last]:
+            self.crc_errors += 1
+            return None
+        bits = 0
+        for i in range(last - 1, -1, -1):
+            bits = (bits << 8) | buffer[i]
+        return bits
+
+    def assign(self, pin: int, switch: KeySwitch):
+        """ピンにキースイッチを割り当てる
+        :param pin: ピン番号（0オリジン）
+        :param switch: キースイッチ
+        """
+        self.switches[pin] = switch
+
+    def switch(self, pin: int) -> KeySwitch:
+        """ピンに対応するキースイッチを返す
+        :param pin: ピン番号（0オリジン）
+        :return: 対応するキースイッチ
+        """
+        return self.switches[pin]
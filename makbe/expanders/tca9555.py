@@ -19,8 +19,8 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from .. key_switch import nop_switch
-from .. import IoExpander, KeySwitch
+from ..io_expander import IoExpander
+from ..key_switch import KeySwitch, nop_switch
 
 
 class TCA9555(IoExpander):
@@ -33,6 +33,8 @@ class TCA9555(IoExpander):
         :param dev_address: デバイスアドレスの下位3ビット分
         """
         self.dev_address = dev_address + 0x20
+        self.command = bytes([0x00])
+        self.buffer = bytearray(2)
         self.switches = []
         for i in range(16):
             self.switches.append(nop_switch())
@@ -63,6 +65,15 @@ class TCA9555(IoExpander):
                     result.append(True)
         return result
 
+    def read_bits(self, i2c) -> int:
+        """I/Oエクスパンダを読み込んで、その状態をビット列で返す
+        :param i2c: I2Cマスタ
+        :return: ピンiがONならビットiが1の整数
+        """
+        buffer = self.buffer
+        i2c.writeto_then_readfrom(self.dev_address, self.command, buffer)
+        return ~(buffer[0] | (buffer[1] << 8)) & 0xFFFF
+
     def assign(self, pin: int, switch: KeySwitch):
         """ピンにキースイッチを割り当てる
         :param pin: ピン番号（0オリジン）
@@ -0,0 +1,177 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import gc
+
+from .clock import ticks_diff
+
+
+class GcScheduler:
+    """キーが押されていない間に、先回りしてgc.collect()を実行する
+    ヒープが一杯になって打鍵中にGCが走るのを避けるため、
+    押されているスイッチもデバウンスやHoldTapの確定待ちも無い状態がquiet_ms続いたら回収する
+    回収はアイドルの間に1回だけで、その後は確保量がregrow_bytes増えたときだけ回収し直す
+    あわせて、1サイクルで確保したメモリ量を数え、alloc_budgetを超えたサイクルを記録する
+
+    Attributes
+    ----------
+    collections:
+        先回りして実行したgc.collect()の回数
+    max_pause_us:
+        gc.collect()にかかった最大時間（µs単位）
+    over_budget:
+        確保量がalloc_budgetを超えたサイクルの数
+    worst_alloc:
+        1サイクルでの最大確保量（バイト）
+    """
+
+    def __init__(self, scanner, quiet_ms: int = 100, min_interval_ms: int = 1000,
+                 alloc_budget: int = 0, check_ms: int = 10, mem_alloc=None, verbose: bool = True,
+                 regrow_bytes: int = 4096):
+        """
+        :param scanner: スキャナ
+        :param quiet_ms: 最後に操作があってから、回収してよいと判断するまでの時間（ms単位）
+        :param min_interval_ms: 回収の最小間隔（ms単位）
+        :param alloc_budget: 1サイクルで確保してよいバイト数（0なら確保量を数えない）
+        :param check_ms: アイドルかどうかを調べる間隔（ms単位）
+        :param mem_alloc: 確保済みのバイト数を返す関数（省略時はgc.mem_alloc、無ければ確保量を数えない）
+        :param verbose: Trueなら、確保量の最大値が更新されたときに警告を表示する
+        :param regrow_bytes: 同じアイドルの間に回収し直す、前回の回収からの確保量の増加（0なら回収し直さない）
+        """
+        self.scanner = scanner
+        self.switches = scanner.switches()
+        self.quiet_ms = quiet_ms
+        self.min_interval_ms = min_interval_ms
+        self.alloc_budget = alloc_budget
+        self.check_ms = check_ms
+        self.mem_alloc = mem_alloc if mem_alloc is not None else getattr(gc, "mem_alloc", None)
+        self.verbose = verbose
+        self.regrow_bytes = regrow_bytes
+
+        now = scanner.clock.now_ms
+        self.last_busy = now
+        self.last_check = now
+        self.last_collect = now
+        self.last_alloc = -1
+        self.collected_alloc = -1
+
+        self.collections = 0
+        self.max_pause_us = 0
+        self.over_budget = 0
+        self.worst_alloc = 0
+        self.cycles = 0
+
+    def is_idle(self) -> bool:
+        """
+        :return: プロセッサに確定待ちが無く、キューが空で、押されているスイッチもデバウンスの確定待ちも無ければTrue
+        """
+        scanner = self.scanner
+        if not scanner.processor.is_idle():
+            return False
+        if not scanner.event_queue.is_empty():
+            return False
+        table = scanner.switch_table
+        if table is not None:
+            return not (table.any_held() or table.any_pending())
+        for switch in self.switches:
+            debouncer = switch.debouncer
+            if debouncer.current or debouncer.count:
+                return False
+        return True
+
+    def begin_cycle(self):
+        """スキャンサイクルの前に呼ぶ（確保量を数えない場合は何もしない）
+        """
+        if self.alloc_budget > 0 and self.mem_alloc is not None:
+            self.last_alloc = self.mem_alloc()
+
+    def end_cycle(self, now: int):
+        """スキャンサイクルの後に呼ぶ
+        :param now: 現在時刻（ms単位）
+        """
+        self.cycles += 1
+        if self.last_alloc >= 0:
+            allocated = self.mem_alloc() - self.last_alloc
+            self.last_alloc = -1
+            # 負ならサイクル中にGCが走ったので数えない
+            if allocated > self.alloc_budget:
+                self.over_budget += 1
+                if allocated > self.worst_alloc:
+                    self.worst_alloc = allocated
+                    if self.verbose:
+                        print("Warning: cycle allocated %d bytes (budget %d)" % (allocated, self.alloc_budget))
+            elif allocated > self.worst_alloc:
+                self.worst_alloc = allocated
+
+        if ticks_diff(now, self.last_check) < self.check_ms:
+            return
+        self.last_check = now
+        # 回収しない間もlast_busyを更新しておかないと、最小間隔が過ぎた直後に打鍵の途中で回収してしまう
+        if not self.is_idle():
+            self.last_busy = now
+            return
+        if ticks_diff(now, self.last_busy) < self.quiet_ms:
+            return
+        if ticks_diff(now, self.last_collect) < self.min_interval_ms:
+            return
+        if self.collections and ticks_diff(self.last_collect, self.last_busy) >= 0 and not self.regrown():
+            # このアイドルの間はもう回収したので、確保量が増えていなければ何もしない
+            return
+        self.collect(now)
+
+    def regrown(self) -> bool:
+        """
+        :return: 前回の回収から確保量がregrow_bytes以上増えていればTrue
+        """
+        if self.regrow_bytes <= 0 or self.mem_alloc is None or self.collected_alloc < 0:
+            return False
+        return self.mem_alloc() - self.collected_alloc >= self.regrow_bytes
+
+    def collect(self, now: int):
+        """gc.collect()を実行して、かかった時間を記録する
+        :param now: 現在時刻（ms単位）
+        """
+        clock = self.scanner.clock
+        started = clock.read_us()
+        gc.collect()
+        pause = ticks_diff(clock.read_us(), started)
+        if pause > self.max_pause_us:
+            self.max_pause_us = pause
+        self.collections += 1
+        self.last_collect = now
+        if self.mem_alloc is not None:
+            self.collected_alloc = self.mem_alloc()
+
+    def report(self) -> dict:
+        """
+        :return: 回収回数、最大停止時間、予算超過のサイクル数、最大確保量
+        """
+        return {
+            "cycles": self.cycles,
+            "collections": self.collections,
+            "max_pause_us": self.max_pause_us,
+            "over_budget": self.over_budget,
+            "worst_alloc": self.worst_alloc,
+        }
+
+    def print_report(self):
+        print("gc: collections %d, max pause %d us, over budget %d/%d cycles, worst %d bytes" % (
+            self.collections, self.max_pause_us, self.over_budget, self.cycles, self.worst_alloc))
@@ -0,0 +1,281 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .key_code import KeyCode
+from .sender import Sender
+from .latency import STAGE_SEND
+
+
+# ブートプロトコル互換の6KROレポート（モディファイア、予約、キー6個）
+BOOT_REPORT_LENGTH = 8
+# NKROレポートのビットマップが扱うキーコードの範囲（0x00〜0xDF、モディファイアは先頭のバイト）
+NKRO_KEY_COUNT = 0xE0
+# NKROレポート（モディファイア1バイト + ビットマップ28バイト）
+NKRO_REPORT_LENGTH = 1 + NKRO_KEY_COUNT // 8
+NKRO_REPORT_ID = 4
+
+# usb_hid.get_boot_device()がキーボードのブートプロトコルを返す値
+BOOT_KEYBOARD = 1
+
+
+def nkro_descriptor(report_id: int = NKRO_REPORT_ID) -> bytes:
+    """
+    :param report_id: レポートID
+    :return: NKROビットマップキーボードのHIDレポートディスクリプタ
+    """
+    return bytes((
+        0x05, 0x01,         # Usage Page (Generic Desktop)
+        0x09, 0x06,         # Usage (Keyboard)
+        0xA1, 0x01,         # Collection (Application)
+        0x85, report_id,    #   Report ID
+        0x05, 0x07,         #   Usage Page (Keyboard)
+        0x19, 0xE0,         #   Usage Minimum (Left Control)
+        0x29, 0xE7,         #   Usage Maximum (Right GUI)
+        0x15, 0x00,         #   Logical Minimum (0)
+        0x25, 0x01,         #   Logical Maximum (1)
+        0x75, 0x01,         #   Report Size (1)
+        0x95, 0x08,         #   Report Count (8)
+        0x81, 0x02,         #   Input (Data, Variable, Absolute) モディファイア
+        0x19, 0x00,         #   Usage Minimum (0)
+        0x29, NKRO_KEY_COUNT - 1,   # Usage Maximum (0xDF)
+        0x95, NKRO_KEY_COUNT,       # Report Count (224)
+        0x81, 0x02,         #   Input (Data, Variable, Absolute) ビットマップ
+        0x05, 0x08,         #   Usage Page (LEDs)
+        0x19, 0x01,         #   Usage Minimum (Num Lock)
+        0x29, 0x05,         #   Usage Maximum (Kana)
+        0x95, 0x05,         #   Report Count (5)
+        0x91, 0x02,         #   Output (Data, Variable, Absolute) LED
+        0x95, 0x01,         #   Report Count (1)
+        0x75, 0x03,         #   Report Size (3)
+        0x91, 0x01,         #   Output (Constant) パディング
+        0xC0,               # End Collection
+    ))
+
+
+def nkro_device(report_id: int = NKRO_REPORT_ID):
+    """
+    :param report_id: レポートID
+    :return: NKROキーボードのusb_hid.Device
+    """
+    import usb_hid
+    return usb_hid.Device(
+        report_descriptor=nkro_descriptor(report_id),
+        usage_page=0x01,
+        usage=0x06,
+        report_ids=(report_id,),
+        in_report_lengths=(NKRO_REPORT_LENGTH,),
+        out_report_lengths=(1,),
+    )
+
+
+def enable_nkro(extra_devices: tuple = (), bios: bool = False):
+    """boot.pyから呼んで、ブート互換キーボードとNKROキーボードを有効にする
+    ホストがブートプロトコルを要求したときは、ブート互換キーボードが使われる
+    BIOS/UEFIはブートキーボードがUSBインターフェース0に無いと認識しないことが多く、
+    シリアル（REPL）やCIRCUITPYドライブが有効だとインターフェース0にならない
+    biosをTrueにするとこれらを無効にするので、ファイルを書き換えるにはセーフモードで起動する
+    :param extra_devices: 一緒に有効にするデバイス（マウス等）
+    :param bios: Trueなら、BIOS/UEFIで使えるようにUSBシリアル、MIDI、ドライブを無効にする
+    """
+    import usb_hid
+    if bios:
+        import storage
+        import usb_cdc
+        storage.disable_usb_drive()
+        usb_cdc.disable()
+        try:
+            import usb_midi
+            usb_midi.disable()
+        except ImportError:
+            # usb_midiの無いボード
+            pass
+    usb_hid.enable((usb_hid.Device.KEYBOARD, nkro_device()) + tuple(extra_devices), boot_device=BOOT_KEYBOARD)
+
+
+def keyboard_devices(devices) -> list:
+    """
+    :param devices: usb_hid.devices
+    :return: キーボードのデバイス（有効にした順）
+    """
+    return [d for d in devices if d.usage_page == 0x01 and d.usage == 0x06]
+
+
+class BootReport:
+    """ブートプロトコル互換の6KROレポート
+    7個目以降の同時押しは無視する（droppedに数える）
+    """
+
+    def __init__(self):
+        self.report = bytearray(BOOT_REPORT_LENGTH)
+        self.dropped = 0
+
+    def press(self, key_code: int) -> bool:
+        """
+        :param key_code: キーコード
+        :return: レポートが変わったらTrue
+        """
+        report = self.report
+        if KeyCode.L_CTRL <= key_code <= KeyCode.R_GUI:
+            bit = 1 << (key_code - KeyCode.L_CTRL)
+            if report[0] & bit:
+                return False
+            report[0] |= bit
+            return True
+        free = 0
+        for i in range(2, BOOT_REPORT_LENGTH):
+            code = report[i]
+            if code == key_code:
+                return False
+            if code == 0 and free == 0:
+                free = i
+        if free == 0:
+            self.dropped += 1
+            return False
+        report[free] = key_code
+        return True
+
+    def release(self, key_code: int) -> bool:
+        """
+        :param key_code: キーコード
+        :return: レポートが変わったらTrue
+        """
+        report = self.report
+        if KeyCode.L_CTRL <= key_code <= KeyCode.R_GUI:
+            bit = 1 << (key_code - KeyCode.L_CTRL)
+            if not report[0] & bit:
+                return False
+            report[0] &= ~bit
+            return True
+        for i in range(2, BOOT_REPORT_LENGTH):
+            if report[i] == key_code:
+                report[i] = 0
+                return True
+        return False
+
+    def clear(self):
+        for i in range(BOOT_REPORT_LENGTH):
+            self.report[i] = 0
+
+
+class NkroReport:
+    """NKROのビットマップレポート
+    押下と解放はビット演算だけで、メモリを確保しない
+    """
+
+    def __init__(self):
+        self.report = bytearray(NKRO_REPORT_LENGTH)
+
+    def press(self, key_code: int) -> bool:
+        """
+        :param key_code: キーコード
+        :return: レポートが変わったらTrue（範囲外のキーコードは無視する）
+        """
+        if KeyCode.L_CTRL <= key_code <= KeyCode.R_GUI:
+            at = 0
+            bit = 1 << (key_code - KeyCode.L_CTRL)
+        elif 0 < key_code < NKRO_KEY_COUNT:
+            at = 1 + (key_code >> 3)
+            bit = 1 << (key_code & 7)
+        else:
+            return False
+        report = self.report
+        if report[at] & bit:
+            return False
+        report[at] |= bit
+        return True
+
+    def release(self, key_code: int) -> bool:
+        """
+        :param key_code: キーコード
+        :return: レポートが変わったらTrue
+        """
+        if KeyCode.L_CTRL <= key_code <= KeyCode.R_GUI:
+            at = 0
+            bit = 1 << (key_code - KeyCode.L_CTRL)
+        elif 0 < key_code < NKRO_KEY_COUNT:
+            at = 1 + (key_code >> 3)
+            bit = 1 << (key_code & 7)
+        else:
+            return False
+        report = self.report
+        if not report[at] & bit:
+            return False
+        report[at] &= ~bit
+        return True
+
+    def clear(self):
+        for i in range(NKRO_REPORT_LENGTH):
+            self.report[i] = 0
+
+
+class NkroSender(Sender):
+    """NKROのビットマップレポートでキーコードを送出するクラス
+    boot.pyでenable_nkro()を呼んでおくこと
+    ホストがブートプロトコルを要求している間（BIOS等）は、6KROのブート互換レポートを送る
+    両方のレポートを常に更新しているので、途中でプロトコルが変わっても押下状態は保たれる
+    """
+
+    def __init__(self, devices=None):
+        """
+        :param devices: usb_hid.devices（省略時はusb_hid.devices）
+        """
+        import usb_hid
+        self.usb_hid = usb_hid
+        keyboards = keyboard_devices(usb_hid.devices if devices is None else devices)
+        if len(keyboards) < 2:
+            raise RuntimeError("NKRO keyboard is not enabled; call enable_nkro() in boot.py")
+        super().__init__(None)
+        self.boot_device = keyboards[0]
+        self.nkro_device = keyboards[1]
+        self.boot = BootReport()
+        self.nkro = NkroReport()
+
+    def boot_protocol(self) -> bool:
+        """
+        :return: ホストがキーボードのブートプロトコルを要求していればTrue
+        """
+        return self.usb_hid.get_boot_device() == BOOT_KEYBOARD
+
+    def send(self):
+        """現在のレポートを送る"""
+        if self.boot_protocol():
+            self.boot_device.send_report(self.boot.report)
+        else:
+            self.nkro_device.send_report(self.nkro.report)
+
+    def press(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
+        changed = self.boot.press(key_code)
+        if self.nkro.press(key_code) or changed:
+            self.send()
+
+    def release(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
+        changed = self.boot.release(key_code)
+        if self.nkro.release(key_code) or changed:
+            self.send()
+
+    def release_all(self):
+        self.boot.clear()
+        self.nkro.clear()
+        self.send()
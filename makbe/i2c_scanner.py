@@ -5,11 +5,14 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 from .key_event import KeyPressed, KeyReleased
+from .key_switch import NopSwitch
 from .io_expander import IoExpander
 from .processor import Processor
 from .scanner import Scanner
 from .event_queue import EventQueue
-from time import monotonic_ns
+from .clock import ticks_diff
+from .latency import STAGE_READ
+from .boot import boot_mark
 
 
 class I2CScanner(Scanner):
@@ -17,52 +20,123 @@ class I2CScanner(Scanner):
     moduloアーキテクチャに基づいたスキャナ
     """
 
-    def __init__(self, expanders: [IoExpander], i2c, processor: Processor):
+    def __init__(self, expanders: [IoExpander], i2c, processor: Processor, clock=None,
+                 direct: bool = False, lazy_init: bool = False):
         """
         :param expanders: I/Oエクスパンダのリスト
         :param i2c: I2Cマスタ
         :param processor: キーイベントを処理するオブジェクト
+        :param clock: 時計（省略時はMonotonicClock）
+        :param direct: Trueならキューを通さず、イベントを直接プロセッサに渡す
+        :param lazy_init: Trueなら、I/Oエクスパンダの初期化をスキャンのたびに1つずつ行う
+            （最初のスキャンまでの時間が短くなる。初期化が済んだエクスパンダから読み始める）
         """
-        self.processor = processor
+        super().__init__(EventQueue(), processor, clock, direct)
         self.expanders = expanders
         self.i2c = i2c
-        self.event_queue = EventQueue()
-        for d in expanders:
-            d.init_device(i2c)
+        self.ready = []
+        self.uninitialized = list(expanders)
+        if not lazy_init:
+            while self.uninitialized:
+                self.init_next()
+        self.compile_plan()
+        boot_mark("i2c scanner")
 
-    def scan(self):
+    def init_next(self):
+        """まだ初期化していないI/Oエクスパンダを1つ初期化して、スキャン計画に加える
         """
-        I/Oエクスパンダをスキャンして、キューに渡す
-        """
-        now = monotonic_ns() // 1000 // 1000
-
-        # キューを使った並行処理モード
-        for d in self.expanders:
-            for i, p in enumerate(d.read_device(self.i2c)):
-                switch = d.switch(i)
-                event = switch.update(p)
-                if isinstance(event, KeyPressed) or isinstance(event, KeyReleased):
-                    self.event_queue.enqueue(event, now)
+        d = self.uninitialized.pop(0)
+        d.init_device(self.i2c)
+        self.ready.append(d)
+        if not self.uninitialized:
+            boot_mark("init expanders")
 
-    def process_events(self):
+    def compile_plan(self):
+        """I/Oエクスパンダへのスイッチの割り当てから、スキャン計画を作る
+        計画はエクスパンダごとの (エクスパンダ, 割り当て済みピンのマスク, ((ビットマスク, スイッチ, スイッチID), ...), 読み飛ばし可否)
+        スイッチIDは状態表の行番号（状態表を使わなければ-1）
+        NopSwitchが置かれたピンは計画に含めない
+        割り当てを変更したときは、このメソッドを呼び直すこと
         """
-        キューに溜まったイベントをプロセッサで処理する
-        """
-        now = monotonic_ns() // 1000 // 1000
+        counts = {}
+        for d in self.expanders:
+            for switch in d.switches:
+                counts[id(switch)] = counts.get(id(switch), 0) + 1
 
-        # キューから全てのイベントを処理
-        while not self.event_queue.is_empty():
-            item = self.event_queue.dequeue()
-            if item is not None:
-                event, timestamp = item
-                self.processor.put(event, timestamp)
+        table = self.switch_table
+        plan = []
+        for d in self.ready:
+            assigned = 0
+            entries = []
+            skippable = True
+            for i, switch in enumerate(d.switches):
+                if isinstance(switch, NopSwitch):
+                    continue
+                assigned |= 1 << i
+                entries.append((1 << i, switch, table.add(switch) if table is not None else -1))
+                if counts[id(switch)] > 1:
+                    # 複数のピンに割り当てられたスイッチは、他のピンでも更新されるので読み飛ばせない
+                    skippable = False
+            plan.append((d, assigned, tuple(entries), skippable))
+        self.plan = plan
+        # エクスパンダごとの、全スイッチのデバウンスが落ち着いているときのビット列（-1は未確定）
+        self.settled = [-1] * len(plan)
 
-        # 最後にtickを呼び出す
-        self.processor.tick(now)
+    def switches(self) -> list:
+        result = []
+        seen = set()
+        for d in self.expanders:
+            for switch in d.switches:
+                if id(switch) not in seen:
+                    seen.add(id(switch))
+                    result.append(switch)
+        return result
 
-    def update(self):
+    def poll(self, now: int):
         """
-        スキャンとイベント処理を両方実行（統合モード）
+        I/Oエクスパンダをスキャンして、キューに渡す
+        読み取ったビット列が前回落ち着いていたときと同じなら、そのエクスパンダのスイッチは更新しない
+        :param now: 現在時刻（ms単位）
         """
-        self.scan()
-        self.process_events()
\ No newline at end of file
+        if self.uninitialized:
+            self.init_next()
+            self.compile_plan()
+        monitor = self.monitor
+        i2c = self.i2c
+        settled = self.settled
+        enqueue = self.sink.enqueue
+        table = self.switch_table
+        for g, (d, assigned, entries, skippable) in enumerate(self.plan):
+            if monitor is not None:
+                started = self.clock.read_us()
+            bits = d.read_bits(i2c)
+            if monitor is not None:
+                monitor.record(STAGE_READ, ticks_diff(self.clock.read_us(), started))
+            if bits is None:
+                continue
+            bits &= assigned
+            if bits == settled[g]:
+                continue
+            pending = False
+            if table is not None:
+                # 状態表の行を直接更新し、変化したときだけイベントを作る
+                update = table.update
+                current = table.current
+                count = table.count
+                for mask, switch, index in entries:
+                    if update(index, bits & mask != 0, now):
+                        if monitor is not None:
+                            self.record_debounce(switch, now)
+                        enqueue(KeyPressed(switch) if current[index] else KeyReleased(switch), now)
+                    if count[index]:
+                        pending = True
+            else:
+                for mask, switch, index in entries:
+                    event = switch.update(bits & mask != 0, now)
+                    if isinstance(event, KeyPressed) or isinstance(event, KeyReleased):
+                        if monitor is not None:
+                            self.record_debounce(switch, now)
+                        enqueue(event, now)
+                    if switch.debouncer.count:
+                        pending = True
+            settled[g] = -1 if pending or not skippable else bits
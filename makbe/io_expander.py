@@ -19,7 +19,7 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from makbe.key_switch import KeySwitch
+from .key_switch import KeySwitch
 try:
     from typing import Optional, List, Any, Tuple, Union
 except ImportError:
@@ -29,6 +29,11 @@ except ImportError:
 class IoExpander:
     """I/Oエクスパンダのインターフェース
     このインターフェースを実装するクラスはI2Cを介したIOエクスパンダの具体的実装を提供します。
+
+    Attributes
+    ----------
+    switches:
+        ピンごとに割り当てられたキースイッチのリスト
     """
 
     def init_device(self, i2c) -> bool:
@@ -52,6 +57,22 @@ class IoExpander:
         """
         pass
 
+    def read_bits(self, i2c) -> Optional[int]:
+        """I/Oエクスパンダを読み込んで、その状態をビット列で返す
+        デフォルトではread_device()の結果をビット列にする
+        実装するクラスでは、確保済みのバッファを使って直接ビット列を作るとよい
+        :param i2c: I2Cマスタ（busio.I2C等）
+        :return: ピンiがONならビットiが1の整数。読み取り失敗時はNone。
+        """
+        states = self.read_device(i2c)
+        if states is None:
+            return None
+        bits = 0
+        for i, p in enumerate(states):
+            if p:
+                bits |= 1 << i
+        return bits
+
     def assign(self, pin: int, switch: KeySwitch):
         """ピンにキースイッチを割り当てる
         :param pin: ピン番号（0オリジン）
@@ -27,6 +27,8 @@ class KeyEvent(object):
     KeyPressedとKeyReleasedがこれを継承している
     """
 
+    __slots__ = ("switch",)
+
     def __init__(self, switch):
         """
         :param switch: 割り当てるキースイッチ
@@ -50,6 +52,8 @@ class KeyPressed(KeyEvent):
     """キーが押されたときのイベント
     """
 
+    __slots__ = ()
+
     def __init__(self, switch):
         """
         :param switch: 割り当てるキースイッチ
@@ -67,6 +71,8 @@ class KeyReleased(KeyEvent):
     """キーが話されたときのイベント
     """
 
+    __slots__ = ()
+
     def __init__(self, switch):
         """
         :param switch: 割り当てるキースイッチ
@@ -19,7 +19,7 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from .actions import Action, TransAction, NoOpAction
+from .actions import Action, NOP, TRANS
 from .key_event import KeyEvent, KeyPressed, KeyReleased
 try:
     from typing import Optional, List, Any, Tuple, Union
@@ -32,6 +32,8 @@ class Debouncer:
     """KeySwitchが使うチャタリング防止機構
     """
 
+    __slots__ = ("current", "pressed", "count", "limit", "changed_at")
+
     def __init__(self, limit: int):
         """規定回数を指定してオブジェクトを生成
         :param limit: チャタリングではないと判定する回数
@@ -40,10 +42,12 @@ class Debouncer:
         self.pressed = False
         self.count = 0
         self.limit = limit
+        self.changed_at = 0
 
-    def update(self, pressed: bool) -> bool:
+    def update(self, pressed: bool, now: int = 0) -> bool:
         """状態更新
         :param pressed: ピンの状態（ONならTrue）
+        :param now: 現在時刻（ms単位）。ピンが変化し始めた時刻としてchanged_atに記録する
         :return: 変化があったらTrue
         """
         if self.current == pressed:
@@ -51,10 +55,14 @@ class Debouncer:
             return False
         else:
             if self.pressed == pressed:
+                if self.count == 0:
+                    # チャタリングで戻った後の変化は、ここから数え直す
+                    self.changed_at = now
                 self.count += 1
             else:
                 self.pressed = pressed
                 self.count = 1
+                self.changed_at = now
             if self.count > self.limit:
                 self.current = self.pressed
                 self.count = 0
@@ -75,10 +83,16 @@ class KeySwitch:
         未指定レイヤを使われたときのアクション
     debounce:
         チャタリング防止の回数
+    debouncer:
+        チャタリング防止機構。SwitchTableに登録すると、表の1行を指すTableDebouncerになる
+    revision:
+        アクションを変更するたびに増える番号。プロセッサはこれを見てキャッシュを捨てる
     """
 
+    __slots__ = ("actions", "default_action", "debouncer", "revision")
+
     def __init__(self, actions: List[Action],
-                 default_action: Action = TransAction(),
+                 default_action: Action = TRANS,
                  debounce: int = 2):
         """
         :param actions: 対応するアクション（最下層に割り当てられる）
@@ -88,13 +102,15 @@ class KeySwitch:
         self.actions = actions
         self.default_action = default_action
         self.debouncer = Debouncer(debounce)
+        self.revision = 0
 
-    def update(self, pressed: bool) -> KeyEvent:
+    def update(self, pressed: bool, now: int = 0) -> KeyEvent:
         """状態更新
         :param pressed: ピンの状態（ONならTrue）
+        :param now: 現在時刻（ms単位）
         :return: 変化が無ければ、KeyPressedでもKeyReleasedでもないKeyEventを返す。変化があればそのイベントを返す。
         """
-        if not self.debouncer.update(pressed):
+        if not self.debouncer.update(pressed, now):
             return KeyEvent(self)
         elif self.debouncer.current:
             return KeyPressed(self)
@@ -117,6 +133,7 @@ class KeySwitch:
         :return: 自分自身を返す（メソッドチェイン用）
         """
         self.actions.append(action)
+        self.revision += 1
         return self
 
     def append_actions(self, actions: List[Action]):
@@ -126,6 +143,17 @@ class KeySwitch:
         """
         for a in actions:
             self.actions.append(a)
+        self.revision += 1
+        return self
+
+    def set_actions(self, actions: List[Action]):
+        """アクションをまとめて置き換える
+        押されている最中でも、離したときは押したときのアクションで処理される
+        :param actions: 新しいアクション（最下層から順に）
+        :return: 自分自身を返す（メソッドチェイン用）
+        """
+        self.actions = list(actions)
+        self.revision += 1
         return self
 
     def remove_layers(self, remove_all: bool = False):
@@ -139,14 +167,23 @@ class KeySwitch:
         else:
             while len(self.actions) > 1:
                 self.actions.pop()
+        self.revision += 1
         return self
 
 
+class NopSwitch(KeySwitch):
+    """何も割り当てられていないピンに置いておくキースイッチ
+    スキャナはこのスイッチが置かれたピンを読み飛ばす
+    """
+
+    __slots__ = ()
+
+
 def nop_switch() -> KeySwitch:
     """
     :return: 何もしないキースイッチ（デフォルト値用）
     """
-    return KeySwitch([NoOpAction()], NoOpAction())
+    return NopSwitch([NOP], NOP)
 
 
-EMPTY_SWITCH = KeySwitch([NoOpAction()], NoOpAction())
\ No newline at end of file
+EMPTY_SWITCH = NopSwitch([NOP], NOP)
\ No newline at end of file
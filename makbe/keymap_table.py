@@ -0,0 +1,257 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .actions import Action, NOP, TRANS, kc, la, ht, cmd, mc_tuple
+from .key_switch import KeySwitch
+
+try:
+    from typing import List
+except ImportError:
+    # CircuitPythonランタイムでは型ヒントをスキップ
+    pass
+
+
+# キーマップ表の形式
+#
+#   ヘッダ（12バイト、リトルエンディアン）
+#     0  b"MK"
+#     2  バージョン（u8）
+#     3  レイヤ数 L（u8）
+#     4  スイッチ数 N（u16）
+#     6  追加セル数 E（u16）
+#     8  キーコード列のバイト数 P（u16）
+#     10 スイッチ名のバイト数 S（u16）
+#   セル（4バイト × N × L）スイッチiのレイヤlは i * L + l 番目
+#   追加セル（4バイト × E）HoldTapのhold、tap、timeout
+#   キーコード列（Pバイト）MultipleKeyCodesのキーコード
+#   スイッチ名（Sバイト）改行区切りのASCII
+#
+# セルは (オペコード u8, 引数 u8, 値 u16)
+MAGIC = b"MK"
+VERSION = 1
+HEADER_SIZE = 12
+CELL_SIZE = 4
+
+OP_TRANS = 0       # レイヤの下のアクションを使う
+OP_NOP = 1         # 何もしない
+OP_KEY = 2         # 値: キーコード
+OP_KEYS = 3        # 引数: キーコードの数、値: キーコード列の中の位置
+OP_LAYER = 4       # 値: レイヤ番号
+OP_HOLD_TAP = 5    # 値: 追加セルの位置（hold、tap、timeoutの順に3セル）
+OP_TIMEOUT = 6     # 値: HoldTapの判別時間（ms単位）
+OP_SENDER = 7      # 引数: SENDER_COMMANDSの中のコマンドの番号、値: コマンドの引数
+
+# OP_SENDERのセルに書けるセンダーのコマンド（番号は表に書き込むので、末尾にだけ追加する）
+SENDER_COMMANDS = ("bt", "bt_clear", "out", "out_all", "out_auto")
+
+
+class KeymapTable:
+    """キーマップ表（makbe_host.keymap_compilerで生成したバイト列）を読むクラス
+    セルを読むたびにアクションを組み立てるが、kc()等の共有されたアクションを返すので、
+    同じセルから同じアクションが得られ、メモリも確保しない
+    """
+
+    def __init__(self, blob: bytes):
+        """
+        :param blob: キーマップ表
+        """
+        if blob[0:2] != MAGIC or blob[2] != VERSION:
+            raise ValueError("not a makbe keymap table")
+        self.blob = blob
+        self.layers = blob[3]
+        self.count = blob[4] | (blob[5] << 8)
+        extra = blob[6] | (blob[7] << 8)
+        keys = blob[8] | (blob[9] << 8)
+        self.cells_at = HEADER_SIZE
+        self.extra_at = self.cells_at + self.count * self.layers * CELL_SIZE
+        self.keys_at = self.extra_at + extra * CELL_SIZE
+        self.names_at = self.keys_at + keys
+        # MultipleKeyCodesとHoldTapは組み立てにタプルが要るので、セルの位置ごとに覚えておく
+        self.decoded = {}
+
+    @staticmethod
+    def load(path: str):
+        """
+        :param path: キーマップ表のファイル
+        :return: 読み込んだKeymapTable
+        """
+        with open(path, "rb") as f:
+            return KeymapTable(f.read())
+
+    def action(self, index: int, layer: int) -> Action:
+        """
+        :param index: スイッチの番号
+        :param layer: レイヤ番号
+        :return: 指定されたスイッチとレイヤのアクション（表に無いレイヤはTRANS）
+        """
+        if layer >= self.layers:
+            return TRANS
+        return self._decode(self.cells_at + (index * self.layers + layer) * CELL_SIZE)
+
+    def _decode(self, at: int) -> Action:
+        blob = self.blob
+        op = blob[at]
+        if op == OP_TRANS:
+            return TRANS
+        if op == OP_NOP:
+            return NOP
+        value = blob[at + 2] | (blob[at + 3] << 8)
+        if op == OP_KEY:
+            return kc(value)
+        if op == OP_LAYER:
+            return la(value)
+        action = self.decoded.get(at)
+        if action is not None:
+            return action
+        if op == OP_KEYS:
+            start = self.keys_at + value
+            action = mc_tuple(tuple(blob[start:start + blob[at + 1]]))
+        elif op == OP_SENDER:
+            action = cmd(SENDER_COMMANDS[blob[at + 1]], value)
+        elif op == OP_HOLD_TAP:
+            extra = self.extra_at + value * CELL_SIZE
+            timeout_at = extra + 2 * CELL_SIZE
+            timeout = blob[timeout_at + 2] | (blob[timeout_at + 3] << 8)
+            action = ht(self._decode(extra), self._decode(extra + CELL_SIZE), timeout)
+        else:
+            raise ValueError("unknown keymap opcode %d" % op)
+        self.decoded[at] = action
+        return action
+
+    def names(self) -> list:
+        """
+        :return: スイッチ名のリスト（スイッチの番号順）
+        """
+        data = self.blob[self.names_at:]
+        if not data:
+            return []
+        return str(data, "ascii").split("\n")
+
+    def switch(self, index: int, debounce: int = 2) -> KeySwitch:
+        """
+        :param index: スイッチの番号
+        :param debounce: チャタリング防止の回数
+        :return: 表を参照するキースイッチ
+        """
+        return TableSwitch(self, index, debounce)
+
+    def build_switches(self, debounce: int = 2) -> List[KeySwitch]:
+        """
+        :param debounce: チャタリング防止の回数
+        :return: 全スイッチのリスト（スイッチの番号順）
+        """
+        return [TableSwitch(self, i, debounce) for i in range(self.count)]
+
+    def namespace(self, debounce: int = 2):
+        """keyboard_*.pyのSwitchesの代わりに使う、スイッチ名を属性に持つオブジェクトを作る
+        :param debounce: チャタリング防止の回数
+        :return: sw.escのようにスイッチを参照できるオブジェクト
+        """
+        sw = TableSwitches()
+        for i, name in enumerate(self.names()):
+            setattr(sw, name, TableSwitch(self, i, debounce))
+        return sw
+
+
+class TableSwitches:
+    """KeymapTable.namespace()が返す、スイッチ名を属性に持つオブジェクト
+    """
+    pass
+
+
+class TableActions:
+    """TableSwitchのactionsとして使う、表の1行の読み取り専用のビュー
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: KeymapTable, index: int):
+        self.table = table
+        self.index = index
+
+    def __len__(self) -> int:
+        return self.table.layers
+
+    def __getitem__(self, layer: int) -> Action:
+        if layer < 0:
+            layer += self.table.layers
+        if layer < 0 or layer >= self.table.layers:
+            raise IndexError("layer out of range")
+        return self.table.action(self.index, layer)
+
+
+class TableSwitch(KeySwitch):
+    """アクションをKeymapTableから読むキースイッチ
+    append_action()等でキーマップを変更すると、その時点でアクションをリストに展開して、
+    以降は通常のKeySwitchと同じように振る舞う
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: KeymapTable, index: int, debounce: int = 2):
+        """
+        :param table: キーマップ表
+        :param index: スイッチの番号
+        :param debounce: チャタリング防止の回数
+        """
+        super().__init__(TableActions(table, index), TRANS, debounce)
+        self.table = table
+        self.index = index
+
+    def action(self, layer: int) -> Action:
+        """
+        :param layer: レイヤ番号
+        :return: 指定されたレイヤのアクションを返す
+        """
+        if self.table is None:
+            return KeySwitch.action(self, layer)
+        return self.table.action(self.index, layer)
+
+    def _expand(self):
+        if self.table is not None:
+            self.actions = [self.table.action(self.index, layer) for layer in range(self.table.layers)]
+            self.table = None
+
+    def set_table(self, table: KeymapTable, index: int):
+        """参照する表を切り替える
+        :param table: 新しいキーマップ表
+        :param index: 新しい表でのスイッチの番号
+        """
+        self.actions = TableActions(table, index)
+        self.table = table
+        self.index = index
+        self.revision += 1
+
+    def set_actions(self, actions: List[Action]):
+        self.table = None
+        return KeySwitch.set_actions(self, actions)
+
+    def append_action(self, action: Action):
+        self._expand()
+        return KeySwitch.append_action(self, action)
+
+    def append_actions(self, actions: List[Action]):
+        self._expand()
+        return KeySwitch.append_actions(self, actions)
+
+    def remove_layers(self, remove_all: bool = False):
+        self._expand()
+        return KeySwitch.remove_layers(self, remove_all)
@@ -0,0 +1,178 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from array import array
+
+from .clock import ticks_diff
+
+
+# 計測するステージ
+STAGE_READ = 0       # I/Oエクスパンダ（またはマトリクスの1列）の読み取りにかかった時間
+STAGE_DEBOUNCE = 1   # ピンの変化からデバウンスで確定するまでの時間
+STAGE_ENQUEUE = 2    # サイクル開始からEventQueueに入るまでの時間
+STAGE_PUT = 3        # サイクル開始からProcessor.put()に渡るまでの時間
+STAGE_HOLD = 4       # HoldTapが押されてからホールドが有効になるまでの時間
+STAGE_SEND = 5       # サイクル開始からSender.press()/release()までの時間
+STAGE_CYCLE = 6      # 1サイクル全体の時間
+
+STAGE_NAMES = ("read", "debounce", "enqueue", "put", "hold", "send", "cycle")
+
+
+class Histogram:
+    """µs単位の値を数える固定サイズのヒストグラム
+    ビンiには 2^(i-1) 以上 2^i 未満の値が入る（ビン0は0）
+    """
+
+    BINS = 24
+
+    def __init__(self):
+        self.bins = array("L", [0] * self.BINS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value: int):
+        """
+        :param value: 値（µs単位）
+        """
+        if value < 0:
+            value = 0
+        b = 0
+        v = value
+        while v:
+            v >>= 1
+            b += 1
+        if b >= self.BINS:
+            b = self.BINS - 1
+        self.bins[b] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def percentile(self, p: float) -> int:
+        """
+        :param p: パーセンタイル（0〜100）
+        :return: その値が入るビンの上限（µs単位）
+        """
+        if self.count == 0:
+            return 0
+        target = self.count * p / 100
+        seen = 0
+        for b in range(self.BINS):
+            seen += self.bins[b]
+            if seen >= target and seen > 0:
+                return min((1 << b) - 1, self.max)
+        return self.max
+
+    def reset(self):
+        for b in range(self.BINS):
+            self.bins[b] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class LatencyMonitor:
+    """スキャンからHIDレポートまでの、ステージごとの遅延を計測する
+    Scanner.attach_monitor()で取り付けると、スキャナ、キュー、プロセッサ、センダーに記録させる
+    取り付けていなければ、各ステージの計測コストはNoneとの比較だけ
+    """
+
+    def __init__(self, clock, cycle_budget_us: int = 1000):
+        """
+        :param clock: 時計（スキャナと同じもの）
+        :param cycle_budget_us: 1サイクルの時間の上限。超えたらオーバーランとして数える
+        """
+        self.clock = clock
+        self.cycle_budget_us = cycle_budget_us
+        self.histograms = [Histogram() for _ in STAGE_NAMES]
+        self.cycle_start = 0
+        self.cycles = 0
+        self.overruns = 0
+
+    def begin_cycle(self, now_us: int):
+        """
+        :param now_us: サイクル開始時刻（µs単位）
+        """
+        self.cycle_start = now_us
+
+    def end_cycle(self):
+        elapsed = ticks_diff(self.clock.read_us(), self.cycle_start)
+        self.histograms[STAGE_CYCLE].add(elapsed)
+        self.cycles += 1
+        if elapsed > self.cycle_budget_us:
+            self.overruns += 1
+
+    def record(self, stage: int, us: int):
+        """
+        :param stage: ステージ（STAGE_*）
+        :param us: 時間（µs単位）
+        """
+        self.histograms[stage].add(us)
+
+    def mark(self, stage: int):
+        """サイクル開始からの時間を記録する
+        :param stage: ステージ（STAGE_*）
+        """
+        self.histograms[stage].add(ticks_diff(self.clock.read_us(), self.cycle_start))
+
+    def histogram(self, name: str) -> Histogram:
+        """
+        :param name: ステージ名（"read"、"send"等）
+        """
+        return self.histograms[STAGE_NAMES.index(name)]
+
+    def reset(self):
+        for h in self.histograms:
+            h.reset()
+        self.cycles = 0
+        self.overruns = 0
+
+    def report(self) -> dict:
+        """
+        :return: ステージ名ごとの集計と、サイクル数、オーバーラン数
+        """
+        result = {}
+        for name, h in zip(STAGE_NAMES, self.histograms):
+            result[name] = h.summary()
+        result["cycles"] = self.cycles
+        result["overruns"] = self.overruns
+        return result
+
+    def print_report(self):
+        print("stage      count     mean      p50      p99      max (us)")
+        for name, h in zip(STAGE_NAMES, self.histograms):
+            print("%-8s %7d %8d %8d %8d %8d" % (
+                name, h.count, int(h.mean()), h.percentile(50), h.percentile(99), h.max))
+        print("cycles: %d, overruns: %d" % (self.cycles, self.overruns))
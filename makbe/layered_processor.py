@@ -20,15 +20,28 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from makbe import KeyEvent, KeyPressed, KeyReleased
-from makbe.processor import Processor
-from makbe.actions import Action, HoldTapAction, SingleKeyCode, MultipleKeyCodes, TransAction, LayerAction, NoOpAction
-from makbe.key_switch import KeySwitch
+from .key_event import KeyEvent, KeyPressed, KeyReleased
+from .processor import Processor
+from .actions import (Action, HoldTapAction, SingleKeyCode, MultipleKeyCodes, TransAction, LayerAction, SenderAction,
+                      NOP)
+from .key_switch import KeySwitch
+from .clock import ticks_diff
+from .latency import STAGE_HOLD
 
 
 class WaitingState:
 
+    __slots__ = ("action", "pressed_at", "switch", "hold_activated", "activated_layer", "modifier_key")
+
     def __init__(self, action: Action, switch: KeySwitch, pressed_at: int):
+        self.reset(action, switch, pressed_at)
+
+    def reset(self, action: Action, switch: KeySwitch, pressed_at: int):
+        """新しく押されたキーの状態として初期化する
+        :param action: 押されたときのアクション
+        :param switch: 押されたキースイッチ
+        :param pressed_at: 押された時刻（ms単位）
+        """
         self.action = action
         self.pressed_at = pressed_at
         self.switch = switch
@@ -39,15 +52,67 @@ class WaitingState:
     def held(self, now: int) -> bool:
         action = self.action
         if isinstance(action, HoldTapAction):
-            return self.pressed_at > 0 and now > self.pressed_at + action.timeout
+            return ticks_diff(now, self.pressed_at) > action.timeout
         return False
 
 
+class WaitingStatePool:
+    """WaitingStateを使い回すための固定長のプール
+    同時に押せるキーの数だけ事前に確保しておき、押下ごとのメモリ確保を無くす
+
+    Attributes
+    ----------
+    overflows:
+        プールが空で、新しくWaitingStateを確保した回数
+    """
+
+    def __init__(self, size: int):
+        """
+        :param size: プールするWaitingStateの数（同時に押せるキーの数）
+        """
+        self.size = size
+        self.free = [WaitingState(NOP, None, 0) for _ in range(size)]
+        self.overflows = 0
+
+    def acquire(self, action: Action, switch: KeySwitch, pressed_at: int) -> WaitingState:
+        """
+        :param action: 押されたときのアクション
+        :param switch: 押されたキースイッチ
+        :param pressed_at: 押された時刻（ms単位）
+        :return: 初期化したWaitingState
+        """
+        if self.free:
+            state = self.free.pop()
+            state.reset(action, switch, pressed_at)
+            return state
+        self.overflows += 1
+        return WaitingState(action, switch, pressed_at)
+
+    def release(self, state: WaitingState):
+        """使い終わったWaitingStateをプールに戻す
+        :param state: acquire()で取得したWaitingState
+        """
+        state.action = NOP
+        state.switch = None
+        if len(self.free) < self.size:
+            self.free.append(state)
+
+
 class LayeredProcessor(Processor):
 
-    def __init__(self, sender):
+    def __init__(self, sender, max_pressed: int = 16, debug: bool = False):
+        """
+        :param sender: キーコードを送出するSender
+        :param max_pressed: 同時に押せるキーの数（WaitingStateのプールの大きさ）
+        :param debug: Trueなら処理の様子をprintする
+        """
         self.layer = 0
+        self.debug = debug
+        self.pool = WaitingStatePool(max_pressed)
         self.waitingStates: [WaitingState] = []
+        # スイッチごとの、レイヤごとにtransを解決したアクションのキャッシュ
+        # 先頭はキャッシュしたときのKeySwitch.revisionで、スイッチのアクションが変わると作り直す
+        self.resolved = {}
         self.sender = sender
         self.active_modifiers = set()  # 現在アクティブなモディファイアキー
         self.active_layers = {}        # 現在アクティブなレイヤー (レイヤー番号: アクティブ化したWaitingStateのリスト)
@@ -66,24 +131,24 @@ class LayeredProcessor(Processor):
             self.pending_layer_update = False
             self.last_update_time = now
         # 定期的なレイヤー更新判定
-        elif now - self.last_update_time > 50:
+        elif ticks_diff(now, self.last_update_time) > 50:
             self.update_layer(now)
             self.last_update_time = now
 
-        print("layer: %d" % self.layer)
-        print(f"Active modifiers: {self.active_modifiers}")
+        if self.debug:
+            print("layer: %d" % self.layer)
+            print(f"Active modifiers: {self.active_modifiers}")
 
         # 押されたとき
         if isinstance(event, KeyPressed):
-            print("on_pressed")
+            if self.debug:
+                print("on_pressed")
             switch = event.switch
-            action = switch.actions[self.layer]
-            if isinstance(action, TransAction):
-                action = self.find_action(switch, self.layer)
+            action = self.resolve(switch, self.layer)
 
             # HoldTapActionの場合は、すぐに処理せず、状態を記録するだけ
             if isinstance(action, HoldTapAction):
-                state = WaitingState(action, switch, now)
+                state = self.pool.acquire(action, switch, now)
                 self.waitingStates.append(state)
                 return
 
@@ -96,7 +161,7 @@ class LayeredProcessor(Processor):
             elif isinstance(action, LayerAction):
                 # レイヤーをアクティブにする
                 layer_num = action.layer
-                state = WaitingState(action, switch, now)
+                state = self.pool.acquire(action, switch, now)
                 state.activated_layer = layer_num
 
                 if layer_num not in self.active_layers:
@@ -106,21 +171,31 @@ class LayeredProcessor(Processor):
                 self.update_layer(now)
                 self.waitingStates.append(state)
                 return  # すでにWaitingStateを追加したので、以下の処理はスキップ
+            elif isinstance(action, SenderAction):
+                self.sender.command(action.command, action.arg)
 
-            state = WaitingState(action, switch, now)
+            state = self.pool.acquire(action, switch, now)
             self.waitingStates.append(state)
 
         # 放されたとき
         if isinstance(event, KeyReleased):
-            print("on_released")
+            if self.debug:
+                print("on_released")
             switch = event.switch
             for state in self.waitingStates:
                 action = state.action
                 if state.switch is switch:
                     self.do_release(action, state, now)
                     self.waitingStates.remove(state)
+                    self.pool.release(state)
                     break
 
+    def is_idle(self) -> bool:
+        """
+        :return: 押されているキーもHoldTapの判定待ちも無ければTrue
+        """
+        return not self.waitingStates
+
     def update_layer(self, now: int):
         """現在のアクティブなレイヤーに基づいて、現在のレイヤーを更新する"""
         # デフォルトはレイヤー0
@@ -129,11 +204,13 @@ class LayeredProcessor(Processor):
         # アクティブなレイヤーがある場合は、最小のレイヤー番号を使用（小さい番号が優先）
         if self.active_layers:
             self.layer = min(self.active_layers.keys())
-            print(f"Active layers: {self.active_layers.keys()}, current layer: {self.layer}")
+            if self.debug:
+                print(f"Active layers: {self.active_layers.keys()}, current layer: {self.layer}")
 
     def process_key_press(self, key_code: int):
         """キーコードの処理（モディファイアキーか通常キーかを判断）"""
-        print(f"DEBUG: process_key_press called with key_code: {hex(key_code)}")
+        if self.debug:
+            print(f"DEBUG: process_key_press called with key_code: {hex(key_code)}")
         if self.is_modifier(key_code):
             self.active_modifiers.add(key_code)
         self.sender.press(key_code)
@@ -153,6 +230,8 @@ class LayeredProcessor(Processor):
             if isinstance(action, HoldTapAction) and not state.hold_activated:
                 # ホールド状態をチェック
                 if state.held(now):
+                    if self.monitor is not None:
+                        self.monitor.record(STAGE_HOLD, ticks_diff(now, state.pressed_at) * 1000)
                     hold = action.hold
                     # ホールドアクションを処理（即時反映）
                     if isinstance(hold, LayerAction):
@@ -175,7 +254,8 @@ class LayeredProcessor(Processor):
 
                     # ホールドがアクティブになったことをマーク
                     state.hold_activated = True
-                    print(f"hold activated: {type(hold).__name__}")
+                    if self.debug:
+                        print(f"hold activated: {type(hold).__name__}")
 
         # このtick()でホールドが有効化された場合、次のput()でレイヤー更新を確実に実行
         if any_hold_activated:
@@ -188,6 +268,8 @@ class LayeredProcessor(Processor):
         elif isinstance(action, MultipleKeyCodes):
             for code in action.key_codes:
                 self.process_key_press(code)
+        elif isinstance(action, SenderAction):
+            self.sender.command(action.command, action.arg)
 
     def do_press(self, action: Action):
         if isinstance(action, SingleKeyCode):
@@ -200,6 +282,8 @@ class LayeredProcessor(Processor):
             if layer_num not in self.active_layers:
                 self.active_layers[layer_num] = []
             # レイヤ自体の有効化は押下管理のWaitingStateにより行う
+        elif isinstance(action, SenderAction):
+            self.sender.command(action.command, action.arg)
 
     def do_release(self, action: Action, state: WaitingState, now: int):
         # 状態に関連づけられたレイヤーがある場合、レイヤーをデアクティブにする
@@ -210,7 +294,8 @@ class LayeredProcessor(Processor):
                     self.active_layers[layer_num].remove(state)
                 if not self.active_layers[layer_num]:
                     del self.active_layers[layer_num]
-            print(f"Layer {layer_num} deactivated, current active layers: {list(self.active_layers.keys())}")
+            if self.debug:
+                print(f"Layer {layer_num} deactivated, current active layers: {list(self.active_layers.keys())}")
             self.pending_layer_update = True
 
         # モディファイアキーがアクティブな場合、解放する
@@ -235,19 +320,52 @@ class LayeredProcessor(Processor):
                     elif isinstance(hold_action, MultipleKeyCodes):
                         for code in reversed(hold_action.key_codes):
                             self.process_key_release(code)
-                print("released hold")
+                if self.debug:
+                    print("released hold")
             else:
                 # ホールド状態になる前に離された場合のみタップアクションを実行
                 self.do_press(action.tap)
                 self.do_release(action.tap, state, now)
                 if isinstance(action.tap, SingleKeyCode):
-                    print("released tap %d" % action.tap.key_code)
+                    if self.debug:
+                        print("released tap %d" % action.tap.key_code)
                 else:
-                    print("released tap")
+                    if self.debug:
+                        print("released tap")
 
         # レイヤー状態を更新
         self.update_layer(now)
 
+    def resolve(self, switch: KeySwitch, layer: int) -> Action:
+        """transを解決したアクションを、キャッシュを使って求める
+        :param switch: キースイッチ
+        :param layer: レイヤ番号
+        :return: 実際に実行するアクション
+        """
+        row = self.resolved.get(switch)
+        if row is None or row[0] != switch.revision:
+            row = [switch.revision]
+            self.resolved[switch] = row
+        if layer + 1 >= len(row):
+            row.extend([None] * (layer + 2 - len(row)))
+        action = row[layer + 1]
+        if action is None:
+            action = switch.action(layer)
+            if isinstance(action, TransAction):
+                action = self.find_action(switch, layer)
+            row[layer + 1] = action
+        return action
+
+    def invalidate(self, switch: KeySwitch = None):
+        """解決済みのアクションのキャッシュを捨てる
+        KeySwitchのメソッドでアクションを変更した場合は、自動で捨てられるので呼ばなくてよい
+        :param switch: キャッシュを捨てるスイッチ（Noneなら全て）
+        """
+        if switch is None:
+            self.resolved.clear()
+        else:
+            self.resolved.pop(switch, None)
+
     def find_action(self, switch: KeySwitch, layer: int) -> Action:
         if layer > 0:
             layer -= 1
@@ -257,18 +375,8 @@ class LayeredProcessor(Processor):
             else:
                 return action
         else:
-            return NoOpAction()
+            return NOP
 
     def is_modifier(self, key_code: int):
-        # モディファイアキーのキーコードのリスト
-        modifiers = [
-            0xE0,  # LEFT_CONTROL
-            0xE1,  # LEFT_SHIFT
-            0xE2,  # LEFT_ALT
-            0xE3,  # LEFT_GUI (Windows/Command key)
-            0xE4,  # RIGHT_CONTROL
-            0xE5,  # RIGHT_SHIFT
-            0xE6,  # RIGHT_ALT
-            0xE7,  # RIGHT_GUI
-        ]
-        return key_code in modifiers
\ No newline at end of file
+        # モディファイアキーは0xE0（LEFT_CONTROL）から0xE7（RIGHT_GUI）まで連続している
+        return 0xE0 <= key_code <= 0xE7
\ No newline at end of file
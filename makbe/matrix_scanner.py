@@ -21,9 +21,14 @@
 # SOFTWARE.
 import digitalio
 
-from time import monotonic_ns, sleep
-
-from makbe import Scanner, Processor, KeyPressed, KeyReleased, KeySwitch, EventQueue
+from .event_queue import EventQueue
+from .key_event import KeyPressed, KeyReleased
+from .key_switch import KeySwitch, NopSwitch
+from .processor import Processor
+from .scanner import Scanner
+from .clock import ticks_diff
+from .latency import STAGE_READ
+from .boot import boot_mark
 
 
 class MatrixScanner(Scanner):
@@ -37,8 +42,10 @@ class MatrixScanner(Scanner):
             settle_time: float = 0.001,
             active_low: bool = True,
             drive_inactive: bool = False,
-            col_to_row: bool = False):
-        super().__init__(EventQueue(), processor)
+            col_to_row: bool = False,
+            clock=None,
+            direct: bool = False):
+        super().__init__(EventQueue(), processor, clock, direct)
         self.col_to_row = col_to_row
         if col_to_row:
             self._validate_col_to_row(matrix, row_pins, col_pins)
@@ -69,32 +76,105 @@ class MatrixScanner(Scanner):
             dio.switch_to_input(pull=pull)
             self.in_pins.append(dio)
 
-    def scan(self):
-        now = monotonic_ns() // 1000 // 1000
-
+        self.compile_plan()
+        boot_mark("matrix scanner")
+
+    def compile_plan(self):
+        """行列の割り当てから、スキャン計画を作る
+        計画は出力ピンごとの (出力ピン, ((ビットマスク, 入力ピン, スイッチ, 表示用の座標, スイッチID), ...), 読み飛ばし可否)
+        スイッチIDは状態表の行番号（状態表を使わなければ-1）
+        col_to_rowの違いはここで解決し、NopSwitchが置かれた交点は計画に含めない
+        割り当てを変更したときは、このメソッドを呼び直すこと
+        """
+        counts = {}
+        for line in self.matrix:
+            for switch in line:
+                counts[id(switch)] = counts.get(id(switch), 0) + 1
+
+        table = self.switch_table
+        plan = []
         for out_index, out_pin in enumerate(self.out_pins):
-            self._select(out_pin)
-            if self.settle_time > 0:
-                sleep(self.settle_time)
-
+            entries = []
+            skippable = True
             for in_index, in_pin in enumerate(self.in_pins):
-                if self.col_to_row:
-                    col_index = out_index
-                    row_index = in_index
-                    switch = self.matrix[col_index][row_index]
-                else:
-                    row_index = out_index
-                    col_index = in_index
-                    switch = self.matrix[row_index][col_index]
-
-                event = switch.update(in_pin.value == self.selected_value)
-                if isinstance(event, KeyPressed) or isinstance(event, KeyReleased):
-                    self.event_queue.enqueue(event, now)
-                    if self.col_to_row:
-                        print(f"[{col_index},{row_index}]")
-                    else:
-                        print(f"[{row_index},{col_index}]")
+                # col_to_rowならmatrix[列][行]、そうでなければmatrix[行][列]なので、どちらもmatrix[出力][入力]
+                switch = self.matrix[out_index][in_index]
+                if isinstance(switch, NopSwitch):
+                    continue
+                entries.append((1 << in_index, in_pin, switch, "[%d,%d]" % (out_index, in_index),
+                                table.add(switch) if table is not None else -1))
+                if counts[id(switch)] > 1:
+                    # 複数の交点に置かれたスイッチは、他の交点でも更新されるので読み飛ばせない
+                    skippable = False
+            plan.append((out_pin, tuple(entries), skippable))
+        self.plan = plan
+        # 出力ピンごとの、全スイッチのデバウンスが落ち着いているときのビット列（-1は未確定）
+        self.settled = [-1] * len(plan)
+
+    def poll(self, now: int):
+        """
+        出力ピンを1本ずつ選択して入力ピンを読み、キューに渡す
+        読み取ったビット列が前回落ち着いていたときと同じなら、その出力ピンのスイッチは更新しない
+        :param now: 現在時刻（ms単位）
+        """
+        monitor = self.monitor
+        settled = self.settled
+        selected = self.selected_value
+        settle_time = self.settle_time
+        enqueue = self.sink.enqueue
+        table = self.switch_table
+        for g, (out_pin, entries, skippable) in enumerate(self.plan):
+            self._select(out_pin)
+            if settle_time > 0:
+                self.clock.sleep(settle_time)
+            if monitor is not None:
+                started = self.clock.read_us()
+
+            bits = 0
+            for mask, in_pin, switch, label, index in entries:
+                if in_pin.value == selected:
+                    bits |= mask
+            if monitor is not None:
+                monitor.record(STAGE_READ, ticks_diff(self.clock.read_us(), started))
             self._deselect(out_pin)
+            if bits == settled[g]:
+                continue
+
+            pending = False
+            if table is not None:
+                # 状態表の行を直接更新し、変化したときだけイベントを作る
+                update = table.update
+                current = table.current
+                count = table.count
+                for mask, in_pin, switch, label, index in entries:
+                    if update(index, bits & mask != 0, now):
+                        if monitor is not None:
+                            self.record_debounce(switch, now)
+                        enqueue(KeyPressed(switch) if current[index] else KeyReleased(switch), now)
+                        print(label)
+                    if count[index]:
+                        pending = True
+            else:
+                for mask, in_pin, switch, label, index in entries:
+                    event = switch.update(bits & mask != 0, now)
+                    if isinstance(event, KeyPressed) or isinstance(event, KeyReleased):
+                        if monitor is not None:
+                            self.record_debounce(switch, now)
+                        enqueue(event, now)
+                        print(label)
+                    if switch.debouncer.count:
+                        pending = True
+            settled[g] = -1 if pending or not skippable else bits
+
+    def switches(self) -> list:
+        result = []
+        seen = set()
+        for line in self.matrix:
+            for switch in line:
+                if id(switch) not in seen:
+                    seen.add(id(switch))
+                    result.append(switch)
+        return result
 
     def _select(self, pin):
         pin.switch_to_output(value=self.selected_value)
@@ -19,8 +19,8 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from makbe import KeyEvent, KeyPressed, KeyReleased
-from makbe.processor import Processor
+from .key_event import KeyEvent, KeyPressed, KeyReleased
+from .processor import Processor
 
 
 class ModelessProcessor(Processor):
@@ -34,6 +34,9 @@ class ModelessProcessor(Processor):
         :param sender: CircuitPythonのadafruit_hid.keyboard.Keyboard
         """
         self.sender = sender
+        # 押されているスイッチと、押したときのキーコード
+        # キーマップが差し替えられても、離したときは押したときのキーコードを離す
+        self.pressed = {}
 
     def put(self, event: KeyEvent, now: int):
         """イベントの処理
@@ -43,10 +46,15 @@ class ModelessProcessor(Processor):
         """
         if isinstance(event, KeyPressed):
             print(str(event))
-            self.sender.press(event.switch.action(0).key_code)
+            key_code = event.switch.action(0).key_code
+            self.pressed[event.switch] = key_code
+            self.sender.press(key_code)
         if isinstance(event, KeyReleased):
             print(str(event))
-            self.sender.release(event.switch.action(0).key_code)
+            key_code = self.pressed.pop(event.switch, None)
+            if key_code is None:
+                key_code = event.switch.action(0).key_code
+            self.sender.release(key_code)
 
     def tick(self, now: int):
         pass
@@ -0,0 +1,157 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .clock import MonotonicClock, ticks_diff
+from .hid_report import BootReport
+from .latency import STAGE_SEND
+from .sender import Sender
+
+
+def usb_connected() -> bool:
+    """
+    :return: USBのホストに接続（給電）されていればTrue（分からなければFalse）
+    """
+    try:
+        import supervisor
+        return supervisor.runtime.usb_connected
+    except (ImportError, AttributeError):
+        return False
+
+
+class OutputRouter(Sender):
+    """複数の出力先（ReportSender、BleSender等）にレポートを振り分けるSender
+    レポートはこのクラスで1回だけ組み立て、同じバッファを出力先のpush()に渡す
+    全ての出力先に送るか、1つを選んで送る。選ぶ出力先は、out()等のアクションで切り替えるか、
+    autoのときはUSBの給電の有無で決める
+    出力先を切り替えると、前の出力先には何も押していないレポートを送り、新しい出力先には現在のレポートを送るので、
+    前のホストでキーが押されたままになることはない
+    """
+
+    def __init__(self, sinks: list, report=None, usb_index: int = 0, fallback_index: int = 1,
+                 auto: bool = True, fan_out: bool = False, check_ms: int = 500, vbus=None, clock=None):
+        """
+        :param sinks: 出力先のリスト（push(report)とupdate()を持つもの）
+        :param report: レポートを組み立てるオブジェクト（省略時はBootReport、出力先と同じ形式にする）
+        :param usb_index: autoのとき、USBが給電されていれば選ぶ出力先の番号
+        :param fallback_index: autoのとき、USBが給電されていなければ選ぶ出力先の番号
+        :param auto: TrueならUSBの給電の有無で出力先を選ぶ
+        :param fan_out: Trueなら全ての出力先に送る
+        :param check_ms: USBの給電を調べる間隔（ms単位）
+        :param vbus: USBが給電されていればTrueを返す関数（省略時はsupervisor.runtime.usb_connected）
+        :param clock: 時計（省略時はMonotonicClock）
+        """
+        super().__init__(None)
+        self.sinks = sinks
+        self.report = report if report is not None else BootReport()
+        self.usb_index = usb_index
+        self.fallback_index = min(fallback_index, len(sinks) - 1)
+        self.auto = auto
+        self.fan_out = fan_out
+        self.check_ms = check_ms
+        self.vbus = vbus if vbus is not None else usb_connected
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.blank = bytearray(len(self.report.report))
+        self.last_check = self.clock.read_ms()
+        self.active = usb_index
+        if auto:
+            self.active = usb_index if self.vbus() else self.fallback_index
+        self.switches = 0
+
+    def press(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
+        if self.report.press(key_code):
+            self.send()
+
+    def release(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
+        if self.report.release(key_code):
+            self.send()
+
+    def release_all(self):
+        self.report.clear()
+        self.send()
+
+    def send(self):
+        """現在のレポートを送る"""
+        report = self.report.report
+        if self.fan_out:
+            for sink in self.sinks:
+                sink.push(report)
+        else:
+            self.sinks[self.active].push(report)
+
+    def select(self, index: int):
+        """出力先をindex番の1つに切り替える
+        :param index: 出力先の番号
+        """
+        if not 0 <= index < len(self.sinks):
+            return
+        if not self.fan_out and index == self.active:
+            return
+        report = self.report.report
+        for i, sink in enumerate(self.sinks):
+            if i != index and (self.fan_out or i == self.active):
+                # 前のホストではキーを全て離す
+                sink.push(self.blank)
+        self.sinks[index].push(report)
+        self.fan_out = False
+        self.active = index
+        self.switches += 1
+        print("output %d" % index)
+
+    def select_all(self):
+        """全ての出力先に送る"""
+        if self.fan_out:
+            return
+        report = self.report.report
+        for i, sink in enumerate(self.sinks):
+            if i != self.active:
+                sink.push(report)
+        self.fan_out = True
+        print("output all")
+
+    def command(self, command: str, arg: int = 0):
+        if command == "out":
+            self.auto = False
+            self.select(arg)
+        elif command == "out_all":
+            self.auto = False
+            self.select_all()
+        elif command == "out_auto":
+            self.auto = True
+            self.last_check = self.clock.read_ms()
+            self.select(self.usb_index if self.vbus() else self.fallback_index)
+        else:
+            # bt()等は出力先に任せる
+            for sink in self.sinks:
+                sink.command(command, arg)
+
+    def update(self):
+        """autoならUSBの給電を調べて出力先を選び、各出力先のupdate()を呼ぶ"""
+        if self.auto:
+            now = self.clock.read_ms()
+            if ticks_diff(now, self.last_check) >= self.check_ms:
+                self.last_check = now
+                self.select(self.usb_index if self.vbus() else self.fallback_index)
+        for sink in self.sinks:
+            sink.update()
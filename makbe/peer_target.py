@@ -0,0 +1,115 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .expanders.peer_mcu import (REG_STATE, REG_INFO, INFO_MAGIC, VERSION, MAX_PINS, DEFAULT_ADDRESS,
+                                 state_size, pack_state)
+
+
+class PeerTarget:
+    """分割キーボードのもう片側で動かすファームウェア
+    自分のキーを読み続け、I2Cターゲットとして、主側のPeerMcuからの読み出しに押下状態のビット列を返す
+    キーは、GPIOに直接つないだスイッチ（direct_pins）か、行列配線（row_pins、col_pins）で読む
+    デバウンスは主側のKeySwitchが行うので、ここでは生の状態を返す
+    """
+
+    def __init__(self, scl, sda, address: int = DEFAULT_ADDRESS, direct_pins=None, row_pins=None,
+                 col_pins=None):
+        """
+        :param scl: I2CのSCLピン
+        :param sda: I2CのSDAピン
+        :param address: 自分のI2Cアドレス（7ビット）
+        :param direct_pins: GNDとの間にスイッチをつないだピンのリスト（キー番号はリストの順）
+        :param row_pins: 行列配線の行（出力）のピンのリスト
+        :param col_pins: 行列配線の列（入力）のピンのリスト（キー番号は 行 * 列数 + 列）
+        """
+        import digitalio
+        import i2ctarget
+
+        self.inputs = []
+        self.rows = []
+        if direct_pins is not None:
+            for pin in direct_pins:
+                self.inputs.append(self._input(digitalio, pin))
+        else:
+            for pin in row_pins:
+                row = digitalio.DigitalInOut(pin)
+                row.switch_to_output(value=True)
+                self.rows.append(row)
+            for pin in col_pins:
+                self.inputs.append(self._input(digitalio, pin))
+        self.pins = len(self.inputs) * max(1, len(self.rows))
+        if self.pins > MAX_PINS:
+            raise ValueError("peer target supports up to %d keys" % MAX_PINS)
+
+        self.state = bytearray(state_size(self.pins))
+        pack_state(0, self.state)
+        self.info = bytes((INFO_MAGIC, VERSION, self.pins))
+        self.register = REG_STATE
+        self.target = i2ctarget.I2CTarget(scl, sda, (address,))
+
+    @staticmethod
+    def _input(digitalio, pin):
+        io = digitalio.DigitalInOut(pin)
+        io.switch_to_input(pull=digitalio.Pull.UP)
+        return io
+
+    def read_keys(self) -> int:
+        """
+        :return: キーiが押されていればビットiが1の整数
+        """
+        bits = 0
+        inputs = self.inputs
+        if not self.rows:
+            for i, io in enumerate(inputs):
+                if not io.value:
+                    bits |= 1 << i
+            return bits
+        width = len(inputs)
+        for r, row in enumerate(self.rows):
+            row.value = False
+            for c, io in enumerate(inputs):
+                if not io.value:
+                    bits |= 1 << (r * width + c)
+            row.value = True
+        return bits
+
+    def serve(self):
+        """主側からの要求があれば応答する（要求が無ければすぐ戻る）"""
+        request = self.target.request(timeout=0)
+        if request is None:
+            return
+        with request:
+            if request.is_read:
+                request.write(self.info if self.register == REG_INFO else self.state)
+            else:
+                data = request.read(1)
+                if data:
+                    self.register = data[0]
+
+    def run(self):
+        """キーの読み取りと要求への応答を繰り返す"""
+        last = -1
+        while True:
+            bits = self.read_keys()
+            if bits != last:
+                pack_state(bits, self.state)
+                last = bits
+            self.serve()
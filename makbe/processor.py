@@ -19,13 +19,18 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from makbe import KeyEvent
+from .key_event import KeyEvent
+from .latency import STAGE_PUT
 
 
 class Processor:
     """プロセッサの基底クラス
+    時刻はスキャナの時計（makbe.clock）から渡される
+    時刻は一周する値なので、比較にはmakbe.clock.ticks_diff()を使うこと
     """
 
+    monitor = None
+
     def put(self, event: KeyEvent, now: int):
         """
         :param event: 処理するイベント
@@ -33,6 +38,20 @@ class Processor:
         """
         pass
 
+    def put_many(self, events, now: int):
+        """
+        同じ時刻に確定した複数のイベントをまとめて処理する
+        直接モードのスキャナから呼ばれる。デフォルトでは1つずつput()に渡す
+        :param events: 処理するイベントのリスト
+        :param now: 現在時刻に相当する数値（ms単位）
+        """
+        monitor = self.monitor
+        put = self.put
+        for event in events:
+            if monitor is not None:
+                monitor.mark(STAGE_PUT)
+            put(event, now)
+
     def tick(self, now: int):
         """
         一通りのイベントをput()で渡した後に、定期的に呼び出すメソッド
@@ -40,17 +59,26 @@ class Processor:
         """
         pass
 
+    def is_idle(self) -> bool:
+        """
+        :return: 確定待ちの状態（HoldTapの判定待ち等）が無ければTrue
+        """
+        return True
+
     def process_queue(self, event_queue, now: int):
         """
         キューからイベントを取り出して処理する
         :param event_queue: EventQueueオブジェクト
         :param now: 現在時刻に相当する数値（ms単位）
         """
+        monitor = self.monitor
         # キューから全てのイベントを処理
-        while not event_queue.is_empty():
-            item = event_queue.dequeue()
-            if item is not None:
-                event, timestamp = item
+        if monitor is None:
+            event_queue.drain(self.put)
+        else:
+            while not event_queue.is_empty():
+                event, timestamp = event_queue.dequeue()
+                monitor.mark(STAGE_PUT)
                 self.put(event, timestamp)
 
         # 最後にtickを呼び出す
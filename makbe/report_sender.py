@@ -0,0 +1,231 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .clock import MonotonicClock, ticks_add, ticks_diff
+from .hid_report import BootReport, keyboard_devices
+from .latency import STAGE_SEND
+from .sender import Sender
+
+
+class ReportSender(Sender):
+    """HIDレポートを自前のバッファで組み立てて、デバイスに直接送るクラス
+    レポートが変わったときだけ、変わった後のレポートを遷移キューに積み、
+    ホストのポーリング間隔（interval_ms）に1つずつ送る
+    同じUSBフレームの中で押下と解放が起きても、両方のレポートが順に送られるので、タップが消えない
+    キューの送信はpress()/release()とupdate()で行うので、メインループかRuntimeからupdate()を呼ぶこと
+    batchを2以上にすると、間隔ごとに最大batch個をまとめて送る（BLEの接続間隔等）
+
+    Attributes
+    ----------
+    sent:
+        送ったレポートの数
+    stalls:
+        send_report()がstall_usより長くかかったか、OSErrorで失敗した回数
+    overflows:
+        キューが一杯で、末尾のレポートを上書きした回数
+    max_depth:
+        キューに溜まったレポートの最大数
+    stale:
+        古くなって捨てたレポートの数
+    max_latency_ms:
+        キューに積んでから送るまでの最大時間（ms単位）
+    """
+
+    def __init__(self, device=None, report=None, interval_ms: int = 1, depth: int = 16,
+                 clock=None, stall_us: int = 0, batch: int = 1):
+        """
+        :param device: レポートを送るusb_hid.Device（省略時はusb_hid.devicesの最初のキーボード）
+        :param report: レポートを組み立てるオブジェクト（省略時はBootReport）
+        :param interval_ms: ホストのポーリング間隔（ms単位）
+        :param depth: 遷移キューの長さ
+        :param clock: 時計（省略時はMonotonicClock）
+        :param stall_us: send_report()がこれより長くかかったら停滞とみなす（µs単位、0ならinterval_msの2倍）
+        :param batch: 間隔ごとに送るレポートの最大数
+        """
+        if device is None:
+            import usb_hid
+            device = keyboard_devices(usb_hid.devices)[0]
+        super().__init__(None)
+        self.device = device
+        self.report = report if report is not None else BootReport()
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.interval_us = interval_ms * 1000
+        self.stall_us = stall_us if stall_us > 0 else 2 * self.interval_us
+        self.batch = batch
+
+        length = len(self.report.report)
+        self.depth = depth
+        self.queue = [bytearray(length) for _ in range(depth)]
+        # 積んだ時刻（ms単位）
+        self.stamps = [0] * depth
+        self.head = 0
+        self.count = 0
+        # 最後に送ったレポート
+        self.last = bytearray(length)
+        # 最後に積んだレポート（OutputRouterから積まれた場合も、ホストに伝えるべき現在の状態）
+        self.latest = bytearray(length)
+        self.last_sent_us = ticks_add(self.clock.read_us(), -self.interval_us)
+
+        self.sent = 0
+        self.stalls = 0
+        self.overflows = 0
+        self.max_depth = 0
+        self.stale = 0
+        self.max_latency_ms = 0
+
+    def press(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
+        if self.report.press(key_code):
+            self.push(self.report.report)
+
+    def release(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
+        if self.report.release(key_code):
+            self.push(self.report.report)
+
+    def release_all(self):
+        self.report.clear()
+        self.push(self.report.report)
+
+    def push(self, report):
+        """レポートをキューに積んで、送れるなら送る
+        直前に積んだ（キューが空なら直前に送った）レポートと同じなら積まない
+        :param report: レポート（キューにコピーするので、呼び出し後に書き換えてよい）
+        """
+        count = self.count
+        if count == 0:
+            if report == self.last:
+                return
+        else:
+            tail = self.queue[(self.head + count - 1) % self.depth]
+            if report == tail:
+                return
+        self.latest[:] = report
+        self.wake()
+        if count == self.depth:
+            # 途中の遷移は失われるが、最後の状態は必ず送る
+            tail[:] = report
+            self.overflows += 1
+            return
+        at = (self.head + count) % self.depth
+        self.queue[at][:] = report
+        self.stamps[at] = self.clock.read_ms()
+        self.count = count + 1
+        if self.count > self.max_depth:
+            self.max_depth = self.count
+        self.flush()
+
+    def wake(self):
+        """
+        新しいレポートを積むときに呼ぶ（派生クラスで、休止中の接続を起こす等）
+        press()を通さずにpush()された場合（OutputRouter等）も呼ばれる
+        """
+        pass
+
+    def ready(self) -> bool:
+        """
+        :return: 送信できる状態ならTrue（派生クラスで接続状態等を返す）
+        """
+        return True
+
+    def update(self):
+        self.flush()
+
+    def flush(self):
+        """前回の送信からポーリング間隔が過ぎていれば、キューの先頭から最大batch個のレポートを送る
+        """
+        if self.count == 0 or not self.ready():
+            return
+        clock = self.clock
+        now = clock.read_us()
+        if ticks_diff(now, self.last_sent_us) < self.interval_us:
+            return
+        self.last_sent_us = now
+        now_ms = clock.read_ms()
+        remaining = self.batch
+        while remaining > 0 and self.count > 0:
+            remaining -= 1
+            report = self.queue[self.head]
+            started = clock.read_us()
+            try:
+                self.device.send_report(report)
+            except OSError:
+                # ホストの準備ができていないので、次の機会に送り直す
+                self.stalls += 1
+                return
+            if ticks_diff(clock.read_us(), started) > self.stall_us:
+                self.stalls += 1
+            latency = ticks_diff(now_ms, self.stamps[self.head])
+            if latency > self.max_latency_ms:
+                self.max_latency_ms = latency
+            self.last[:] = report
+            self.head = (self.head + 1) % self.depth
+            self.count -= 1
+            self.sent += 1
+
+    def drop_stale(self, max_age_ms: int):
+        """積んでからmax_age_msより経ったレポートを捨てる
+        捨てたレポートの後の状態は、残ったレポートか現在のレポートで送られる
+        :param max_age_ms: レポートを送ってよい最大の経過時間（ms単位）
+        """
+        now = self.clock.read_ms()
+        while self.count > 0 and ticks_diff(now, self.stamps[self.head]) > max_age_ms:
+            self.head = (self.head + 1) % self.depth
+            self.count -= 1
+            self.stale += 1
+        if self.count == 0:
+            # 古いレポートを送らなくても、最後に積んだ押下状態はホストに伝える
+            self.push(self.latest)
+
+    def discard(self):
+        """キューを空にして、押下状態も忘れる（ホストが切り替わったとき等）"""
+        self.report.clear()
+        self.head = 0
+        self.count = 0
+        for i in range(len(self.last)):
+            self.last[i] = 0
+            self.latest[i] = 0
+
+    def pending(self) -> int:
+        """
+        :return: キューに溜まっているレポートの数
+        """
+        return self.count
+
+    def stats(self) -> dict:
+        """
+        :return: 送信数、停滞回数、上書き回数、破棄数、キューの現在と最大の長さ、最大遅延
+        """
+        return {
+            "sent": self.sent,
+            "stalls": self.stalls,
+            "overflows": self.overflows,
+            "stale": self.stale,
+            "depth": self.count,
+            "max_depth": self.max_depth,
+            "max_latency_ms": self.max_latency_ms,
+        }
+
+    def print_report(self):
+        print("report sender: sent %d, stalls %d, overflows %d, stale %d, depth %d (max %d), latency max %d ms" % (
+            self.sent, self.stalls, self.overflows, self.stale, self.count, self.max_depth, self.max_latency_ms))
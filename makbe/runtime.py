@@ -0,0 +1,241 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import asyncio
+
+from .clock import ticks_add, ticks_diff
+from .gc_scheduler import GcScheduler
+
+try:
+    from typing import Optional
+except ImportError:
+    # CircuitPythonランタイムでは型ヒントをスキップ
+    pass
+
+
+# 優先度（大きいほど先に実行する）
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 10
+PRIORITY_HIGH = 20
+
+
+class BackgroundTask:
+    """Runtimeが定期的に呼び出す処理
+    """
+
+    __slots__ = ("func", "interval_ms", "priority", "name", "due", "runs", "max_us")
+
+    def __init__(self, func, interval_ms: int, priority: int, name: str, due: int):
+        """
+        :param func: 現在時刻（ms単位）を受け取る関数
+        :param interval_ms: 呼び出し間隔（ms単位）
+        :param priority: 優先度（大きいほど先に実行する）
+        :param name: 表示用の名前
+        :param due: 次に呼び出す時刻（ms単位）
+        """
+        self.func = func
+        self.interval_ms = interval_ms
+        self.priority = priority
+        self.name = name
+        self.due = due
+        self.runs = 0
+        self.max_us = 0
+
+
+class Runtime:
+    """asyncioでスキャンとバックグラウンド処理を動かすランタイム
+    スキャンタスクはperiod_msごとにscanner.update()を呼ぶ
+    バックグラウンドタスクは、スキャンの合間に優先度順で実行し、
+    slice_usを使い切ったら残りを後回しにしてスキャンタスクに制御を返す
+    CircuitPythonのasyncioでも、ホストのCPythonのasyncioでも同じように動く
+
+    Attributes
+    ----------
+    cycles:
+        実行したスキャンサイクル数
+    overruns:
+        スキャンがperiod_msに収まらなかった回数
+    deferred:
+        時間切れでバックグラウンドタスクを後回しにした回数
+    """
+
+    def __init__(self, scanner, period_ms: int = 1, slice_us: int = 500, sender_interval_ms: int = 10,
+                 idle_gc: bool = True):
+        """
+        :param scanner: スキャナ
+        :param period_ms: スキャンの周期（ms単位）
+        :param slice_us: バックグラウンドタスクが連続して使える時間（µs単位）
+        :param sender_interval_ms: センダーのupdate()を呼ぶ間隔（ms単位、0なら呼ばない）
+        :param idle_gc: Trueなら、キーが押されていない間にGcSchedulerでgc.collect()を実行する
+        """
+        self.scanner = scanner
+        self.clock = scanner.clock
+        self.period_ms = period_ms
+        self.slice_us = slice_us
+        self.tasks = []
+        self.running = False
+        self.cycles = 0
+        self.overruns = 0
+        self.deferred = 0
+        self.coroutines = []
+        self.gc_scheduler = GcScheduler(scanner) if idle_gc else None
+
+        sender = getattr(scanner.processor, "sender", None)
+        if sender_interval_ms > 0 and sender is not None and hasattr(sender, "update"):
+            # BLEの接続管理等
+            self.add_task(lambda now: sender.update(), sender_interval_ms, PRIORITY_HIGH, "sender")
+
+    def add_task(self, func, interval_ms: int, priority: int = PRIORITY_NORMAL,
+                 name: Optional[str] = None) -> BackgroundTask:
+        """バックグラウンドタスクを登録する
+        funcはすぐに戻る短い処理にすること（長い処理は分割するか、spawn()でコルーチンにする）
+        :param func: 現在時刻（ms単位）を受け取る関数
+        :param interval_ms: 呼び出し間隔（ms単位）
+        :param priority: 優先度（大きいほど先に実行する）
+        :param name: 表示用の名前
+        :return: 登録したタスク
+        """
+        task = BackgroundTask(func, interval_ms, priority, name or getattr(func, "__name__", "task"),
+                              self.clock.read_ms())
+        self.tasks.append(task)
+        # 優先度の高い順に並べておく（同じ優先度は登録順）
+        self.tasks.sort(key=lambda t: -t.priority)
+        return task
+
+    def remove_task(self, task: BackgroundTask):
+        """
+        :param task: add_task()で登録したタスク
+        """
+        if task in self.tasks:
+            self.tasks.remove(task)
+
+    def spawn(self, coroutine):
+        """任意のコルーチンを、スキャンと並行して動かす
+        コルーチンはこまめにawaitして、スキャンタスクに制御を返すこと
+        :param coroutine: コルーチン
+        """
+        self.coroutines.append(coroutine)
+
+    async def _wait(self, seconds: float):
+        if self.clock.realtime:
+            await asyncio.sleep(seconds)
+        else:
+            # 仮想時計では実際に待たずに時刻を進める
+            self.clock.sleep(seconds)
+            await asyncio.sleep(0)
+
+    async def scan_loop(self, cycles: Optional[int] = None):
+        """スキャンタスク
+        :param cycles: 実行するサイクル数（Noneならstop()まで）
+        """
+        clock = self.clock
+        scanner = self.scanner
+        period_us = self.period_ms * 1000
+        end = None if cycles is None else self.cycles + cycles
+        while self.running:
+            started = clock.read_us()
+            gc_scheduler = self.gc_scheduler
+            if gc_scheduler is None:
+                scanner.update()
+            else:
+                gc_scheduler.begin_cycle()
+                scanner.update()
+                gc_scheduler.end_cycle(clock.now_ms)
+            self.cycles += 1
+            if end is not None and self.cycles >= end:
+                self.running = False
+                break
+            remaining = period_us - ticks_diff(clock.read_us(), started)
+            if remaining <= 0:
+                self.overruns += 1
+                await asyncio.sleep(0)
+            else:
+                await self._wait(remaining / 1000000)
+
+    async def background_loop(self):
+        """バックグラウンドタスクを優先度順に実行する
+        """
+        clock = self.clock
+        slice_us = self.slice_us
+        while self.running:
+            started = clock.read_us()
+            idle_ms = self.period_ms
+            for task in self.tasks:
+                now = clock.read_ms()
+                wait = ticks_diff(task.due, now)
+                if wait > 0:
+                    if wait < idle_ms:
+                        idle_ms = wait
+                    continue
+                idle_ms = 0
+                if ticks_diff(clock.read_us(), started) >= slice_us:
+                    # 時間切れ。残りは次の空き時間に回す
+                    self.deferred += 1
+                    break
+                begin = clock.read_us()
+                task.func(now)
+                elapsed = ticks_diff(clock.read_us(), begin)
+                task.runs += 1
+                if elapsed > task.max_us:
+                    task.max_us = elapsed
+                task.due = ticks_add(now, task.interval_ms)
+            if idle_ms > 0 and clock.realtime:
+                # 次のタスクの時刻まで眠る（スキャンタスクはその間も動く）
+                await asyncio.sleep(idle_ms / 1000)
+            else:
+                await asyncio.sleep(0)
+
+    async def main(self, cycles: Optional[int] = None):
+        """スキャンタスク、バックグラウンドタスク、spawn()したコルーチンを動かす
+        :param cycles: 実行するスキャンサイクル数（Noneならstop()まで）
+        """
+        self.running = True
+        tasks = [asyncio.create_task(self.scan_loop(cycles)), asyncio.create_task(self.background_loop())]
+        for coroutine in self.coroutines:
+            tasks.append(asyncio.create_task(coroutine))
+        self.coroutines = []
+        await asyncio.gather(*tasks[:2])
+        for task in tasks[2:]:
+            task.cancel()
+
+    def run(self, cycles: Optional[int] = None):
+        """ランタイムを動かす（stop()するか、cyclesに達するまで戻らない）
+        :param cycles: 実行するスキャンサイクル数（Noneならstop()まで）
+        """
+        asyncio.run(self.main(cycles))
+
+    def stop(self):
+        """スキャンタスクとバックグラウンドタスクを止める
+        """
+        self.running = False
+
+    def report(self) -> list:
+        """
+        :return: 各バックグラウンドタスクの (名前, 実行回数, 最大実行時間(µs)) のリスト
+        """
+        return [(task.name, task.runs, task.max_us) for task in self.tasks]
+
+    def print_report(self):
+        print("cycles %d, overruns %d, deferred %d" % (self.cycles, self.overruns, self.deferred))
+        for name, runs, max_us in self.report():
+            print("  %-16s runs %6d  max %6d us" % (name, runs, max_us))
+        if self.gc_scheduler is not None:
+            self.gc_scheduler.print_report()
@@ -19,43 +19,179 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from time import monotonic_ns
+from .clock import MonotonicClock, ticks_diff
+from .event_queue import EventBatch
+from .latency import STAGE_DEBOUNCE
 
 
 class Scanner():
     """キースキャンをするクラス
     このクラスを継承したクラスで、スキャン時の動作を定義する
+    時刻はclockから1サイクルに1回だけ読み取り、スキャンとイベント処理で共有する
+    確定したイベントはsinkに渡す。通常はevent_queueで、直接モードではスキャンの最後にプロセッサへまとめて渡す
     """
 
-    def __init__(self, event_queue, processor):
+    monitor = None
+    switch_table = None
+    pending_keymap = None
+
+    def __init__(self, event_queue, processor, clock=None, direct: bool = False):
+        """
+        :param event_queue: スキャナとプロセッサ間でイベントを受け渡すキュー
+        :param processor: キーイベントを処理するオブジェクト
+        :param clock: 時計（省略時はMonotonicClock）
+        :param direct: Trueならキューを通さず、スキャン中に確定したイベントを直接プロセッサに渡す
+        """
         self.event_queue = event_queue
         self.processor = processor
+        self.clock = clock if clock is not None else MonotonicClock()
+        self.batch = EventBatch()
+        self.set_direct(direct)
+
+    def set_direct(self, direct: bool):
+        """直接モードを切り替える
+        直接モードでは、scan()の最後にprocessor.put_many()でイベントを渡すので、process_events()はtick()だけになる
+        スキャンとイベント処理を別々のタイミングで呼ぶ場合は、直接モードにしないこと
+        :param direct: Trueなら直接モード、Falseならキューを使う
+        """
+        self.direct = direct
+        self.sink = self.batch if direct else self.event_queue
 
     def scan(self):
         """
-        スキャンする
+        時刻を更新してスキャンする
+        直接モードでは、確定したイベントをそのままプロセッサに渡す
+        """
+        if self.pending_keymap is not None:
+            self.apply_keymap()
+        now = self.clock.update()
+        self.poll(now)
+        if self.direct:
+            self.batch.flush(self.processor, now)
+
+    def poll(self, now: int):
+        """
+        スイッチを読み取って、変化があったイベントをsinkに渡す
+        このメソッドを継承したクラスで実装する
+        :param now: 現在時刻（ms単位）
         """
         pass
 
     def process_events(self):
         """
         キューに溜まったイベントをプロセッサで処理する
+        時刻は直前のscan()で読み取ったものを使う
         """
-        now = monotonic_ns() // 1000 // 1000
-
-        # キューから全てのイベントを処理
-        while not self.event_queue.is_empty():
-            item = self.event_queue.dequeue()
-            if item is not None:
-                event, timestamp = item
-                self.processor.put(event, timestamp)
-
-        # 最後にtickを呼び出す
-        self.processor.tick(now)
+        self.processor.process_queue(self.event_queue, self.clock.now_ms)
 
     def update(self):
         """
         スキャンとイベント処理を両方実行（統合モード）
         """
-        self.scan()
-        self.process_events()
+        monitor = self.monitor
+        if monitor is None:
+            self.scan()
+            self.process_events()
+        else:
+            if self.pending_keymap is not None:
+                self.apply_keymap()
+            now = self.clock.update()
+            monitor.begin_cycle(self.clock.now_us)
+            self.poll(now)
+            if self.direct:
+                self.batch.flush(self.processor, now)
+            self.process_events()
+            monitor.end_cycle()
+
+    def switches(self) -> list:
+        """
+        :return: このスキャナが読み取るキースイッチのリスト（重複なし）
+        """
+        return []
+
+    def swap_keymap(self, keymap):
+        """キーマップの差し替えを予約する
+        差し替えは次のサイクルの始めに、全てのスイッチについてまとめて行う
+        押されているキーは、離したときに押したときのアクションで処理されるので、キーが押されたままになることはない
+        :param keymap: {KeySwitch: [レイヤごとのアクション]} の辞書、
+            またはKeymapTable（表から作ったスイッチを、同じ名前のスイッチに対応づける）
+        """
+        self.pending_keymap = keymap
+
+    def apply_keymap(self):
+        """予約されたキーマップの差し替えをすぐに行う
+        :return: アクションを変更したスイッチの数
+        """
+        keymap = self.pending_keymap
+        self.pending_keymap = None
+        if keymap is None:
+            return 0
+        changed = 0
+        if isinstance(keymap, dict):
+            for switch, actions in keymap.items():
+                switch.set_actions(actions)
+                changed += 1
+            return changed
+
+        # KeymapTable
+        index = {}
+        for i, name in enumerate(keymap.names()):
+            index[name] = i
+        names = {}
+        for switch in self.switches():
+            table = getattr(switch, "table", None)
+            if table is None or not hasattr(switch, "set_table"):
+                continue
+            if id(table) not in names:
+                names[id(table)] = table.names()
+            i = index.get(names[id(table)][switch.index])
+            if i is None:
+                # 新しい表に無いスイッチは何もしないスイッチにする（以降は表の差し替えの対象にならない）
+                switch.set_actions([])
+            else:
+                switch.set_table(keymap, i)
+            changed += 1
+        return changed
+
+    def build_switch_table(self):
+        """スキャナが読み取るキースイッチの状態を、1つのSwitchTableにまとめる
+        :return: 生成したSwitchTable
+        """
+        from .switch_table import SwitchTable
+        self.use_switch_table(SwitchTable.from_switches(self.switches()))
+        return self.switch_table
+
+    def use_switch_table(self, table):
+        """スイッチの状態表を使うようにして、スキャン計画を作り直す
+        スキャン計画を持つスキャナは、KeySwitch.update()を通さずに表の行を直接更新する
+        :param table: スキャナが読み取る全てのスイッチを登録したSwitchTable
+        """
+        self.switch_table = table
+        self.compile_plan()
+
+    def compile_plan(self):
+        """
+        スキャン計画を作り直す
+        スキャン計画を持つスキャナで実装する
+        """
+        pass
+
+    def attach_monitor(self, monitor):
+        """遅延の計測を始める
+        キュー、プロセッサ、センダーにも同じモニタを取り付ける
+        :param monitor: LatencyMonitor（Noneなら計測をやめる）
+        """
+        self.monitor = monitor
+        self.event_queue.monitor = monitor
+        self.batch.monitor = monitor
+        self.processor.monitor = monitor
+        sender = getattr(self.processor, "sender", None)
+        if sender is not None:
+            sender.monitor = monitor
+
+    def record_debounce(self, switch, now: int):
+        """ピンの変化からデバウンスで確定するまでの時間を記録する
+        :param switch: イベントが確定したキースイッチ
+        :param now: 現在時刻（ms単位）
+        """
+        self.monitor.record(STAGE_DEBOUNCE, ticks_diff(now, switch.debouncer.changed_at) * 1000)
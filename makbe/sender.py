@@ -19,6 +19,7 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+from .latency import STAGE_SEND
 
 
 class Sender:
@@ -26,11 +27,24 @@ class Sender:
     このクラスを継承したクラスで、送信時の動作を定義する
     """
 
+    monitor = None
+
     def __init__(self, kbd):
         self.kbd = kbd
 
     def press(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
         self.kbd.press(key_code)
 
     def release(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
         self.kbd.release(key_code)
+
+    def command(self, command: str, arg: int = 0):
+        """SenderActionから呼ばれる（対応していないコマンドは無視する）
+        :param command: コマンド名
+        :param arg: コマンドの引数
+        """
+        pass
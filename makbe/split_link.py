@@ -0,0 +1,332 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from .clock import ticks_diff
+from .key_event import KeyPressed, KeyReleased
+from .processor import Processor
+
+
+# フレームの形式（6バイト）
+#   0  SYNC（0xA5）
+#   1  シーケンス番号（u8）
+#   2  bit7: 押下なら1、bit0-6: スイッチ番号（HEARTBEATは生存通知、STATEは状態通知）
+#   3  送信側の時刻（ms単位の下位16ビット、リトルエンディアン）
+#   5  CRC-8（多項式0x07、バイト1〜4）
+# STATEのフレームでは、バイト3がスイッチ8個ごとの区画の番号、バイト4がその区画の押下状態のビット
+# 受信側はSYNCを探し、CRCが合わなければ1バイトずらして探し直すので、ノイズの後も同期し直す
+SYNC = 0xA5
+FRAME_SIZE = 6
+HEARTBEAT = 0x7F
+STATE = 0x80 | HEARTBEAT
+MAX_SWITCHES = HEARTBEAT
+
+
+def _crc8_table() -> bytes:
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table[i] = crc
+    return bytes(table)
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data, start: int, end: int) -> int:
+    """
+    :param data: バイト列
+    :param start: 計算を始める位置
+    :param end: 計算を終える位置（この位置は含まない）
+    :return: data[start:end]のCRC-8
+    """
+    crc = 0
+    for i in range(start, end):
+        crc = CRC8_TABLE[crc ^ data[i]]
+    return crc
+
+
+class SplitTransmitter(Processor):
+    """分割キーボードの副側で、スキャナのプロセッサとして使う
+    確定したスイッチの押下と解放を、すぐにUARTでフレームにして主側に送る
+    押下や解放のフレームとは別に、heartbeat_msごとに押下状態を8スイッチずつ順に送る
+    主側はこれで接続が切れたことを検出でき、失われたフレームで食い違った状態も直せる
+    """
+
+    def __init__(self, uart, switches: list, heartbeat_ms: int = 100):
+        """
+        :param uart: busio.UART
+        :param switches: 副側のスイッチのリスト（主側のSplitReceiverと同じ順序、最大127個）
+        :param heartbeat_ms: 状態通知の間隔（ms単位）。全スイッチの状態を送り終えるのは、8スイッチごとにこの間隔がかかる
+        """
+        if len(switches) > MAX_SWITCHES:
+            raise ValueError("split link supports up to %d switches" % MAX_SWITCHES)
+        self.uart = uart
+        self.ids = {}
+        for i, switch in enumerate(switches):
+            self.ids[switch] = i
+        self.heartbeat_ms = heartbeat_ms
+        self.frame = bytearray(FRAME_SIZE)
+        self.frame[0] = SYNC
+        self.seq = 0
+        self.state = bytearray((len(switches) + 7) // 8)
+        self.chunk = 0
+        self.last_state = 0
+        self.sent = 0
+
+    def write(self, code: int, low: int, high: int):
+        """
+        :param code: フレームのバイト2
+        :param low: フレームのバイト3
+        :param high: フレームのバイト4
+        """
+        frame = self.frame
+        frame[1] = self.seq
+        frame[2] = code
+        frame[3] = low
+        frame[4] = high
+        frame[5] = crc8(frame, 1, 5)
+        self.uart.write(frame)
+        self.seq = (self.seq + 1) & 0xFF
+        self.sent += 1
+
+    def send(self, code: int, now: int):
+        """
+        :param code: フレームのバイト2（押下フラグとスイッチ番号）
+        :param now: 現在時刻（ms単位）
+        """
+        self.write(code, now & 0xFF, (now >> 8) & 0xFF)
+
+    def send_state(self, now: int):
+        """押下状態の次の区画を送る（スイッチが無ければ生存通知だけを送る）
+        :param now: 現在時刻（ms単位）
+        """
+        self.last_state = now
+        state = self.state
+        if not state:
+            self.send(HEARTBEAT, now)
+            return
+        chunk = self.chunk
+        self.write(STATE, chunk, state[chunk])
+        chunk += 1
+        self.chunk = chunk if chunk < len(state) else 0
+
+    def put(self, event, now: int):
+        index = self.ids.get(event.switch)
+        if index is None:
+            return
+        if isinstance(event, KeyPressed):
+            self.state[index >> 3] |= 1 << (index & 7)
+            self.send(0x80 | index, now)
+        elif isinstance(event, KeyReleased):
+            self.state[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+            self.send(index, now)
+
+    def tick(self, now: int):
+        # 打鍵が続いていても状態は送るので、解放のフレームが失われてもキーが押されたままにならない
+        if ticks_diff(now, self.last_state) >= self.heartbeat_ms:
+            self.send_state(now)
+
+
+class SplitReceiver:
+    """分割キーボードの主側で、副側から届いたフレームをキーイベントにする
+    poll(now)でUARTを読み、主側のスキャナのsinkにイベントを入れる
+    sinkはイベントを入れるたびにスキャナから読むので、スキャナの直接モードを切り替えても追従する
+    timeout_msの間フレームが届かなければ、副側で押されていたキーを全て離す
+    状態通知が届いたら、副側の押下状態と食い違うスイッチのイベントを作って合わせる
+
+    Attributes
+    ----------
+    received:
+        受け取ったフレームの数
+    crc_errors:
+        CRCが合わずに捨てたフレームの数
+    lost:
+        シーケンス番号の飛びから数えた、失われたフレームの数
+    resynced:
+        状態通知で直したスイッチの数
+    max_delay_ms:
+        最も速く届いたフレームと比べた、フレームの遅れの最大値（ms単位）
+    """
+
+    def __init__(self, uart, switches: list, scanner=None, timeout_ms: int = 500, buffer_size: int = 64):
+        """
+        :param uart: busio.UART
+        :param switches: 副側のスイッチのリスト（SplitTransmitterと同じ順序）
+        :param scanner: 主側のスキャナ（イベントをこのスキャナのsinkに入れる）
+        :param timeout_ms: 接続が切れたとみなすまでの時間（ms単位）
+        :param buffer_size: 1回に読むバイト数
+        """
+        self.uart = uart
+        self.switch_list = list(switches)
+        self.scanner = scanner
+        # CompositeScanner等が設定したときだけ使い、Noneならscanner.sinkを使う
+        self.sink = None
+        self.timeout_ms = timeout_ms
+        self.rx = bytearray(buffer_size + FRAME_SIZE)
+        self.view = memoryview(self.rx)
+        self.fill = 0
+        self.buffer_size = buffer_size
+        self.pressed = bytearray(len(self.switch_list))
+        self.expected = -1
+        self.last_received = 0
+        self.connected = False
+        self.offset = -1
+
+        self.received = 0
+        self.crc_errors = 0
+        self.lost = 0
+        self.resynced = 0
+        self.max_delay_ms = 0
+
+    def switches(self) -> list:
+        return self.switch_list
+
+    def target(self):
+        """
+        :return: イベントを入れる先（sinkが設定されていなければ主側のスキャナのsink）
+        """
+        sink = self.sink
+        return sink if sink is not None else self.scanner.sink
+
+    def poll(self, now: int):
+        """
+        届いたフレームを読んで、キーイベントをsinkに入れる
+        :param now: 現在時刻（ms単位）
+        """
+        n = self.uart.readinto(self.view[self.fill:self.fill + self.buffer_size])
+        if n:
+            self.fill += n
+            self.parse(now)
+        elif self.connected and ticks_diff(now, self.last_received) > self.timeout_ms:
+            self.disconnect(now)
+
+    def parse(self, now: int):
+        rx = self.rx
+        fill = self.fill
+        pos = 0
+        while fill - pos >= FRAME_SIZE:
+            if rx[pos] != SYNC:
+                pos += 1
+                continue
+            if crc8(rx, pos + 1, pos + 5) != rx[pos + 5]:
+                # ノイズで壊れたか、データの途中のSYNCを拾ったので、1バイトずらして同期し直す
+                self.crc_errors += 1
+                pos += 1
+                continue
+            self.handle_frame(rx[pos + 1], rx[pos + 2], rx[pos + 3] | (rx[pos + 4] << 8), now)
+            pos += FRAME_SIZE
+        if pos:
+            rx[0:fill - pos] = rx[pos:fill]
+            self.fill = fill - pos
+
+    def handle_frame(self, seq: int, code: int, stamp: int, now: int):
+        """
+        1つのフレームを処理する
+        :param seq: シーケンス番号
+        :param code: 押下フラグとスイッチ番号
+        :param stamp: 送信側の時刻（ms単位の下位16ビット）
+        :param now: 現在時刻（ms単位）
+        """
+        self.received += 1
+        if self.expected >= 0 and seq != self.expected:
+            self.lost += (seq - self.expected) & 0xFF
+        self.expected = (seq + 1) & 0xFF
+        self.last_received = now
+        self.connected = True
+
+        if code == STATE:
+            self.apply_state(stamp & 0xFF, stamp >> 8, now)
+            return
+
+        # 時計は同期していないので、最も速く届いたフレームを基準に遅れを測る
+        offset = (now - stamp) & 0xFFFF
+        if self.offset < 0 or ((offset - self.offset) & 0xFFFF) > 0x8000:
+            self.offset = offset
+        delay = (offset - self.offset) & 0xFFFF
+        if delay > self.max_delay_ms:
+            self.max_delay_ms = delay
+
+        index = code & 0x7F
+        if index == HEARTBEAT or index >= len(self.switch_list):
+            return
+        pressed = 1 if code & 0x80 else 0
+        if self.pressed[index] == pressed:
+            # フレームが失われた後の重複は無視する
+            return
+        self.pressed[index] = pressed
+        switch = self.switch_list[index]
+        self.target().enqueue(KeyPressed(switch) if pressed else KeyReleased(switch), now)
+
+    def apply_state(self, chunk: int, bits: int, now: int):
+        """
+        状態通知の1区画に合わせて、食い違うスイッチのイベントを作る
+        :param chunk: 区画の番号（スイッチ8個ごと）
+        :param bits: 区画の押下状態
+        :param now: 現在時刻（ms単位）
+        """
+        pressed = self.pressed
+        index = chunk << 3
+        end = min(index + 8, len(pressed))
+        while index < end:
+            p = bits & 1
+            if pressed[index] != p:
+                pressed[index] = p
+                self.resynced += 1
+                switch = self.switch_list[index]
+                self.target().enqueue(KeyPressed(switch) if p else KeyReleased(switch), now)
+            bits >>= 1
+            index += 1
+
+    def disconnect(self, now: int):
+        """副側で押されていたキーを全て離す"""
+        self.connected = False
+        self.expected = -1
+        sink = self.target()
+        for index in range(len(self.pressed)):
+            if self.pressed[index]:
+                self.pressed[index] = 0
+                sink.enqueue(KeyReleased(self.switch_list[index]), now)
+        print("split link lost")
+
+    def update(self):
+        """主側のスキャンと副側の受信をしてから、イベントを処理する（keyboard.scanner.update()の代わりに呼ぶ）"""
+        scanner = self.scanner
+        scanner.scan()
+        now = scanner.clock.now_ms
+        self.poll(now)
+        if scanner.direct:
+            # 直接モードでは、副側のイベントも同じサイクルでプロセッサに渡す
+            scanner.batch.flush(scanner.processor, now)
+        scanner.process_events()
+
+    def stats(self) -> dict:
+        """
+        :return: 受信数、CRCエラー数、損失数、状態通知で直した数、最大の遅れ
+        """
+        return {
+            "received": self.received,
+            "crc_errors": self.crc_errors,
+            "lost": self.lost,
+            "resynced": self.resynced,
+            "max_delay_ms": self.max_delay_ms,
+        }
@@ -0,0 +1,195 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from array import array
+
+try:
+    from ulab import numpy as np
+except ImportError:
+    try:
+        import numpy as np
+    except ImportError:
+        # ulabもNumPyも無ければ、Pythonのループで処理する
+        np = None
+
+
+class SwitchTable:
+    """キーボード全体のスイッチの状態を、スイッチごとのオブジェクトではなく並列の配列で持つ表
+    add()で登録したKeySwitchのDebouncerは、この表の1行を指すTableDebouncerに置き換わる
+    ulab（CircuitPython）またはNumPy（ホスト）があれば、一括の問い合わせはベクトル演算で行う
+
+    Attributes
+    ----------
+    current:
+        デバウンス後の状態（押されていれば1）
+    pending:
+        確定待ちの状態（押されていれば1）
+    count:
+        確定待ちの状態が続いた回数
+    limit:
+        チャタリングではないと判定する回数
+    changed_at:
+        ピンが変化し始めた時刻（ms単位）
+    """
+
+    def __init__(self):
+        self.switches = []
+        self.current = bytearray()
+        self.pending = bytearray()
+        self.count = bytearray()
+        self.limit = bytearray()
+        self.changed_at = array("l")
+        self._current_view = None
+
+    @classmethod
+    def from_switches(cls, switches):
+        """
+        :param switches: 登録するKeySwitchのリスト（重複は1つにまとめる）
+        :return: 生成したSwitchTable
+        """
+        table = cls()
+        for switch in switches:
+            table.add(switch)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.switches)
+
+    def add(self, switch) -> int:
+        """スイッチを登録する
+        同じスイッチを登録し直した場合は、既存の行番号を返す
+        :param switch: KeySwitch
+        :return: スイッチID（表の行番号）
+        """
+        debouncer = switch.debouncer
+        if isinstance(debouncer, TableDebouncer) and debouncer.table is self:
+            return debouncer.index
+        # ビューが配列を参照したままだと、配列を伸ばせないので先に捨てる
+        self._current_view = None
+        index = len(self.switches)
+        self.switches.append(switch)
+        self.current.append(1 if debouncer.current else 0)
+        self.pending.append(1 if debouncer.pressed else 0)
+        self.count.append(min(debouncer.count, 255))
+        self.limit.append(min(debouncer.limit, 255))
+        self.changed_at.append(debouncer.changed_at)
+        switch.debouncer = TableDebouncer(self, index)
+        return index
+
+    def update(self, index: int, pressed: bool, now: int = 0) -> bool:
+        """Debouncer.update()と同じ状態更新を、表の1行に対して行う
+        :param index: スイッチID
+        :param pressed: ピンの状態（ONならTrue）
+        :param now: 現在時刻（ms単位）
+        :return: 変化があったらTrue
+        """
+        p = 1 if pressed else 0
+        if self.current[index] == p:
+            self.count[index] = 0
+            return False
+        if self.pending[index] == p:
+            if self.count[index] == 0:
+                self.changed_at[index] = now
+            if self.count[index] < 255:
+                self.count[index] += 1
+        else:
+            self.pending[index] = p
+            self.count[index] = 1
+            self.changed_at[index] = now
+        if self.count[index] > self.limit[index]:
+            self.current[index] = p
+            self.count[index] = 0
+            return True
+        return False
+
+    def _view(self):
+        if self._current_view is None:
+            self._current_view = np.frombuffer(self.current, dtype=np.uint8)
+        return self._current_view
+
+    def any_held(self) -> bool:
+        """
+        :return: 押されているスイッチが1つでもあればTrue
+        """
+        if np is not None and len(self.current) > 0:
+            return bool(np.any(self._view()))
+        return any(self.current)
+
+    def any_pending(self) -> bool:
+        """
+        :return: デバウンスの確定待ちのスイッチが1つでもあればTrue
+        """
+        return any(self.count)
+
+    def pressed_ids(self) -> list:
+        """
+        :return: 押されているスイッチのIDのリスト
+        """
+        if np is not None and len(self.current) > 0:
+            return [int(i) for i in np.nonzero(self._view())[0]]
+        return [i for i, c in enumerate(self.current) if c]
+
+    def pressed_switches(self) -> list:
+        """
+        :return: 押されているKeySwitchのリスト
+        """
+        switches = self.switches
+        return [switches[i] for i in self.pressed_ids()]
+
+    def snapshot(self) -> bytes:
+        """
+        :return: デバウンス後の状態のコピー（スイッチIDごとに1バイト）
+        """
+        return bytes(self.current)
+
+
+class TableDebouncer:
+    """SwitchTableの1行を指すDebouncer互換のビュー
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: SwitchTable, index: int):
+        self.table = table
+        self.index = index
+
+    def update(self, pressed: bool, now: int = 0) -> bool:
+        return self.table.update(self.index, pressed, now)
+
+    @property
+    def current(self) -> bool:
+        return self.table.current[self.index] != 0
+
+    @property
+    def pressed(self) -> bool:
+        return self.table.pending[self.index] != 0
+
+    @property
+    def count(self) -> int:
+        return self.table.count[self.index]
+
+    @property
+    def limit(self) -> int:
+        return self.table.limit[self.index]
+
+    @property
+    def changed_at(self) -> int:
+        return self.table.changed_at[self.index]
@@ -0,0 +1,140 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import random
+
+
+class Direction:
+    INPUT = 0
+    OUTPUT = 1
+
+
+class Pull:
+    UP = 1
+    DOWN = 2
+
+
+class SimulatedMatrix:
+    """GPIOの行列配線をシミュレートする
+    出力ピンと入力ピンの交点にスイッチがあり、押されているスイッチを通して
+    出力ピンが駆動しているレベルが入力ピンに伝わる
+    このオブジェクトはdigitalioモジュールの代わりとして使える
+    """
+
+    Direction = Direction
+    Pull = Pull
+
+    def __init__(self, seed: int = 0):
+        """
+        :param seed: チャタリングに使う乱数のシード
+        """
+        self.pins = []
+        self.out_pins = []
+        self.in_pins = []
+        self.pressed = set()
+        self.bounce = {}
+        self.rng = random.Random(seed)
+        self.reads = 0
+
+    def DigitalInOut(self, pin):
+        dio = SimulatedDigitalInOut(self, pin)
+        self.pins.append(dio)
+        return dio
+
+    def wire(self, out_pins: list, in_pins: list):
+        """スキャナが使っている出力ピンと入力ピンを登録する
+        :param out_pins: 出力ピン（SimulatedDigitalInOut）のリスト
+        :param in_pins: 入力ピン（SimulatedDigitalInOut）のリスト
+        """
+        self.out_pins = list(out_pins)
+        self.in_pins = list(in_pins)
+
+    def set_pressed(self, pin, pressed: bool, bounce: int = 0):
+        """交点のスイッチの状態を変える
+        :param pin: (出力ピンの番号, 入力ピンの番号)
+        :param pressed: 押されていればTrue
+        :param bounce: この後の読み取りのうち、チャタリングでランダムな値になる回数
+        """
+        if pressed:
+            self.pressed.add(pin)
+        else:
+            self.pressed.discard(pin)
+        if bounce > 0:
+            self.bounce[pin] = bounce
+        elif pin in self.bounce:
+            del self.bounce[pin]
+
+    def level(self, dio) -> bool:
+        """入力ピンのレベル
+        :param dio: 入力ピン
+        :return: 読み取られる値
+        """
+        self.reads += 1
+        pulled = dio.pull != Pull.DOWN
+        if dio not in self.in_pins:
+            return pulled
+        in_index = self.in_pins.index(dio)
+        for out_index, out_pin in enumerate(self.out_pins):
+            if out_pin.direction != Direction.OUTPUT or out_pin.value == pulled:
+                continue
+            key = (out_index, in_index)
+            if key in self.bounce:
+                self.bounce[key] -= 1
+                if self.bounce[key] <= 0:
+                    del self.bounce[key]
+                if self.rng.random() < 0.5:
+                    return out_pin.value
+            elif key in self.pressed:
+                return out_pin.value
+        return pulled
+
+
+class SimulatedDigitalInOut:
+    """digitalio.DigitalInOut互換のピン
+    """
+
+    def __init__(self, matrix: SimulatedMatrix, pin):
+        self.matrix = matrix
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        self._value = False
+
+    def switch_to_output(self, value: bool = False):
+        self.direction = Direction.OUTPUT
+        self._value = value
+
+    def switch_to_input(self, pull=None):
+        self.direction = Direction.INPUT
+        self.pull = pull
+
+    @property
+    def value(self) -> bool:
+        if self.direction == Direction.OUTPUT:
+            return self._value
+        return self.matrix.level(self)
+
+    @value.setter
+    def value(self, value: bool):
+        self._value = value
+
+    def deinit(self):
+        pass
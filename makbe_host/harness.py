@@ -0,0 +1,266 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import sys
+from contextlib import redirect_stdout
+
+from makbe.clock import VirtualClock
+from makbe.expanders.pca9536 import PCA9536
+from makbe.expanders.peer_mcu import PeerMcu
+from makbe.expanders.tca9554 import TCA9554
+from makbe.expanders.tca9555 import TCA9555
+from makbe.sender import Sender
+from .gpio_sim import SimulatedMatrix
+from .i2c_sim import SimulatedI2C, SimulatedPCA9536, SimulatedPeerMcu, SimulatedTCA9554, SimulatedTCA9555
+
+
+# makbeのI/Oエクスパンダと、それに対応するシミュレータ
+EXPANDER_MODELS = (
+    (TCA9555, SimulatedTCA9555),
+    (TCA9554, SimulatedTCA9554),
+    (PCA9536, SimulatedPCA9536),
+)
+
+
+def simulated_expander(expander):
+    """
+    :param expander: makbeのI/Oエクスパンダ
+    :return: 同じアドレスのSimulatedExpander
+    """
+    if isinstance(expander, PeerMcu):
+        return SimulatedPeerMcu(expander.dev_address, expander.pins)
+    for cls, model in EXPANDER_MODELS:
+        if isinstance(expander, cls):
+            return model(expander.dev_address)
+    raise ValueError("no simulator for %s" % type(expander).__name__)
+
+
+class _NullWriter:
+
+    def write(self, s):
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+class RecordingKeyboard:
+    """adafruit_hid.keyboard.Keyboard互換で、送出されたキーコードを記録する
+    """
+
+    def __init__(self, devices=None, clock=None):
+        """
+        :param devices: usb_hid.devices（使わない）
+        :param clock: 記録する時刻を読み取る時計
+        """
+        self.clock = clock
+        self.events = []
+        self.pressed = set()
+
+    def _now(self) -> int:
+        return self.clock.now_ms if self.clock is not None else 0
+
+    def press(self, *key_codes):
+        for code in key_codes:
+            self.pressed.add(code)
+            self.events.append((self._now(), True, code))
+
+    def release(self, *key_codes):
+        for code in key_codes:
+            self.pressed.discard(code)
+            self.events.append((self._now(), False, code))
+
+    def release_all(self):
+        self.release(*sorted(self.pressed))
+
+    def clear(self):
+        self.events = []
+
+
+class RecordingBleSender(Sender):
+    """BleSenderの代わりに使う、RecordingKeyboardに送出するSender
+    """
+
+    def __init__(self, kbd, **kwargs):
+        super().__init__(kbd)
+
+    def start_advertising(self):
+        pass
+
+    def clear_bonds(self):
+        pass
+
+    def update(self):
+        pass
+
+
+class SimulatedKeyboard:
+    """keyboard_*.pyのキーボードクラスを、シミュレートしたハードウェアで動かす
+    I2C、digitalio、Keyboard、BleSenderをシミュレータに差し替えて生成し、スキャナの時計をVirtualClockにする
+    """
+
+    def __init__(self, keyboard_class, *args, noise: float = 0.0, seed: int = 0,
+                 quiet: bool = True, **kwargs):
+        """
+        :param keyboard_class: キーボードクラス（Nakaniwa、Column13ansiW等）
+        :param args: キーボードクラスに渡す引数
+        :param noise: 入力ビットごとに値が反転する確率
+        :param seed: ノイズやチャタリングに使う乱数のシード
+        :param quiet: Trueならキーボードのprint出力を捨てる
+        :param kwargs: キーボードクラスに渡すキーワード引数
+        """
+        self.clock = VirtualClock()
+        self.bus = SimulatedI2C(noise=noise, seed=seed)
+        self.gpio = SimulatedMatrix(seed=seed)
+        self.recorder = RecordingKeyboard(clock=self.clock)
+        self.quiet = quiet
+
+        module = sys.modules[keyboard_class.__module__]
+        bus = self.bus
+        recorder = self.recorder
+        patches = {
+            "I2C": lambda *a, **kw: bus,
+            "Keyboard": lambda *a, **kw: recorder,
+            "BleSender": lambda **kw: RecordingBleSender(recorder, **kw),
+        }
+        saved = []
+        for name, value in patches.items():
+            if hasattr(module, name):
+                saved.append((module, name, getattr(module, name)))
+                setattr(module, name, value)
+        matrix_module = sys.modules.get("makbe.matrix_scanner")
+        if matrix_module is not None:
+            saved.append((matrix_module, "digitalio", matrix_module.digitalio))
+            matrix_module.digitalio = self.gpio
+        # 生成中はエクスパンダの場所が分からないので、NACKを無視する
+        bus.ignore_nack = True
+        try:
+            with self._output():
+                self.keyboard = keyboard_class(*args, **kwargs)
+        finally:
+            bus.ignore_nack = False
+            for target, name, value in saved:
+                setattr(target, name, value)
+
+        self.scanner = self.keyboard.scanner
+        self.scanner.clock = self.clock
+        self.locations = {}
+        for expander in getattr(self.scanner, "expanders", []):
+            model = bus.attach(simulated_expander(expander))
+            expander.init_device(bus)
+            for pin, switch in enumerate(expander.switches):
+                self.locations.setdefault(id(switch), []).append((model, pin))
+        if hasattr(self.scanner, "matrix"):
+            self.gpio.wire(self.scanner.out_pins, self.scanner.in_pins)
+            for out_index, line in enumerate(self.scanner.matrix):
+                for in_index, switch in enumerate(line):
+                    self.locations.setdefault(id(switch), []).append((self.gpio, (out_index, in_index)))
+
+    def _output(self):
+        return redirect_stdout(_NullWriter()) if self.quiet else _NoRedirect()
+
+    def switch(self, name):
+        """
+        :param name: Switchesの属性名、またはKeySwitch
+        :return: KeySwitch
+        """
+        if isinstance(name, str):
+            return getattr(self.keyboard.sw, name)
+        return name
+
+    def _locate(self, name):
+        switch = self.switch(name)
+        locations = self.locations.get(id(switch))
+        if not locations:
+            raise KeyError("switch is not wired: %r" % (name,))
+        return locations[0]
+
+    def press(self, name, bounce: int = 0):
+        """
+        :param name: 押すスイッチ（Switchesの属性名、またはKeySwitch）
+        :param bounce: チャタリングさせる読み取り回数
+        """
+        model, pin = self._locate(name)
+        model.set_pressed(pin, True, bounce)
+
+    def release(self, name, bounce: int = 0):
+        """
+        :param name: 離すスイッチ（Switchesの属性名、またはKeySwitch）
+        :param bounce: チャタリングさせる読み取り回数
+        """
+        model, pin = self._locate(name)
+        model.set_pressed(pin, False, bounce)
+
+    def step(self, cycles: int = 1, ms: int = 1):
+        """時刻を進めながらスキャンサイクルを回す
+        :param cycles: サイクル数
+        :param ms: 1サイクルで進める時間（ms単位）
+        """
+        keyboard = self.keyboard
+        update = keyboard.update if hasattr(keyboard, "update") else self.scanner.update
+        clock = self.clock
+        with self._output():
+            for _ in range(cycles):
+                clock.advance_ms(ms)
+                update()
+
+    def tap(self, name, hold_ms: int = 30, after_ms: int = 30):
+        """
+        :param name: タップするスイッチ
+        :param hold_ms: 押している時間（ms単位）
+        :param after_ms: 離した後に待つ時間（ms単位）
+        """
+        self.press(name)
+        self.step(hold_ms)
+        self.release(name)
+        self.step(after_ms)
+
+    def run(self, script, tail_ms: int = 50):
+        """スクリプトに従ってスイッチを操作する
+        :param script: (時刻(ms), 押すならTrue/離すならFalse, スイッチ) のリスト
+        :param tail_ms: 最後の操作の後に回す時間（ms単位）
+        """
+        start = self.clock.now_ms
+        for at, pressed, name in sorted(script, key=lambda s: s[0]):
+            wait = start + at - self.clock.now_ms
+            if wait > 0:
+                self.step(wait)
+            if pressed:
+                self.press(name)
+            else:
+                self.release(name)
+        self.step(tail_ms)
+
+    @property
+    def output(self) -> list:
+        """
+        :return: 送出されたキーコードの (時刻(ms), 押したならTrue, キーコード) のリスト
+        """
+        return self.recorder.events
+
+
+class _NoRedirect:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
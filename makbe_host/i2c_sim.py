@@ -0,0 +1,334 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import errno
+import random
+
+from makbe.expanders.peer_mcu import (REG_STATE, REG_INFO, INFO_MAGIC, VERSION, MAX_PINS, DEFAULT_ADDRESS,
+                                        state_size, pack_state)
+
+
+class SimulatedExpander:
+    """レジスタレベルでシミュレートするI/Oエクスパンダの基底クラス
+    レジスタは 入力ポート、出力ポート、極性反転、コンフィグレーション の順に、ポート数ずつ並ぶ
+    ピンはプルアップされている前提で、押されているピンはLowになる
+    """
+
+    PIN_COUNT = 8
+    PORT_COUNT = 1
+
+    INPUT = 0
+    OUTPUT = 1
+    POLARITY = 2
+    CONFIG = 3
+
+    def __init__(self, address: int):
+        """
+        :param address: I2Cアドレス（7ビット）
+        """
+        self.address = address
+        self.registers = bytearray(4 * self.PORT_COUNT)
+        for port in range(self.PORT_COUNT):
+            self.registers[self.OUTPUT * self.PORT_COUNT + port] = 0xFF
+            self.registers[self.CONFIG * self.PORT_COUNT + port] = 0xFF
+        self.pointer = 0
+        self.pressed = 0
+        self.bounce = {}
+        self.reads = 0
+        self.writes = 0
+
+    def set_pressed(self, pin: int, pressed: bool, bounce: int = 0):
+        """ピンにつながったスイッチの状態を変える
+        :param pin: ピン番号（0オリジン）
+        :param pressed: 押されていればTrue
+        :param bounce: この後の読み取りのうち、チャタリングでランダムな値になる回数
+        """
+        if pressed:
+            self.pressed |= 1 << pin
+        else:
+            self.pressed &= ~(1 << pin)
+        if bounce > 0:
+            self.bounce[pin] = bounce
+        elif pin in self.bounce:
+            del self.bounce[pin]
+
+    def is_pressed(self, pin: int) -> bool:
+        return self.pressed & (1 << pin) != 0
+
+    def write(self, data):
+        """マスタからの書き込み
+        先頭バイトがコマンド（レジスタ番号）で、続くバイトがレジスタに書き込まれる
+        :param data: 書き込まれたバイト列
+        """
+        self.writes += 1
+        if len(data) == 0:
+            return
+        if data[0] >= len(self.registers):
+            raise OSError(errno.EIO, "invalid register")
+        self.pointer = data[0]
+        for b in data[1:]:
+            if self.pointer // self.PORT_COUNT != self.INPUT:
+                self.registers[self.pointer] = b
+            self._increment()
+
+    def read(self, count: int, rng=None, noise: float = 0.0) -> bytes:
+        """マスタからの読み出し
+        :param count: 読み出すバイト数
+        :param rng: ノイズやチャタリングに使う乱数
+        :param noise: 入力ビットごとに値が反転する確率
+        :return: 読み出したバイト列
+        """
+        self.reads += 1
+        result = bytearray(count)
+        for i in range(count):
+            kind = self.pointer // self.PORT_COUNT
+            port = self.pointer % self.PORT_COUNT
+            if kind == self.INPUT:
+                result[i] = self._input_port(port, rng, noise)
+            else:
+                result[i] = self.registers[self.pointer]
+            self._increment()
+        for pin in list(self.bounce.keys()):
+            self.bounce[pin] -= 1
+            if self.bounce[pin] <= 0:
+                del self.bounce[pin]
+        return bytes(result)
+
+    def _increment(self):
+        # 同じ種類のレジスタ（ポート0とポート1）の間で交互にインクリメントする
+        kind = self.pointer // self.PORT_COUNT
+        port = (self.pointer % self.PORT_COUNT + 1) % self.PORT_COUNT
+        self.pointer = kind * self.PORT_COUNT + port
+
+    def _input_port(self, port: int, rng, noise: float) -> int:
+        value = 0
+        for bit in range(8):
+            pin = port * 8 + bit
+            if pin >= self.PIN_COUNT:
+                # 存在しないピンは1として読める
+                value |= 1 << bit
+                continue
+            mask = 1 << bit
+            if self.registers[self.CONFIG * self.PORT_COUNT + port] & mask:
+                # 入力ピン（プルアップされているので、押されているとLow）
+                level = not self.is_pressed(pin)
+                if rng is not None:
+                    if pin in self.bounce:
+                        level = rng.random() < 0.5
+                    elif noise > 0.0 and rng.random() < noise:
+                        level = not level
+                if self.registers[self.POLARITY * self.PORT_COUNT + port] & mask:
+                    level = not level
+            else:
+                # 出力ピンは出力レジスタの値がそのまま読める
+                level = self.registers[self.OUTPUT * self.PORT_COUNT + port] & mask != 0
+            if level:
+                value |= mask
+        return value
+
+
+class SimulatedTCA9555(SimulatedExpander):
+    """TCA9555（16ピン、2ポート）
+    """
+
+    PIN_COUNT = 16
+    PORT_COUNT = 2
+
+
+class SimulatedTCA9554(SimulatedExpander):
+    """TCA9554（8ピン、1ポート）
+    """
+
+    PIN_COUNT = 8
+    PORT_COUNT = 1
+
+
+class SimulatedPCA9536(SimulatedExpander):
+    """PCA9536（4ピン、1ポート、上位4ビットは1として読める）
+    """
+
+    PIN_COUNT = 4
+    PORT_COUNT = 1
+
+    def __init__(self, address: int = 0x41):
+        super().__init__(address)
+
+
+class SimulatedPeerMcu:
+    """makbe.peer_targetのPeerTargetを動かしているマイコン
+    """
+
+    def __init__(self, address: int = DEFAULT_ADDRESS, pins: int = MAX_PINS):
+        """
+        :param address: I2Cアドレス（7ビット）
+        :param pins: キーの数
+        """
+        self.address = address
+        self.pins = pins
+        self.register = REG_STATE
+        self.pressed = 0
+        self.bounce = {}
+        self.reads = 0
+        self.writes = 0
+
+    def set_pressed(self, pin: int, pressed: bool, bounce: int = 0):
+        """
+        :param pin: キー番号（0オリジン）
+        :param pressed: 押されていればTrue
+        :param bounce: この後の読み取りのうち、チャタリングでランダムな値になる回数
+        """
+        if pressed:
+            self.pressed |= 1 << pin
+        else:
+            self.pressed &= ~(1 << pin)
+        if bounce > 0:
+            self.bounce[pin] = bounce
+        elif pin in self.bounce:
+            del self.bounce[pin]
+
+    def is_pressed(self, pin: int) -> bool:
+        return self.pressed & (1 << pin) != 0
+
+    def write(self, data):
+        self.writes += 1
+        if len(data) > 0:
+            self.register = data[0]
+
+    def read(self, count: int, rng=None, noise: float = 0.0) -> bytes:
+        self.reads += 1
+        if self.register == REG_INFO:
+            return bytes((INFO_MAGIC, VERSION, self.pins))[:count]
+        bits = self.pressed
+        if rng is not None:
+            for pin in self.bounce:
+                if rng.random() < 0.5:
+                    bits ^= 1 << pin
+        for pin in list(self.bounce.keys()):
+            self.bounce[pin] -= 1
+            if self.bounce[pin] <= 0:
+                del self.bounce[pin]
+        buffer = bytearray(state_size(self.pins))
+        pack_state(bits, buffer)
+        if rng is not None and noise > 0.0 and rng.random() < noise * 8 * len(buffer):
+            # 通信のノイズはCRCで検出される
+            buffer[rng.randrange(len(buffer))] ^= 1 << rng.randrange(8)
+        return bytes(buffer[:count])
+
+
+class _AbsentDevice:
+    """ignore_nackのときに、接続されていないアドレスの代わりに応答する
+    """
+
+    def write(self, data):
+        pass
+
+    def read(self, count: int, rng=None, noise: float = 0.0) -> bytes:
+        return bytes([0xFF] * count)
+
+
+_ABSENT = _AbsentDevice()
+
+
+class SimulatedI2C:
+    """busio.I2C互換のシミュレートされたI2Cバス
+    接続されていないアドレスへのアクセスは、実機と同じくOSError(ENODEV)になる
+    """
+
+    def __init__(self, devices=None, noise: float = 0.0, seed: int = 0):
+        """
+        :param devices: 接続するSimulatedExpanderのリスト
+        :param noise: 入力ビットごとに値が反転する確率
+        :param seed: ノイズやチャタリングに使う乱数のシード
+
+        ignore_nackをTrueにすると、接続されていないアドレスへのアクセスもエラーにしない
+        """
+        self.devices = {}
+        self.noise = noise
+        self.rng = random.Random(seed)
+        self.locked = False
+        self.ignore_nack = False
+        self.transactions = 0
+        self.nacks = 0
+        if devices is not None:
+            for d in devices:
+                self.attach(d)
+
+    def attach(self, device: SimulatedExpander) -> SimulatedExpander:
+        """
+        :param device: バスに接続するデバイス
+        :return: 接続したデバイス
+        """
+        self.devices[device.address] = device
+        return device
+
+    def detach(self, address: int):
+        """
+        :param address: バスから外すデバイスのアドレス
+        """
+        if address in self.devices:
+            del self.devices[address]
+
+    def device(self, address: int) -> SimulatedExpander:
+        self.transactions += 1
+        d = self.devices.get(address)
+        if d is None:
+            self.nacks += 1
+            if self.ignore_nack:
+                return _ABSENT
+            raise OSError(errno.ENODEV, "No such device")
+        return d
+
+    def try_lock(self) -> bool:
+        if self.locked:
+            return False
+        self.locked = True
+        return True
+
+    def unlock(self):
+        self.locked = False
+
+    def deinit(self):
+        self.devices = {}
+
+    def scan(self) -> list:
+        return sorted(self.devices.keys())
+
+    def writeto(self, address: int, buffer, *, start: int = 0, end: int = None):
+        if end is None:
+            end = len(buffer)
+        self.device(address).write(bytes(buffer[start:end]))
+
+    def readfrom_into(self, address: int, buffer, *, start: int = 0, end: int = None):
+        if end is None:
+            end = len(buffer)
+        data = self.device(address).read(end - start, self.rng, self.noise)
+        buffer[start:end] = data
+
+    def writeto_then_readfrom(self, address: int, out_buffer, in_buffer, *,
+                              out_start: int = 0, out_end: int = None,
+                              in_start: int = 0, in_end: int = None):
+        if out_end is None:
+            out_end = len(out_buffer)
+        if in_end is None:
+            in_end = len(in_buffer)
+        d = self.device(address)
+        d.write(bytes(out_buffer[out_start:out_end]))
+        in_buffer[in_start:in_end] = d.read(in_end - in_start, self.rng, self.noise)
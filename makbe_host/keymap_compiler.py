@@ -0,0 +1,311 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+  キーマップをmakbe.keymap_tableの表（バイト列）にコンパイルする
+
+  python -m makbe_host.keymap_compiler keymap.json -o keymap.bin
+  python -m makbe_host.keymap_compiler keyboard_nakaniwa -o keymap.bin
+  python -m makbe_host.keymap_compiler keyboard_nakaniwa --json keymap.json
+  python -m makbe_host.keymap_compiler keyboard_column13ansi_w_ble --check
+
+キーマップはスイッチ名からレイヤごとのアクションへの辞書で、JSONでは次のように書く
+
+  {
+    "switches": {
+      "esc":   ["ESCAPE", "GRAVE"],
+      "kb_a":  ["A"],
+      "space": [{"lt": [1, "SPACEBAR"]}],
+      "copy":  [{"mc": ["LEFT_CONTROL", "C"]}],
+      "l_fn":  [{"la": 1}],
+      "z":     [{"mt": ["LEFT_SHIFT", "Z"]}, "_"],
+      "kb_c":  ["C", {"cmd": ["bt", 1]}]
+    }
+  }
+
+アクションは、KeyCodeの名前（KB_は省略可）、キーコードの数値、"_"（trans）、"nop"、
+または {"kc": キー}、{"mc": [キー, ...]}、{"la": レイヤ}、{"lt": [レイヤ, キー]}、
+{"mt": [モディファイア, キー]}、{"ht": [hold, tap, timeout]}、{"cmd": [コマンド, 引数]} で書く
+{"cmd": ...} のコマンドは、makbe.keymap_table.SENDER_COMMANDSのもの（"bt"、"out"等）で、引数が無ければ {"cmd": "bt_clear"} でもよい
+Pythonの辞書なら、kc()等で作ったActionをそのまま使える
+"""
+import argparse
+import importlib
+import json
+import struct
+import sys
+
+from makbe.actions import (Action, HoldTapAction, LayerAction, MultipleKeyCodes, NoOpAction, SenderAction,
+                           SingleKeyCode, TransAction, NOP, TRANS, kc, la, ht, cmd, mc_tuple)
+from makbe.key_code import KeyCode
+from makbe.key_switch import KeySwitch, NopSwitch
+from makbe.keymap_table import (MAGIC, VERSION, OP_TRANS, OP_NOP, OP_KEY, OP_KEYS, OP_LAYER,
+                                OP_HOLD_TAP, OP_TIMEOUT, OP_SENDER, SENDER_COMMANDS, KeymapTable)
+
+
+def key_code(spec) -> int:
+    """
+    :param spec: キーコードの数値、またはKeyCodeの名前（KB_は省略可）
+    :return: キーコード
+    """
+    if isinstance(spec, int):
+        return spec
+    if isinstance(spec, SingleKeyCode):
+        return spec.key_code
+    for name in (spec, "KB_" + spec):
+        value = getattr(KeyCode, name, None)
+        if isinstance(value, int):
+            return value
+    raise ValueError("unknown key code: %r" % (spec,))
+
+
+def parse_action(spec) -> Action:
+    """
+    :param spec: アクションの記述（モジュールの説明を参照）
+    :return: アクション
+    """
+    if isinstance(spec, Action):
+        return spec
+    if spec == "_" or spec == "trans":
+        return TRANS
+    if spec == "nop":
+        return NOP
+    if isinstance(spec, (int, str)):
+        return kc(key_code(spec))
+    if isinstance(spec, dict) and len(spec) == 1:
+        (kind, args), = spec.items()
+        if kind == "kc":
+            return kc(key_code(args))
+        if kind == "mc":
+            return mc_tuple(tuple(key_code(a) for a in args))
+        if kind == "la":
+            return la(args)
+        if kind == "lt":
+            return ht(la(args[0]), parse_action(args[1]))
+        if kind == "mt":
+            return ht(kc(key_code(args[0])), parse_action(args[1]))
+        if kind == "ht":
+            return ht(parse_action(args[0]), parse_action(args[1]), *args[2:])
+        if kind == "cmd":
+            if isinstance(args, str):
+                return cmd(args)
+            return cmd(*args)
+    raise ValueError("unknown action: %r" % (spec,))
+
+
+def action_spec(action: Action):
+    """parse_action()の逆
+    :param action: アクション
+    :return: JSONにできるアクションの記述
+    """
+    if isinstance(action, TransAction):
+        return "_"
+    if isinstance(action, NoOpAction):
+        return "nop"
+    if isinstance(action, SingleKeyCode):
+        return _key_name(action.key_code)
+    if isinstance(action, MultipleKeyCodes):
+        return {"mc": [_key_name(c) for c in action.key_codes]}
+    if isinstance(action, LayerAction):
+        return {"la": action.layer}
+    if isinstance(action, HoldTapAction):
+        return {"ht": [action_spec(action.hold), action_spec(action.tap), action.timeout]}
+    if isinstance(action, SenderAction):
+        return {"cmd": [action.command, action.arg]}
+    raise ValueError("cannot describe action: %r" % (action,))
+
+
+_key_names = {}
+
+
+def _key_name(code: int):
+    if not _key_names:
+        for name, value in vars(KeyCode).items():
+            if isinstance(value, int) and not name.startswith("_"):
+                _key_names.setdefault(value, name[3:] if name.startswith("KB_") else name)
+    return _key_names.get(code, code)
+
+
+def keymap_from_switches(sw) -> dict:
+    """keyboard_*.pyのSwitchesオブジェクトからキーマップを作る
+    :param sw: Switchesオブジェクト
+    :return: {スイッチ名: [レイヤごとのアクション]}（属性の定義順）
+    """
+    switches = {}
+    for name, switch in vars(sw).items():
+        if isinstance(switch, KeySwitch) and not isinstance(switch, NopSwitch):
+            switches[name] = list(switch.actions)
+    return {"switches": switches}
+
+
+def keymap_from_grid(names: list, layers: list) -> dict:
+    """行列の形で書いたキーマップを、スイッチ名の辞書に直す
+    :param names: スイッチ名の行列（Noneの位置は無視する）
+    :param layers: レイヤごとの、namesと同じ形のアクションの行列
+    :return: {"switches": {スイッチ名: [レイヤごとのアクション]}}
+    """
+    switches = {}
+    for r, row in enumerate(names):
+        for c, name in enumerate(row):
+            if name is not None:
+                switches[name] = [layer[r][c] for layer in layers]
+    return {"switches": switches}
+
+
+class _Encoder:
+
+    def __init__(self):
+        self.extra = []
+        self.extra_index = {}
+        self.keys = bytearray()
+        self.keys_index = {}
+
+    def cell(self, action: Action) -> bytes:
+        if isinstance(action, TransAction):
+            return struct.pack("<BBH", OP_TRANS, 0, 0)
+        if isinstance(action, NoOpAction):
+            return struct.pack("<BBH", OP_NOP, 0, 0)
+        if isinstance(action, SingleKeyCode):
+            return struct.pack("<BBH", OP_KEY, 0, action.key_code)
+        if isinstance(action, MultipleKeyCodes):
+            codes = bytes(action.key_codes)
+            at = self.keys_index.get(codes)
+            if at is None:
+                at = len(self.keys)
+                self.keys.extend(codes)
+                self.keys_index[codes] = at
+            return struct.pack("<BBH", OP_KEYS, len(codes), at)
+        if isinstance(action, LayerAction):
+            return struct.pack("<BBH", OP_LAYER, 0, action.layer)
+        if isinstance(action, HoldTapAction):
+            cells = (self.cell(action.hold), self.cell(action.tap),
+                     struct.pack("<BBH", OP_TIMEOUT, 0, action.timeout))
+            at = self.extra_index.get(cells)
+            if at is None:
+                at = len(self.extra)
+                self.extra.extend(cells)
+                self.extra_index[cells] = at
+            return struct.pack("<BBH", OP_HOLD_TAP, 0, at)
+        if isinstance(action, SenderAction):
+            if action.command not in SENDER_COMMANDS:
+                raise ValueError("cannot compile sender command: %r" % (action.command,))
+            return struct.pack("<BBH", OP_SENDER, SENDER_COMMANDS.index(action.command), action.arg)
+        raise ValueError("cannot compile action: %r" % (action,))
+
+
+def compile_keymap(keymap: dict) -> bytes:
+    """
+    :param keymap: {"switches": {スイッチ名: [レイヤごとのアクション]}}
+    :return: makbe.keymap_table.KeymapTableで読めるバイト列
+    """
+    switches = keymap["switches"]
+    rows = [[parse_action(spec) for spec in actions] for actions in switches.values()]
+    layers = keymap.get("layers", max([len(row) for row in rows] + [1]))
+    if layers > 255 or len(rows) > 0xFFFF:
+        raise ValueError("keymap too large")
+
+    encoder = _Encoder()
+    cells = bytearray()
+    for row in rows:
+        if len(row) > layers:
+            raise ValueError("switch has more than %d layers" % layers)
+        for layer in range(layers):
+            cells += encoder.cell(row[layer] if layer < len(row) else TRANS)
+    names = "\n".join(switches.keys()).encode("ascii")
+
+    header = MAGIC + struct.pack("<BBHHHH", VERSION, layers, len(rows), len(encoder.extra),
+                                 len(encoder.keys), len(names))
+    return header + bytes(cells) + b"".join(encoder.extra) + bytes(encoder.keys) + names
+
+
+def compile_switches(sw) -> bytes:
+    """
+    :param sw: keyboard_*.pyのSwitchesオブジェクト
+    :return: キーマップ表
+    """
+    return compile_keymap(keymap_from_switches(sw))
+
+
+def load_keymap(source: str) -> dict:
+    """
+    :param source: JSONファイル、またはSwitchesクラスを持つkeyboard_*モジュールの名前
+    :return: キーマップ
+    """
+    if source.endswith(".json"):
+        with open(source) as f:
+            return json.load(f)
+    module = importlib.import_module(source[:-3] if source.endswith(".py") else source)
+    return keymap_from_switches(module.Switches())
+
+
+def check_round_trip(keymap: dict, blob: bytes) -> list:
+    """コンパイルした表とJSONの記述を読み直して、元のキーマップと同じアクションになるかを調べる
+    :param keymap: 元のキーマップ
+    :param blob: compile_keymap()で作った表
+    :return: 食い違いの説明のリスト（空なら一致）
+    """
+    table = KeymapTable(blob)
+    errors = []
+    if table.names() != list(keymap["switches"].keys()):
+        errors.append("switch names differ")
+    for index, (name, actions) in enumerate(keymap["switches"].items()):
+        for layer in range(table.layers):
+            expected = action_spec(parse_action(actions[layer]) if layer < len(actions) else TRANS)
+            decoded = action_spec(table.action(index, layer))
+            if decoded != expected:
+                errors.append("%s layer %d: table has %r, expected %r" % (name, layer, decoded, expected))
+            reparsed = action_spec(parse_action(json.loads(json.dumps(expected))))
+            if reparsed != expected:
+                errors.append("%s layer %d: JSON gives %r, expected %r" % (name, layer, reparsed, expected))
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="compile a keymap into a makbe keymap table")
+    parser.add_argument("source", help="keymap JSON file or keyboard module name")
+    parser.add_argument("-o", "--output", help="write the table to this file")
+    parser.add_argument("--json", help="write the keymap as JSON to this file")
+    parser.add_argument("--check", action="store_true", help="check that the table and JSON read back the same")
+    args = parser.parse_args(argv)
+
+    keymap = load_keymap(args.source)
+    blob = compile_keymap(keymap)
+    print("%d switches, %d bytes" % (len(keymap["switches"]), len(blob)))
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(blob)
+    if args.json:
+        described = {name: [action_spec(parse_action(a)) for a in actions]
+                     for name, actions in keymap["switches"].items()}
+        with open(args.json, "w") as f:
+            json.dump({"switches": described}, f, indent=2)
+    if args.check:
+        errors = check_round_trip(keymap, blob)
+        for error in errors:
+            print(error)
+        if errors:
+            return 1
+        print("round trip ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+  Linux上でmakbeのプロセッサを動かす（ユーザランドのキー配列変換ソフトとして使う）
+
+  python -m makbe_host.linux keyboard_nakaniwa /dev/input/event3 --grab
+  python -m makbe_host.linux keymap.json /dev/input/event3 --grab
+  python -m makbe_host.linux keyboard_nakaniwa recorded_events.bin --record out.txt
+
+EvdevScannerはevdevのデバイス（またはinput_eventを並べたファイルやパイプ）からキーイベントを読み、
+UinputSenderはuinputで作った仮想キーボード（またはRecordingOutput）にキーを出す
+キーボード定義のSwitchesは変更せずに使える。evdevのキーコードは、各スイッチのレイヤ0のキーコードで対応づけ、
+キーコードの無いスイッチ（レイヤキー等）や、他のスイッチとキーコードが重なったスイッチには空いているキーを割り当てる
+--map R_ALT=r_spaceのように、evdevのキーとスイッチの対応を指定することもできる
+"""
+import argparse
+import importlib
+import os
+import selectors
+import struct
+import sys
+
+from makbe.actions import Action, HoldTapAction, LayerAction, MultipleKeyCodes, SingleKeyCode
+from makbe.event_queue import EventQueue
+from makbe.key_code import KeyCode
+from makbe.key_event import KeyPressed, KeyReleased
+from makbe.key_switch import KeySwitch, NopSwitch
+from makbe.latency import STAGE_SEND
+from makbe.layered_processor import LayeredProcessor
+from makbe.scanner import Scanner
+from makbe.sender import Sender
+
+
+# linux/input.hのstruct input_event（struct timeval、type、code、value）
+EVENT_FORMAT = "llHHi"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+EV_SYN = 0x00
+EV_KEY = 0x01
+SYN_REPORT = 0
+BUS_USB = 0x03
+
+# linux/input.hとlinux/uinput.hのioctl
+EVIOCGRAB = 0x40044590
+UI_SET_EVBIT = 0x40045564
+UI_SET_KEYBIT = 0x40045565
+UI_DEV_CREATE = 0x5501
+UI_DEV_DESTROY = 0x5502
+
+# HIDのキーコード（Keyboard/Keypadページ、makbeのKeyCode）からevdevのキーコードへの表
+# Linuxのdrivers/hid/hid-input.cのhid_keyboard[]と同じ（0は対応するキーが無い）
+HID_TO_EVDEV = bytes((
+    0, 0, 0, 0, 30, 48, 46, 32, 18, 33, 34, 35, 23, 36, 37, 38,
+    50, 49, 24, 25, 16, 19, 31, 20, 22, 47, 17, 45, 21, 44, 2, 3,
+    4, 5, 6, 7, 8, 9, 10, 11, 28, 1, 14, 15, 57, 12, 13, 26,
+    27, 43, 43, 39, 40, 41, 51, 52, 53, 58, 59, 60, 61, 62, 63, 64,
+    65, 66, 67, 68, 87, 88, 99, 70, 119, 110, 102, 104, 111, 107, 109, 106,
+    105, 108, 103, 69, 98, 55, 74, 78, 96, 79, 80, 81, 75, 76, 77, 71,
+    72, 73, 82, 83, 86, 127, 116, 117, 183, 184, 185, 186, 187, 188, 189, 190,
+    191, 192, 193, 194, 134, 138, 130, 132, 128, 129, 131, 137, 133, 135, 136, 113,
+    115, 114, 0, 0, 0, 121, 0, 89, 93, 124, 92, 94, 95, 0, 0, 0,
+    122, 123, 90, 91, 85, 0, 0, 0, 0, 0, 0, 0, 111, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 179, 180, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 111, 0, 0, 0, 0, 0, 0, 0,
+    29, 42, 56, 125, 97, 54, 100, 126, 164, 166, 165, 163, 161, 115, 114, 113,
+    150, 158, 159, 128, 136, 177, 178, 176, 142, 152, 173, 140, 0, 0, 0, 0,
+))
+
+# evdevのキーコードからHIDのキーコードへの表（重複しているものは小さいHIDのキーコードを使う）
+EVDEV_TO_HID = {}
+for _hid, _evdev in enumerate(HID_TO_EVDEV):
+    if _evdev:
+        EVDEV_TO_HID.setdefault(_evdev, _hid)
+
+
+# 割り当てられなかったスイッチに、順に割り当てるキー（HIDのキーコード、keymapで使われていないものだけ使う）
+SPARE_KEYS = (KeyCode.R_ALT, KeyCode.APPLICATION, KeyCode.R_CTRL, KeyCode.R_GUI, KeyCode.CAPS_LOCK,
+              KeyCode.INSERT, KeyCode.PAUSE, KeyCode.SCROLL_LOCK, KeyCode.PRINT_SCREEN)
+
+
+def evdev_code(spec) -> int:
+    """
+    :param spec: evdevのキーコードの数値（文字列でもよい）、またはKeyCodeの名前（KB_は省略可）
+    :return: evdevのキーコード
+    """
+    if isinstance(spec, int):
+        return spec
+    if spec.isdigit():
+        return int(spec)
+    from .keymap_compiler import key_code
+    code = key_code(spec)
+    if code >= len(HID_TO_EVDEV) or HID_TO_EVDEV[code] == 0:
+        raise ValueError("no evdev key for %s" % spec)
+    return HID_TO_EVDEV[code]
+
+
+def base_key_code(action: Action):
+    """
+    :param action: アクション
+    :return: アクションが表すキーのHIDキーコード（HoldTapはtap、複数キーは最後のキー）、無ければNone
+    """
+    if isinstance(action, SingleKeyCode):
+        return action.key_code
+    if isinstance(action, MultipleKeyCodes):
+        return action.key_codes[-1] if action.key_codes else None
+    if isinstance(action, HoldTapAction):
+        return base_key_code(action.tap)
+    return None
+
+
+def switches_by_evdev(sw, overrides: dict = None, spare: tuple = SPARE_KEYS, out=sys.stderr) -> dict:
+    """keyboard_*.pyのSwitchesから、evdevのキーコードとスイッチの対応を作る
+    1. overridesで指定した対応
+    2. 各スイッチのレイヤ0のキーコード（HoldTapならtap）に相当するevdevのキー（同じキーなら最初のスイッチ）
+    3. 残ったスイッチには、spareのうち使われていないキーを、レイヤキーとHoldTapを優先して順に割り当てる
+    spareで割り当てたスイッチと、それでも割り当てられなかったスイッチはoutに表示する
+    :param sw: SwitchesオブジェクトまたはKeymapTable.namespace()の結果
+    :param overrides: {evdevのキーコード（evdev_code()で読める形式）: スイッチ名}
+    :param spare: 残ったスイッチに割り当てるキー（HIDのキーコード）
+    :param out: 表示先（Noneなら表示しない）
+    :return: {evdevのキーコード: KeySwitch}
+    """
+    switches = [(name, switch) for name, switch in vars(sw).items()
+                if isinstance(switch, KeySwitch) and not isinstance(switch, NopSwitch)]
+    mapping = {}
+    mapped = set()
+    for code, name in (overrides or {}).items():
+        switch = getattr(sw, name, None)
+        if not isinstance(switch, KeySwitch):
+            raise ValueError("no such switch: %s" % name)
+        mapping[evdev_code(code)] = switch
+        mapped.add(id(switch))
+
+    rest = []
+    for name, switch in switches:
+        if id(switch) in mapped:
+            continue
+        code = base_key_code(switch.action(0))
+        if code is not None and code < len(HID_TO_EVDEV) and HID_TO_EVDEV[code] != 0 \
+                and HID_TO_EVDEV[code] not in mapping:
+            mapping[HID_TO_EVDEV[code]] = switch
+            mapped.add(id(switch))
+        else:
+            rest.append((name, switch))
+
+    # レイヤを切り替えられないと困るので、レイヤキーとHoldTapに先に空いているキーを割り当てる
+    rest.sort(key=lambda item: 0 if isinstance(item[1].action(0), (LayerAction, HoldTapAction)) else 1)
+    free = [HID_TO_EVDEV[code] for code in spare if HID_TO_EVDEV[code] not in mapping]
+    for name, switch in rest:
+        if id(switch) in mapped:
+            # 同じスイッチが別の名前でも登録されている
+            continue
+        if free:
+            code = free.pop(0)
+            mapping[code] = switch
+            mapped.add(id(switch))
+            if out is not None:
+                print("%s -> evdev key %d (%s)" % (name, code, _hid_name(EVDEV_TO_HID.get(code))), file=out)
+        elif out is not None:
+            print("Warning: switch %s is not reachable (use --map to assign a key)" % name, file=out)
+    return mapping
+
+
+def _hid_name(code) -> str:
+    for name, value in vars(KeyCode).items():
+        if value == code and not name.startswith("_"):
+            return name
+    return "?"
+
+
+def load_switches(source: str):
+    """
+    :param source: keyboard_*モジュールの名前、キーマップのJSON、またはキーマップ表のファイル
+    :return: スイッチ名を属性に持つオブジェクト
+    """
+    from makbe.keymap_table import KeymapTable
+    if source.endswith(".bin"):
+        return KeymapTable.load(source).namespace()
+    if source.endswith(".json"):
+        from .keymap_compiler import compile_keymap, load_keymap
+        return KeymapTable(compile_keymap(load_keymap(source))).namespace()
+    module = importlib.import_module(source[:-3] if source.endswith(".py") else source)
+    return module.Switches()
+
+
+class EvdevScanner(Scanner):
+    """evdevのデバイスからキーイベントを読むスキャナ
+    evdevのイベントはデバウンス済みなので、そのままKeyPressed/KeyReleasedにする
+    入力はselectorsで待つので、run()はイベントが無い間CPUを使わない
+    """
+
+    def __init__(self, source, switches: dict, processor, clock=None, grab: bool = False,
+                 direct: bool = False, tick_ms: int = 10):
+        """
+        :param source: デバイスやファイルのパス、またはファイルディスクリプタを持つオブジェクト
+        :param switches: {evdevのキーコード: KeySwitch}
+        :param processor: キーイベントを処理するオブジェクト
+        :param clock: 時計（省略時はMonotonicClock）
+        :param grab: Trueならデバイスを占有して、元のキー入力を他のプログラムに渡さない
+        :param direct: Trueならキューを通さず、スキャン中に確定したイベントを直接プロセッサに渡す
+        :param tick_ms: 入力が無いときにプロセッサのtick()を呼ぶ間隔（HoldTapの判定のため、ms単位）
+        """
+        super().__init__(EventQueue(), processor, clock, direct)
+        if isinstance(source, (str, bytes)):
+            self.fd = os.open(source, os.O_RDONLY | os.O_NONBLOCK)
+            self.owns_fd = True
+        else:
+            self.fd = source if isinstance(source, int) else source.fileno()
+            self.owns_fd = False
+        if grab:
+            import fcntl
+            fcntl.ioctl(self.fd, EVIOCGRAB, 1)
+        self.switches_by_code = switches
+        self.tick_ms = tick_ms
+        self.pending = b""
+        self.closed = False
+        self.unknown = 0
+        self.selector = selectors.DefaultSelector()
+        try:
+            self.selector.register(self.fd, selectors.EVENT_READ)
+        except PermissionError:
+            # 通常のファイルはepollで待てないが、いつでも読める
+            self.selector = None
+
+    def switches(self) -> list:
+        result = []
+        for switch in self.switches_by_code.values():
+            if switch not in result:
+                result.append(switch)
+        return result
+
+    def poll(self, now: int):
+        """
+        読めるだけのinput_eventを読んで、キーの押下と解放をsinkに渡す
+        :param now: 現在時刻（ms単位）
+        """
+        if self.closed:
+            return
+        enqueue = self.sink.enqueue
+        while self.selector is None or self.selector.select(0):
+            try:
+                data = os.read(self.fd, EVENT_SIZE * 64)
+            except BlockingIOError:
+                return
+            if not data:
+                # ファイルやパイプの終わり
+                self.close()
+                return
+            data = self.pending + data
+            end = len(data) - len(data) % EVENT_SIZE
+            self.pending = data[end:]
+            for _sec, _usec, kind, code, value in struct.iter_unpack(EVENT_FORMAT, data[:end]):
+                # value: 0は解放、1は押下、2はオートリピート（makbeでは使わない）
+                if kind != EV_KEY or value == 2:
+                    continue
+                switch = self.switches_by_code.get(code)
+                if switch is None:
+                    self.unknown += 1
+                    continue
+                enqueue(KeyPressed(switch) if value else KeyReleased(switch), now)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        入力が来るかtimeoutが過ぎるまで待つ
+        :param timeout: 最大の待ち時間（秒単位）
+        :return: 入力があればTrue
+        """
+        if self.closed:
+            return False
+        if self.selector is None:
+            return True
+        return bool(self.selector.select(timeout))
+
+    def run(self, until_closed: bool = True):
+        """入力を待ちながら、スキャンとイベント処理を繰り返す
+        入力が無くてもtick_msごとにupdate()を呼ぶので、HoldTapのholdは時間で確定する
+        :param until_closed: Trueなら入力が終わったら（ファイルの終わり等）戻る
+        """
+        sender = getattr(self.processor, "sender", None)
+        sender_update = getattr(sender, "update", None)
+        while not (until_closed and self.closed):
+            self.wait(self.tick_ms / 1000)
+            self.update()
+            if sender_update is not None:
+                sender_update()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.selector is not None:
+            self.selector.unregister(self.fd)
+        if self.owns_fd:
+            os.close(self.fd)
+
+
+class RecordingOutput:
+    """UinputSenderの出力先の代わりに使う、送ったキーを記録するクラス
+    """
+
+    def __init__(self, file=None):
+        """
+        :param file: 記録を1行ずつ書き出すテキストファイル（省略時はメモリに残すだけ）
+        """
+        self.file = file
+        self.events = []
+
+    def emit(self, code: int, value: int):
+        self.events.append((code, value))
+        if self.file is not None:
+            self.file.write("%d %d\n" % (code, value))
+
+    def syn(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        pass
+
+
+class UinputDevice:
+    """/dev/uinputで作る仮想キーボード
+    """
+
+    def __init__(self, name: str = "makbe", path: str = "/dev/uinput"):
+        """
+        :param name: デバイス名
+        :param path: uinputのデバイスファイル
+        """
+        import fcntl
+        self.fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_KEY)
+        for code in sorted(set(HID_TO_EVDEV)):
+            if code:
+                fcntl.ioctl(self.fd, UI_SET_KEYBIT, code)
+        # struct uinput_user_dev（名前、input_id、ff_effects_max、absmax/absmin/absfuzz/absflat）
+        user_dev = struct.pack("80sHHHHi", name.encode()[:79], BUS_USB, 0x1209, 0x0001, 1, 0) + bytes(4 * 64 * 4)
+        os.write(self.fd, user_dev)
+        fcntl.ioctl(self.fd, UI_DEV_CREATE)
+
+    def emit(self, code: int, value: int):
+        os.write(self.fd, struct.pack(EVENT_FORMAT, 0, 0, EV_KEY, code, value))
+
+    def syn(self):
+        os.write(self.fd, struct.pack(EVENT_FORMAT, 0, 0, EV_SYN, SYN_REPORT, 0))
+
+    def close(self):
+        import fcntl
+        fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+        os.close(self.fd)
+
+
+class UinputSender(Sender):
+    """makbeのキーコード（HID）をevdevのキーコードにして、uinputの仮想キーボードに出すSender
+    """
+
+    def __init__(self, output=None):
+        """
+        :param output: emit(code, value)とsyn()を持つ出力先（省略時はUinputDevice）
+        """
+        super().__init__(None)
+        self.output = output if output is not None else UinputDevice()
+        self.unmapped = 0
+
+    def _emit(self, key_code: int, value: int):
+        code = HID_TO_EVDEV[key_code] if 0 <= key_code < len(HID_TO_EVDEV) else 0
+        if code == 0:
+            self.unmapped += 1
+            return
+        self.output.emit(code, value)
+        self.output.syn()
+
+    def press(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
+        self._emit(key_code, 1)
+
+    def release(self, key_code: int):
+        if self.monitor is not None:
+            self.monitor.mark(STAGE_SEND)
+        self._emit(key_code, 0)
+
+    def close(self):
+        self.output.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run makbe's LayeredProcessor on a Linux evdev keyboard")
+    parser.add_argument("keymap", help="keyboard module name, keymap JSON file or keymap table (.bin)")
+    parser.add_argument("device", help="evdev device (/dev/input/eventN), or a file or pipe of input_event records")
+    parser.add_argument("--grab", action="store_true", help="grab the device so that its own keys are not delivered")
+    parser.add_argument("--record", help="write output key events to this file instead of uinput ('-' for stdout)")
+    parser.add_argument("--debug", action="store_true", help="print LayeredProcessor debug output")
+    parser.add_argument("--map", action="append", default=[], metavar="KEY=SWITCH",
+                        help="assign an evdev key (KeyCode name or evdev code) to a switch, e.g. R_ALT=r_space")
+    args = parser.parse_args(argv)
+
+    sw = load_switches(args.keymap)
+    overrides = {}
+    for item in args.map:
+        key, _, name = item.partition("=")
+        overrides[key] = name
+    mapping = switches_by_evdev(sw, overrides)
+    if args.record == "-":
+        output = RecordingOutput(sys.stdout)
+    elif args.record:
+        output = RecordingOutput(open(args.record, "w"))
+    else:
+        output = None
+    sender = UinputSender(output)
+    scanner = EvdevScanner(args.device, mapping, LayeredProcessor(sender, debug=args.debug), grab=args.grab)
+    print("%d keys mapped" % len(mapping), file=sys.stderr)
+    try:
+        scanner.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scanner.close()
+        sender.close()
+    if sender.unmapped or scanner.unknown:
+        print("%d unmapped output keys, %d unknown input keys" % (sender.unmapped, scanner.unknown), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
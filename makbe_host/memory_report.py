@@ -0,0 +1,176 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+  キーボードが保持しているmakbeのオブジェクトを、クラスごとに数えてバイト数を報告する
+
+  python -m makbe_host.memory_report [keyboard_nakaniwa ...]
+"""
+import sys
+import tracemalloc
+
+from benchmarks.run import build, find_keyboards
+
+
+def _slots(cls) -> tuple:
+    names = []
+    for c in cls.__mro__:
+        names.extend(c.__dict__.get("__slots__", ()))
+    return tuple(names)
+
+
+def _fields(obj):
+    if hasattr(obj, "__dict__"):
+        for value in vars(obj).values():
+            yield value
+    for name in _slots(type(obj)):
+        if hasattr(obj, name):
+            yield getattr(obj, name)
+
+
+def walk(root, prefix: str = "makbe") -> dict:
+    """rootから辿れるmakbeのオブジェクトを集める
+    辿るのはrootと同じモジュールのクラス（SwitchesやKeyboard）と、makbeのクラスだけ
+    :param root: 起点のオブジェクト
+    :param prefix: 集めるクラスのモジュール名の接頭辞
+    :return: {id: オブジェクト}
+    """
+    home = type(root).__module__
+    found = {}
+    seen = set()
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.values())
+            continue
+        if isinstance(obj, type):
+            continue
+        module = getattr(type(obj), "__module__", "")
+        if module == prefix or module.startswith(prefix + "."):
+            found[id(obj)] = obj
+        elif module != home:
+            continue
+        stack.extend(_fields(obj))
+    return found
+
+
+def instance_size(obj) -> int:
+    """
+    :return: インスタンス本体と、あれば__dict__のバイト数
+    """
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+_plain_sizes = {}
+
+
+def _plain_size(cls, names: tuple) -> int:
+    """__slots__の代わりに__dict__を使うクラスの1インスタンスあたりの確保量を、tracemallocで計る
+    """
+    size = _plain_sizes.get(cls)
+    if size is not None:
+        return size
+
+    def init(self):
+        for name in names:
+            setattr(self, name, None)
+
+    plain = type("Plain" + cls.__name__, (), {"__init__": init})
+    plain()
+    count = 100
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        instances = [plain() for _ in range(count)]
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+    size = (after - before - sys.getsizeof(instances)) // count
+    _plain_sizes[cls] = size
+    return size
+
+
+def dict_layout_size(obj) -> int:
+    """__slots__を使わずに同じ属性を__dict__に持った場合のバイト数
+    """
+    cls = type(obj)
+    names = _slots(cls)
+    if hasattr(obj, "__dict__") and not names:
+        return instance_size(obj)
+    return _plain_size(cls, names)
+
+
+def report(root) -> list:
+    """
+    :return: (クラス名, インスタンス数, バイト数, __dict__を使った場合のバイト数) のリスト
+    """
+    rows = {}
+    for obj in walk(root).values():
+        name = type(obj).__name__
+        count, size, plain = rows.get(name, (0, 0, 0))
+        rows[name] = (count + 1, size + instance_size(obj), plain + dict_layout_size(obj))
+    return sorted(((k,) + v for k, v in rows.items()), key=lambda r: -r[2])
+
+
+def print_report(name: str, rows: list):
+    print(name)
+    print("  %-20s %8s %10s %10s" % ("class", "count", "bytes", "dict"))
+    total = [0, 0, 0]
+    for cls, count, size, plain in rows:
+        print("  %-20s %8d %10d %10d" % (cls, count, size, plain))
+        total[0] += count
+        total[1] += size
+        total[2] += plain
+    print("  %-20s %8d %10d %10d" % ("total", total[0], total[1], total[2]))
+
+
+def main(argv=None) -> int:
+    only = (argv if argv is not None else sys.argv[1:]) or None
+    for name, cls in find_keyboards():
+        if only and name not in only:
+            continue
+        if isinstance(cls, Exception):
+            print("%s\n  error: %s" % (name, cls))
+            continue
+        try:
+            sim = build(cls)
+        except Exception as e:
+            print("%s\n  error: %s: %s" % (name, type(e).__name__, e))
+            continue
+        print_report(name, report(sim.keyboard))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
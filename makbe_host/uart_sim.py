@@ -0,0 +1,87 @@
+# MIT License
+#
+# Copyright (c) 2021 Kazuyuki HIDA
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import random
+
+
+class SimulatedUart:
+    """busio.UART互換の、ホスト上のテスト用UART
+    write()したバイト列は、つないだ相手（peer）のreadinto()で読める
+    ノイズを指定すると、送ったバイトのビットが反転したり、バイトが失われたりする
+    """
+
+    def __init__(self, noise: float = 0.0, drop: float = 0.0, seed: int = 0):
+        """
+        :param noise: 送るバイトごとに、1ビットが反転する確率
+        :param drop: 送るバイトごとに、失われる確率
+        :param seed: ノイズに使う乱数のシード
+        """
+        self.peer = self
+        self.buffer = bytearray()
+        self.noise = noise
+        self.drop = drop
+        self.random = random.Random(seed)
+        self.written = 0
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.buffer)
+
+    def write(self, buf) -> int:
+        rx = self.peer.buffer
+        for byte in bytes(buf):
+            if self.drop and self.random.random() < self.drop:
+                continue
+            if self.noise and self.random.random() < self.noise:
+                byte ^= 1 << self.random.randrange(8)
+            rx.append(byte)
+        self.written += len(buf)
+        return len(buf)
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self.buffer))
+        if n == 0:
+            return None
+        buf[0:n] = self.buffer[0:n]
+        del self.buffer[0:n]
+        return n
+
+    def read(self, nbytes=None):
+        n = len(self.buffer) if nbytes is None else min(nbytes, len(self.buffer))
+        if n == 0:
+            return None
+        data = bytes(self.buffer[0:n])
+        del self.buffer[0:n]
+        return data
+
+
+def uart_pair(noise: float = 0.0, drop: float = 0.0, seed: int = 0):
+    """
+    :param noise: 送るバイトごとに、1ビットが反転する確率
+    :param drop: 送るバイトごとに、失われる確率
+    :param seed: ノイズに使う乱数のシード
+    :return: 互いにつながった2つのSimulatedUart（副側、主側）
+    """
+    a = SimulatedUart(noise, drop, seed)
+    b = SimulatedUart(noise, drop, seed + 1)
+    a.peer = b
+    b.peer = a
+    return a, b
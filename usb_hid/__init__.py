@@ -24,4 +24,55 @@
   dummies
 """
 
-devices = 0
+
+class Device:
+    """usb_hid.Deviceのダミー
+    send_report()で送られたレポートをreportsに記録する
+    """
+
+    KEYBOARD = None
+    MOUSE = None
+    CONSUMER_CONTROL = None
+
+    def __init__(self, *, report_descriptor=b"", usage_page=0, usage=0, report_ids=(0,),
+                 in_report_lengths=(0,), out_report_lengths=(0,)):
+        self.report_descriptor = bytes(report_descriptor)
+        self.usage_page = usage_page
+        self.usage = usage
+        self.report_ids = tuple(report_ids)
+        self.in_report_lengths = tuple(in_report_lengths)
+        self.out_report_lengths = tuple(out_report_lengths)
+        self.reports = []
+
+    def send_report(self, report, report_id=None):
+        self.reports.append(bytes(report))
+
+    def get_last_received_report(self, report_id=None):
+        return None
+
+
+Device.KEYBOARD = Device(usage_page=0x01, usage=0x06, report_ids=(1,), in_report_lengths=(8,),
+                         out_report_lengths=(1,))
+Device.MOUSE = Device(usage_page=0x01, usage=0x02, report_ids=(2,), in_report_lengths=(4,),
+                      out_report_lengths=(0,))
+Device.CONSUMER_CONTROL = Device(usage_page=0x0C, usage=0x01, report_ids=(3,), in_report_lengths=(2,),
+                                 out_report_lengths=(0,))
+
+devices = [Device.KEYBOARD, Device.MOUSE, Device.CONSUMER_CONTROL]
+
+# ホストが要求したブートプロトコル（0: なし、1: キーボード、2: マウス）
+boot_device = 0
+
+
+def enable(requested_devices, boot_device: int = 0):
+    global devices
+    devices = list(requested_devices)
+
+
+def disable():
+    global devices
+    devices = []
+
+
+def get_boot_device() -> int:
+    return boot_device